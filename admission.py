@@ -0,0 +1,300 @@
+# admission.py
+"""
+Допуск обработки архивов по ресурсам (диск и память).
+
+Перед распаковкой архив резервирует место на диске и память, оценённые по
+размерам файлов из его оглавления (estimate). Обработка начинается, только
+если резерв помещается в лимиты вместе с уже идущими обработками; иначе
+архив ждёт в очереди (по порядку поступления), а не падает на середине
+из-за нехватки места. Очередь ограничена: при ADMISSION_QUEUE_MAX ожидающих
+(вместе с ещё не начатыми фоновыми задачами) новый архив отклоняется ещё при
+загрузке (check_queue, check), а уже принятая задача ждёт места в очереди.
+
+Резервы хранятся в SQLite (data/admission.db), общей для веб-процессов и
+worker.py, в том числе в разных контейнерах: живость держателя резерва
+подтверждается обновлением updated_at, резерв без обновлений дольше
+ADMISSION_STALE_SECONDS считается брошенным и удаляется.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import psutil
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionError(Exception):
+    """Архив не может быть принят: очередь заполнена или ему не хватит места"""
+
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status  # HTTP-код ответа на загрузку: 503 - повторить позже, 507 - не поместится никогда
+
+
+def estimate(file_infos, processes=None):
+    """
+    Оценка ресурсов обработки изображений архива file_infos (ZipInfo из оглавления):
+    (байт на диске, байт памяти).
+
+    Диск - объявленные размеры изображений с запасом ADMISSION_DISK_FACTOR на
+    миниатюры и WebP/AVIF версии. Память - самый большой файл, прочитанный в
+    память (до INGEST_MEMORY_BUFFER), и его декодирование в каждом процессе
+    обработки (ADMISSION_DECODE_FACTOR - во сколько раз растровое изображение
+    больше сжатого файла).
+    """
+    if processes is None:
+        processes = Config.INGEST_PROCESSES
+    total = sum(file_info.file_size for file_info in file_infos)
+    largest = max((file_info.file_size for file_info in file_infos), default=0)
+    disk = int(total * Config.ADMISSION_DISK_FACTOR)
+    memory = min(largest, Config.INGEST_MEMORY_BUFFER) + largest * Config.ADMISSION_DECODE_FACTOR * max(processes, 1)
+    return disk, memory
+
+
+class AdmissionController:
+    """Резервы ресурсов обработок архивов; безопасен для нескольких процессов и потоков"""
+
+    def __init__(self, db_path=None, folder=None):
+        self.db_path = db_path or Config.ADMISSION_DB
+        # Место проверяется на разделе, куда пишутся изображения
+        self.folder = folder or Config.UPLOAD_FOLDER
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        # Соединение своё для каждого потока и процесса (gunicorn форкает воркеры после preload_app)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        self._connect().execute('''
+            CREATE TABLE IF NOT EXISTS reservations (
+                id TEXT PRIMARY KEY,
+                label TEXT NOT NULL,
+                status TEXT NOT NULL,
+                disk_bytes INTEGER NOT NULL,
+                memory_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                admitted_at REAL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    # --- Лимиты ---
+    def disk_available(self):
+        """Свободное место под новые резервы: свободно на разделе минус неприкосновенный запас"""
+        return shutil.disk_usage(self.folder).free - Config.ADMISSION_DISK_RESERVE
+
+    @staticmethod
+    def memory_budget():
+        """Память на все обработки: ADMISSION_MEMORY_MB или 75% памяти системы"""
+        if Config.ADMISSION_MEMORY:
+            return Config.ADMISSION_MEMORY
+        return int(psutil.virtual_memory().total * 0.75)
+
+    # --- Резервирование ---
+    @contextmanager
+    def acquire(self, disk_bytes, memory_bytes, label='', key=None, on_wait=None, wait_for_queue=False):
+        """
+        Резервирует ресурсы на время блока with; пока их нет - ждёт в очереди.
+        on_wait(position) вызывается при каждой проверке во время ожидания (None - ждёт места в очереди).
+        AdmissionError - архиву не хватит места даже без других обработок или очередь заполнена;
+        с wait_for_queue (уже принятая фоновая задача) при заполненной очереди ждёт в ней места.
+        """
+        if not Config.ADMISSION_ENABLED:
+            yield
+            return
+
+        key = key or uuid.uuid4().hex
+        stop = threading.Event()
+        try:
+            started = time.time()
+            while not self._enqueue(key, label, disk_bytes, memory_bytes, wait_for_queue):
+                if on_wait:
+                    on_wait(None)
+                stop.wait(Config.ADMISSION_POLL_INTERVAL)
+            while not self._try_admit(key):
+                if on_wait:
+                    on_wait(self.position(key))
+                stop.wait(Config.ADMISSION_POLL_INTERVAL)
+            waited = time.time() - started
+            if waited >= 1:
+                logger.info(f"Обработка {label or key} допущена после ожидания {waited:.1f} с")
+
+            heartbeat = threading.Thread(target=self._heartbeat, args=(key, stop),
+                                         name=f"admission-{key[:8]}", daemon=True)
+            heartbeat.start()
+            yield
+        finally:
+            stop.set()
+            self._connect().execute('DELETE FROM reservations WHERE id = ?', (key,))
+
+    def check(self, disk_bytes, memory_bytes=0):
+        """
+        AdmissionError, если архиву не хватит места или памяти даже без других обработок.
+        memory_bytes - оценка для одного процесса обработки: больше процессов архив получит,
+        только если они поместятся, а один допускается всегда (см. _fits).
+        """
+        if not Config.ADMISSION_ENABLED:
+            return
+        available = self.disk_available()
+        if disk_bytes > available:
+            raise AdmissionError(
+                f"Недостаточно места на диске: нужно около {disk_bytes / 1024 ** 2:.0f} МБ, "
+                f"доступно {max(available, 0) / 1024 ** 2:.0f} МБ", status=507
+            )
+        budget = self.memory_budget()
+        if memory_bytes > budget:
+            raise AdmissionError(
+                f"Недостаточно памяти для обработки: нужно около {memory_bytes / 1024 ** 2:.0f} МБ, "
+                f"доступно {budget / 1024 ** 2:.0f} МБ", status=507
+            )
+
+    def check_queue(self, pending=0):
+        """AdmissionError, если очередь заполнена; pending - принятые, но ещё не начатые обработки"""
+        if not Config.ADMISSION_ENABLED:
+            return
+        waiting = self._waiting(self._connect()) + pending
+        if waiting >= Config.ADMISSION_QUEUE_MAX:
+            raise AdmissionError(f"Очередь обработки архивов заполнена ({waiting}), повторите загрузку позже")
+
+    @staticmethod
+    def _waiting(conn):
+        return conn.execute("SELECT COUNT(*) FROM reservations WHERE status = 'waiting'").fetchone()[0]
+
+    def _enqueue(self, key, label, disk_bytes, memory_bytes, wait_for_queue=False):
+        """Ставит резерв в очередь; False - очередь заполнена и вызывающий ждёт (wait_for_queue)"""
+        self.check(disk_bytes)
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._drop_stale(conn)
+            waiting = self._waiting(conn)
+            queued = waiting < Config.ADMISSION_QUEUE_MAX
+            if queued:
+                now = time.time()
+                conn.execute(
+                    "INSERT INTO reservations (id, label, status, disk_bytes, memory_bytes, created_at, updated_at) "
+                    "VALUES (?, ?, 'waiting', ?, ?, ?, ?)",
+                    (key, label, disk_bytes, memory_bytes, now, now)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if not queued and not wait_for_queue:
+            raise AdmissionError(f"Очередь обработки архивов заполнена ({waiting}), повторите загрузку позже")
+        return queued
+
+    def _try_admit(self, key):
+        """Допускает резерв key, если он первый в очереди и помещается в лимиты"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            self._drop_stale(conn)
+            conn.execute('UPDATE reservations SET updated_at = ? WHERE id = ?', (now, key))
+            first = conn.execute(
+                "SELECT * FROM reservations WHERE status = 'waiting' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            # Строго по очереди: большой архив не обгоняют бесконечно маленькие
+            admitted = first is not None and first['id'] == key and self._fits(conn, first)
+            if admitted:
+                conn.execute("UPDATE reservations SET status = 'active', admitted_at = ? WHERE id = ?", (now, key))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return admitted
+
+    def _fits(self, conn, request):
+        active = conn.execute(
+            "SELECT COUNT(*) AS count, COALESCE(SUM(disk_bytes), 0) AS disk, COALESCE(SUM(memory_bytes), 0) AS memory "
+            "FROM reservations WHERE status = 'active'"
+        ).fetchone()
+        if active['count'] == 0:
+            # Одна обработка допускается всегда: архив больше лимита памяти иначе не дождался бы очереди
+            return True
+        if active['count'] >= Config.ADMISSION_MAX_ACTIVE:
+            return False
+        # Уже записанная часть активных обработок учитывается дважды (в резерве и в занятом месте) - оценка с запасом
+        if active['disk'] + request['disk_bytes'] > self.disk_available():
+            return False
+        return active['memory'] + request['memory_bytes'] <= self.memory_budget()
+
+    @staticmethod
+    def _drop_stale(conn):
+        cursor = conn.execute('DELETE FROM reservations WHERE updated_at < ?',
+                              (time.time() - Config.ADMISSION_STALE_SECONDS,))
+        if cursor.rowcount:
+            logger.warning(f"Удалено брошенных резервов обработки: {cursor.rowcount}")
+
+    def _heartbeat(self, key, stop):
+        conn = None
+        while not stop.wait(Config.ADMISSION_POLL_INTERVAL):
+            try:
+                conn = conn or self._connect()
+                conn.execute('UPDATE reservations SET updated_at = ? WHERE id = ?', (time.time(), key))
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось обновить резерв обработки {key}: {e}")
+
+    # --- Состояние ---
+    def position(self, key):
+        """Место в очереди (1 - следующий); None, если резерв уже допущен или не найден"""
+        row = self._connect().execute(
+            "SELECT created_at FROM reservations WHERE id = ? AND status = 'waiting'", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM reservations WHERE status = 'waiting' AND created_at <= ?", (row['created_at'],)
+        ).fetchone()[0]
+
+    def state(self):
+        """Активные и ожидающие обработки, их резервы и лимиты (для админки)"""
+        now = time.time()
+        rows = self._connect().execute(
+            'SELECT * FROM reservations WHERE updated_at >= ? ORDER BY created_at',
+            (now - Config.ADMISSION_STALE_SECONDS,)
+        ).fetchall()
+        active, waiting = [], []
+        for row in rows:
+            item = {
+                'id': row['id'],
+                'label': row['label'],
+                'disk_bytes': row['disk_bytes'],
+                'memory_bytes': row['memory_bytes'],
+                'waiting_seconds': round((row['admitted_at'] or now) - row['created_at'], 1)
+            }
+            if row['status'] == 'active':
+                active.append(item)
+            else:
+                item['position'] = len(waiting) + 1
+                waiting.append(item)
+        return {
+            'enabled': Config.ADMISSION_ENABLED,
+            'active': active,
+            'waiting': waiting,
+            'reserved_disk_bytes': sum(item['disk_bytes'] for item in active),
+            'reserved_memory_bytes': sum(item['memory_bytes'] for item in active),
+            'limits': {
+                'max_active': Config.ADMISSION_MAX_ACTIVE,
+                'queue_max': Config.ADMISSION_QUEUE_MAX,
+                'disk_available_bytes': max(self.disk_available(), 0),
+                'memory_budget_bytes': self.memory_budget()
+            }
+        }
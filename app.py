@@ -1,24 +1,44 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
+from flask import Flask, Response, render_template, request, jsonify, send_file, redirect, url_for, session
+import click
+import io
 import os
 import uuid
 import zipfile
 from config import Config, allowed_file
 import re
-import unicodedata
 from urllib.parse import quote
 import tempfile
-import shutil
 import json
+import base64
+import binascii
 from datetime import datetime
 from urllib.parse import quote, unquote
 import logging
 import psutil
 import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
 # Импортируем фабрику генераторов
-from generators import GeneratorFactory
-from PIL import Image
+from generators import EXPORT_FORMATS, GeneratorFactory, template_cache, write_xlsx
+from jobs import JobQueue, job_handler, job_status, start_workers
+from chunked_upload import ChunkedUploads, UploadError
+from results_store import ResultsStore
+from trash import Trash
+from zip_stream import ZipStream
+import storage_layout
+from admission import AdmissionController, AdmissionError, estimate as estimate_ingest
+from zip_scan import ZipScanError, check_scan, log_scan, scan_archive
+from bulk_export import BUNDLES, AlbumExport, cleanup_exports, export_path, find_export
+from cpu_executor import CpuExecutor, forkserver_context
+from image_order import item_sort_key, order_from_name
+from metrics import metrics
+from ingest_files import (build_image_url, create_or_reuse_derivatives, derivative_urls, finish_processed_file,
+                          get_blob_store, get_media_index, index_uploaded_file, place_original,
+                          process_single_file_efficiently, safe_folder_name, write_original)
+from thumbnails import derivative_filenames, derived_filenames, render_derivatives, format_timings, modern_targets
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -34,6 +54,33 @@ if not os.path.exists(RESULTS_FOLDER):
     os.makedirs(RESULTS_FOLDER)
     logger.info(f"Папка для результатов создана: {RESULTS_FOLDER}")
 
+# Очередь фоновых задач (обрабатывается worker.py)
+job_queue = JobQueue()
+
+# Докачиваемые загрузки архивов частями
+chunked_uploads = ChunkedUploads()
+
+# Результаты загрузок: сжатые файлы с ограниченным сроком хранения и кэш недавних
+results_store = ResultsStore(Config.RESULTS_FOLDER)
+
+# Корзина: удалённые альбомы и артикулы удаляются с диска в фоне
+trash = Trash(Config.TRASH_FOLDER)
+
+# Индекс загруженных изображений (вместо обхода папки uploads)
+media_index = get_media_index()
+
+# Допуск обработки архивов по свободному месту и памяти (общая очередь веб-процессов и worker.py)
+admission = AdmissionController()
+
+# Хранилище по хешу содержимого: одинаковые файлы хранятся один раз (жёсткие ссылки)
+blob_store = get_blob_store()
+
+# Генерация XLSX и миниатюр из обработчиков запросов - в ограниченном пуле процессов
+cpu_executor = CpuExecutor()
+
+# XLSX шаблоны разбираются один раз при импорте (с preload_app - до форка воркеров gunicorn)
+template_cache.warm(Config.TEMPLATE_PATHS.values())
+
 
 # --- Функции для мониторинга ресурсов ---
 def check_system_resources():
@@ -56,192 +103,210 @@ def check_system_resources():
         }
 
 
-# Убрана проверка should_accept_upload - принимаем все загрузки
-
-# --- Оптимизированная функция создания миниатюры ---
-def create_thumbnail(source_path, target_path, size=(90, 90)):
-    """
-    Создает миниатюру изображения.
-    """
-    try:
-        with Image.open(source_path) as img:
-            # Конвертируем в RGB если нужно (для PNG с прозрачностью)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Используем LANCZOS для хорошего качества уменьшения
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-
-            # Сохраняем миниатюру в формате JPEG для единообразия
-            if not target_path.lower().endswith(('.jpg', '.jpeg')):
-                target_path = os.path.splitext(target_path)[0] + '_thumb.jpg'
-
-            # Сохраняем с оптимизацией
-            img.save(target_path, "JPEG", quality=70, optimize=True)
-            logger.debug(f"Миниатюра создана: {target_path}")
-            return target_path
-    except Exception as e:
-        logger.error(f"Ошибка при создании миниатюры {target_path}: {e}")
-        return None
-
+# Загрузки не отклоняются по нагрузке: обработка архива ждёт ресурсов в очереди admission
 
 # --- Вспомогательные функции ---
-def safe_folder_name(name: str) -> str:
-    """Преобразует строку в безопасное имя папки"""
-    if not name:
-        return "unnamed"
-    name = unicodedata.normalize('NFKD', name)
-    name = re.sub(r'[^\w\s-]', '', name, flags=re.UNICODE)
-    name = re.sub(r'[-\s]+', '-', name, flags=re.UNICODE).strip('-_')
-    return name[:255] if name else "unnamed"
+def parse_image_url(image_url):
+    """Разбирает публичный URL обратно в (альбом, артикул, имя файла); None для чужих URL"""
+    base_path = f"{Config.BASE_URL}/images/"
+    if not image_url.startswith(base_path):
+        return None
+    path_parts = unquote(image_url[len(base_path):]).split('/')
+    if len(path_parts) < 3:
+        return None
+    return path_parts[0], path_parts[1], '/'.join(path_parts[2:])
 
 
-def get_article_from_path(file_path, temp_dir):
-    """Извлекает артикул из пути файла"""
+def get_article_from_member(member_name):
+    """Извлекает артикул из пути файла внутри архива"""
     try:
-        relative_path = os.path.relpath(os.path.dirname(file_path), temp_dir)
-        if relative_path == '.':
+        parts = [part for part in member_name.replace('\\', '/').split('/')[:-1] if part not in ('', '.')]
+        if not parts:
             return "unknown"
 
         # Артикул - это первая папка в пути
-        article = os.path.basename(relative_path) if relative_path.count(os.sep) == 0 else relative_path.split(os.sep)[
-            0]
-        return article
+        return parts[0]
     except Exception as e:
-        logger.warning(f"Ошибка извлечения артикула из {file_path}: {e}")
+        logger.warning(f"Ошибка извлечения артикула из {member_name}: {e}")
         return "unknown"
 
 
-# --- Оптимизированная обработка файлов ---
-def process_single_file_efficiently(source_path, filename, template_name, article):
-    """Эффективная обработка одного файла"""
-    try:
-        template_folder = safe_folder_name(template_name)
-        article_folder = safe_folder_name(article)
-        full_path = os.path.join(Config.UPLOAD_FOLDER, template_folder, article_folder)
-        os.makedirs(full_path, exist_ok=True)
-
-        # Генерируем уникальные имена один раз
-        file_name_base = os.path.splitext(filename)[0]
-        unique_suffix = uuid.uuid4().hex[:6]
-        file_extension = os.path.splitext(filename)[1]
+def open_member_source(zip_ref, file_info):
+    """
+    Открывает файл архива для чтения.
+    Небольшие файлы читаются в память один раз - эти же байты идут и в оригинал, и в миниатюру.
+    """
+    with metrics.timer('extract'):
+        if file_info.file_size <= Config.INGEST_MEMORY_BUFFER:
+            return io.BytesIO(zip_ref.read(file_info))
+        return zip_ref.open(file_info)
 
-        unique_filename = f"{file_name_base}_{unique_suffix}{file_extension}"
-        thumb_filename = f"{file_name_base}_{unique_suffix}_thumb.jpg"
 
-        target_file = os.path.join(full_path, unique_filename)
-        thumb_target = os.path.join(full_path, thumb_filename)
+@contextmanager
+def open_upload_zip(zip_file):
+    """
+    Открывает загруженный архив без лишнего копирования.
 
-        # Копируем оригинал
-        shutil.copy2(source_path, target_file)
+    Принимает путь к файлу или FileStorage. Поток загрузки, который Werkzeug
+    уже сохранил во временный файл, читается напрямую; во временную папку
+    архив копируется только если поток не поддерживает seek.
+    """
+    if isinstance(zip_file, str):
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            yield zip_ref
+        return
+
+    stream = getattr(zip_file, 'stream', None)
+    if stream is not None and hasattr(stream, 'seekable') and stream.seekable():
+        stream.seek(0)
+        with zipfile.ZipFile(stream, 'r') as zip_ref:
+            yield zip_ref
+        return
 
-        # Создаем миниатюру
-        thumbnail_result = create_thumbnail(source_path, thumb_target)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        zip_path = os.path.join(temp_dir, 'upload.zip')
+        zip_file.save(zip_path)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            yield zip_ref
 
-        # Генерируем URLs
-        image_url = "{}/images/{}/{}/{}".format(
-            Config.BASE_URL,
-            quote(template_folder, safe=''),
-            quote(article_folder, safe=''),
-            quote(unique_filename, safe='')
-        )
 
-        # Используем миниатюру если создана, иначе оригинал
-        if thumbnail_result:
-            thumbnail_url = "{}/images/{}/{}/{}".format(
-                Config.BASE_URL,
-                quote(template_folder, safe=''),
-                quote(article_folder, safe=''),
-                quote(thumb_filename, safe='')
-            )
-        else:
-            thumbnail_url = image_url
+def collect_file_result(file_info, future, image_urls):
+    """
+    Забирает результат обработки файла из пула, изолируя ошибки отдельного файла.
+    Возвращает текст ошибки или None.
+    """
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.error(f"Ошибка обработки файла {file_info.filename}: {e}")
+        return f"{file_info.filename}: {e}"
+    if not result:
+        return f"{file_info.filename}: не удалось обработать файл"
+    image_urls.append(result)
+    return None
 
-        return {
-            'url': image_url,
-            'article': article,
-            'filename': unique_filename,
-            'thumbnail_url': thumbnail_url
-        }
 
-    except Exception as e:
-        logger.error(f"Ошибка обработки файла {filename}: {e}")
-        return None
+def collect_pending(pending, image_urls):
+    """Забирает самый старый результат из очереди пула: (file_info, текст ошибки или None)"""
+    file_info, future = pending.popleft()
+    return file_info, collect_file_result(file_info, future, image_urls)
 
 
 # --- Оптимизированная обработка ZIP-архивов БЕЗ ОГРАНИЧЕНИЙ ---
-def process_zip_archive_unlimited(zip_file, template_name):
-    """Обработка ZIP-архива без ограничений на количество файлов"""
+def process_zip_archive_unlimited(zip_file, template_name, processes=None, progress=None, admission_key=None):
+    """
+    Обработка ZIP-архива без ограничений на количество файлов.
+
+    Файлы архива пишутся сразу в итоговую папку без промежуточной распаковки.
+    При processes > 0 (по умолчанию Config.INGEST_PROCESSES) миниатюры создаются
+    в пуле процессов; результаты возвращаются в порядке файлов в архиве.
+    progress(files_done, files_total, error=None) вызывается после каждого файла.
+    Перед распаковкой архив резервирует место и память (admission) и, если их
+    сейчас нет, ждёт своей очереди; admission_key - id резерва (id задачи).
+    Фоновая задача уже принята, поэтому при заполненной очереди ждёт в ней места,
+    а обработка в запросе получает AdmissionError.
+    """
     image_urls = []
+    files_done = 0
+    if processes is None:
+        processes = Config.INGEST_PROCESSES
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        zip_path = os.path.join(temp_dir, zip_file.filename)
-        zip_file.save(zip_path)
+    def report(file_info, error=None):
+        nonlocal files_done
+        files_done += 1
+        if error:
+            metrics.inc('files_failed')
+        else:
+            metrics.inc('files_processed')
+            metrics.inc('bytes_processed', file_info.file_size)
+        if progress:
+            progress(files_done, len(file_infos), error)
 
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Получаем информацию о файлах
-                file_infos = []
-                for file_info in zip_ref.infolist():
-                    if (not file_info.is_dir() and
-                            allowed_file(file_info.filename) and
-                            not any(skip in file_info.filename.lower() for skip in ['thumbs.db', '.ds_store'])):
-                        file_infos.append(file_info)
-
-                logger.info(f"Начата обработка {len(file_infos)} файлов")
-
-                # Обрабатываем ВСЕ файлы без ограничений
-                for i, file_info in enumerate(file_infos):
-                    try:
-                        # Извлекаем только один файл
-                        zip_ref.extract(file_info, temp_dir)
-                        source_file = os.path.join(temp_dir, file_info.filename)
-
-                        # Получаем артикул
-                        article = get_article_from_path(source_file, temp_dir)
-
-                        # Обрабатываем файл
-                        result = process_single_file_efficiently(
-                            source_file,
-                            os.path.basename(file_info.filename),
-                            template_name,
-                            article
-                        )
-
-                        if result:
-                            image_urls.append(result)
-
-                        # Прогресс каждые 100 файлов
-                        if (i + 1) % 100 == 0:
-                            logger.info(f"Обработано {i + 1}/{len(file_infos)} файлов")
-
-                        # Очищаем временный файл сразу после обработки
-                        try:
-                            os.remove(source_file)
-                        except OSError as e:
-                            logger.warning(f"Не удалось удалить временный файл {source_file}: {e}")
-
-                    except Exception as e:
-                        logger.error(f"Ошибка обработки файла {file_info.filename}: {e}")
-                        continue
-
-        except zipfile.BadZipFile:
-            logger.error("Некорректный ZIP-архив")
-            raise Exception("Некорректный ZIP-архив")
-        except Exception as e:
-            logger.error(f"Ошибка чтения ZIP-архива: {e}")
-            raise
+    try:
+        zip_started = time.perf_counter()
+        with open_upload_zip(zip_file) as zip_ref:
+            # Проверяем оглавление до распаковки: zip-бомбы, лимиты, изображения по артикулам
+            scan = scan_archive(zip_ref, get_article_from_member)
+            warnings = check_scan(scan)
+            log_scan(scan, warnings)
+            file_infos = scan.images
+            metrics.observe('zip_open', time.perf_counter() - zip_started)
+            if progress:
+                progress(0, len(file_infos))
+                for warning in warnings:
+                    progress(0, len(file_infos), warning)
+
+            disk_bytes, memory_bytes = estimate_ingest(file_infos, processes)
+            # Пока архив ждёт ресурсов, задача остаётся живой и показывает число файлов
+            on_wait = (lambda position: progress(0, len(file_infos))) if progress else None
+            with admission.acquire(disk_bytes, memory_bytes, template_name, admission_key, on_wait,
+                                   wait_for_queue=admission_key is not None):
+                process_admitted_files(zip_ref, file_infos, template_name, processes, image_urls, report)
+
+    except zipfile.BadZipFile:
+        logger.error("Некорректный ZIP-архив")
+        raise Exception("Некорректный ZIP-архив")
+    except Exception as e:
+        logger.error(f"Ошибка чтения ZIP-архива: {e}")
+        raise
 
     logger.info(f"Успешно обработано {len(image_urls)} файлов")
     return image_urls
 
 
+def process_admitted_files(zip_ref, file_infos, template_name, processes, image_urls, report):
+    """Пишет файлы архива в альбом и создаёт миниатюры (после допуска по ресурсам)"""
+    logger.info(f"Начата обработка {len(file_infos)} файлов, процессов: {processes or 1}")
+
+    # forkserver, как в CpuExecutor: процесс воркера многопоточный (потоки gthread, задач, резерва
+    # admission, записи метрик), и fork мог бы унаследовать захваченные ими блокировки.
+    # Процессы пула выполняют ingest_files.finish_processed_file и не импортируют app
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=forkserver_context()) \
+        if processes > 0 else None
+    max_pending = max(processes, 1) * Config.INGEST_QUEUE_PER_PROCESS
+    pending = deque()
+
+    try:
+        # Обрабатываем ВСЕ файлы без ограничений
+        for i, file_info in enumerate(file_infos):
+            try:
+                # Получаем артикул
+                article = get_article_from_member(file_info.filename)
+                filename = os.path.basename(file_info.filename.replace('\\', '/'))
+
+                if executor:
+                    # Оригинал пишем здесь, миниатюру создаёт процесс пула из записанного файла
+                    with zip_ref.open(file_info) as source:
+                        placed = place_original(source, filename, template_name, article)
+                    pending.append((file_info, executor.submit(finish_processed_file, placed)))
+                    # Не уходим сильно вперёд пула
+                    while len(pending) >= max_pending:
+                        report(*collect_pending(pending, image_urls))
+                else:
+                    with open_member_source(zip_ref, file_info) as source:
+                        result = process_single_file_efficiently(source, filename, template_name, article)
+                    if result:
+                        image_urls.append(result)
+                        report(file_info)
+                    else:
+                        report(file_info, f"{file_info.filename}: не удалось обработать файл")
+
+                # Прогресс каждые 100 файлов
+                if (i + 1) % 100 == 0:
+                    logger.info(f"Обработано {i + 1}/{len(file_infos)} файлов")
+
+            except Exception as e:
+                logger.error(f"Ошибка обработки файла {file_info.filename}: {e}")
+                report(file_info, f"{file_info.filename}: {e}")
+                continue
+
+        while pending:
+            report(*collect_pending(pending, image_urls))
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
 # --- Функции для работы с XLSX ---
 def generate_xlsx_document(image_data, template_name):
     """Генерирует XLSX документ используя фабрику генераторов"""
@@ -250,38 +315,18 @@ def generate_xlsx_document(image_data, template_name):
 
 
 def save_results_to_file(image_data, product_name=None):
-    """Сохраняет результаты обработки в JSON-файл"""
-    result_id = uuid.uuid4().hex
-    results_data = {
-        'image_data': image_data,
-        'product_name': product_name or '',
-        'timestamp': datetime.now().isoformat()
-    }
-    filename = f"results_{result_id}.json"
-    filepath = os.path.join(Config.RESULTS_FOLDER, filename)
+    """Сохраняет результаты обработки (сжатый JSON, см. results_store)"""
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(results_data, f, ensure_ascii=False, indent=4)
-        logger.info(f"Результаты сохранены в {filename}")
-        return result_id
+        with metrics.timer('results_save'):
+            return results_store.save(image_data, product_name)
     except Exception as e:
         logger.error(f"Ошибка сохранения результатов: {e}")
         raise
 
 
 def load_results_from_file(result_id):
-    """Загружает результаты из JSON-файла"""
-    filename = f"results_{result_id}.json"
-    filepath = os.path.join(Config.RESULTS_FOLDER, filename)
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if 'image_data' in data:
-                return data
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Ошибка чтения файла {filepath}: {e}")
-    return None
+    """Загружает результаты: из кэша процесса, сжатого или прежнего JSON-файла"""
+    return results_store.load(result_id)
 
 
 # --- Логика обработки загрузок БЕЗ ОГРАНИЧЕНИЙ ---
@@ -298,7 +343,7 @@ def handle_single_upload_logic(request):
 
     template_folder = "generic"
     product_folder = safe_folder_name(product_name)
-    full_path = os.path.join(Config.UPLOAD_FOLDER, template_folder, product_folder)
+    full_path = storage_layout.article_dir(Config.UPLOAD_FOLDER, template_folder, product_folder)
     os.makedirs(full_path, exist_ok=True)
 
     image_urls = []
@@ -310,35 +355,33 @@ def handle_single_upload_logic(request):
                 file_name = os.path.splitext(file.filename)[0]
                 unique_filename = f"{file_name}-{random_hex}{file_extension}"
                 file_path = os.path.join(full_path, unique_filename)
-                file.save(file_path)
-
-                # Создание миниатюры
-                thumb_file_name = f"{file_name}-{random_hex}_thumb.jpg"
-                thumb_target_path = os.path.join(full_path, thumb_file_name)
-                thumbnail_path = create_thumbnail(file_path, thumb_target_path)
-
-                if not thumbnail_path:
-                    thumb_file_name = unique_filename
-
-                image_url = "{}/images/{}/{}/{}".format(
-                    Config.BASE_URL,
-                    quote(template_folder, safe=''),
-                    quote(product_folder, safe=''),
-                    quote(unique_filename, safe='')
+                digest = write_original(file.stream, file_path)
+
+                # Создание миниатюры и превью
+                derivative_names = derivative_filenames(f"{file_name}-{random_hex}")
+                targets = {name: os.path.join(full_path, name_) for name, name_ in derivative_names.items()}
+                created = create_or_reuse_derivatives(
+                    file_path,
+                    {**targets, **modern_targets(file_path, targets)},
+                    digest,
+                    executor=cpu_executor
                 )
 
-                thumbnail_url = "{}/images/{}/{}/{}".format(
-                    Config.BASE_URL,
-                    quote(template_folder, safe=''),
-                    quote(product_folder, safe=''),
-                    quote(thumb_file_name, safe='')
-                )
+                order = order_from_name(file.filename)
+                index_uploaded_file(template_folder, product_folder, unique_filename,
+                                    'thumb' in created, 'preview' in created, order)
+
+                image_url = build_image_url(template_folder, product_folder, unique_filename)
+                thumbnail_url, preview_url = derivative_urls(template_folder, product_folder,
+                                                             derivative_names, created, image_url)
 
                 image_urls.append({
                     'url': image_url,
                     'article': product_name,
+                    'order': order,
                     'filename': unique_filename,
-                    'thumbnail_url': thumbnail_url
+                    'thumbnail_url': thumbnail_url,
+                    'preview_url': preview_url
                 })
 
                 # Прогресс каждые 50 файлов
@@ -359,29 +402,39 @@ def handle_single_upload_logic(request):
         return None, f'Ошибка сохранения результатов: {str(e)}'
 
 
-def handle_archive_upload_logic(request):
-    """Логика обработки ZIP архива БЕЗ ограничений"""
+def parse_archive_upload(request):
+    """Проверяет загруженный архив и определяет имя альбома"""
     album_name = request.form.get('album_name', '').strip()
     archive_file = request.files['archive']
 
     if not archive_file or archive_file.filename == '':
-        return None, 'Выберите архив'
+        return None, None, 'Выберите архив'
 
     if not archive_file.filename.lower().endswith('.zip'):
-        return None, 'Файл должен быть ZIP архивом'
+        return None, None, 'Файл должен быть ZIP архивом'
+
+    return archive_file, resolve_album_name(album_name, archive_file.filename), None
+
 
-    # Если имя каталога не указано, используем имя ZIP-архива (без расширения)
+def resolve_album_name(album_name, archive_filename):
+    """Если имя каталога не указано, используем имя ZIP-архива (без расширения)"""
+    album_name = (album_name or '').strip()
     if not album_name:
-        album_name = os.path.splitext(archive_file.filename)[0]
-        album_name = safe_folder_name(album_name)
+        album_name = safe_folder_name(os.path.splitext(archive_filename)[0])
+    return album_name
 
+
+def run_archive_ingest(archive, album_name, progress=None, admission_key=None):
+    """Обрабатывает архив (FileStorage или путь к файлу) и сохраняет результаты"""
     try:
         # Используем обработку БЕЗ ограничений
         start_time = time.time()
-        image_data = process_zip_archive_unlimited(archive_file, album_name)
+        image_data = process_zip_archive_unlimited(archive, album_name, progress=progress,
+                                                   admission_key=admission_key)
         processing_time = time.time() - start_time
 
         logger.info(f"Архив обработан за {processing_time:.2f} секунд, файлов: {len(image_data)}")
+        metrics.inc('archives_processed')
 
         if not image_data:
             return None, 'В архиве не найдено подходящих изображений'
@@ -389,28 +442,210 @@ def handle_archive_upload_logic(request):
         # Сохраняем результаты
         result_id = save_results_to_file(image_data, album_name)
         return result_id, None
+    except AdmissionError:
+        # Отказ по ресурсам возвращается клиенту своим кодом (503/507), см. handle_upload
+        raise
     except Exception as e:
         logger.error(f"Ошибка при обработке архива: {str(e)}")
         return None, f'Ошибка при обработке архива: {str(e)}'
 
 
+def handle_archive_upload_logic(request):
+    """Логика обработки ZIP архива БЕЗ ограничений"""
+    archive_file, album_name, error = parse_archive_upload(request)
+    if error:
+        return None, error
+    return run_archive_ingest(archive_file, album_name)
+
+
+def enqueue_archive_upload(request):
+    """Сохраняет архив во временную папку и ставит его обработку в очередь фоновых задач"""
+    archive_file, album_name, error = parse_archive_upload(request)
+    if error:
+        return None, error
+    # При заполненной очереди архив не сохраняется
+    check_ingest_queue()
+
+    staging_path = os.path.join(Config.STAGING_FOLDER, f"{uuid.uuid4().hex}.zip")
+    try:
+        archive_file.save(staging_path)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения архива: {e}")
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        return None, f'Ошибка при сохранении архива: {str(e)}'
+    return enqueue_archive_ingest(staging_path, album_name, archive_file.filename)
+
+
+def check_ingest_queue():
+    """AdmissionError, если очередь допуска вместе с не начатыми задачами архивов заполнена"""
+    admission.check_queue(pending=job_queue.count_queued('ingest_archive'))
+
+
+def check_ingest_admission(scan):
+    """AdmissionError, если очередь заполнена или архиву не хватит места или памяти даже без других обработок"""
+    check_ingest_queue()
+    # Память - для одного процесса: столько обработка получит, даже если идёт одна
+    admission.check(*estimate_ingest(scan.images, processes=1))
+
+
+def check_upload_admission(archive_path):
+    """
+    Проверка собранного из частей архива до завершения загрузки: при AdmissionError
+    загрузка остаётся, и её можно завершить позже без повторной передачи.
+    Негодный архив отклоняет уже enqueue_archive_ingest.
+    """
+    try:
+        with open_upload_zip(archive_path) as zip_ref:
+            scan = scan_archive(zip_ref, get_article_from_member)
+    except zipfile.BadZipFile:
+        return
+    check_ingest_admission(scan)
+
+
+def enqueue_archive_ingest(staging_path, album_name, filename, admitted=False):
+    """
+    Ставит обработку архива из папки staging в очередь; архив удаляет задача.
+    AdmissionError (архив удалён) - очередь заполнена или архиву не хватит ресурсов;
+    admitted - допуск уже проверен (check_upload_admission).
+    """
+    try:
+        # Негодный архив, заполненная очередь и архив, которому не хватит места или памяти
+        # даже без других обработок, отклоняются сразу, а не в воркере
+        with open_upload_zip(staging_path) as zip_ref:
+            scan = scan_archive(zip_ref, get_article_from_member)
+        check_scan(scan)
+        if not admitted:
+            check_ingest_admission(scan)
+    except AdmissionError:
+        os.remove(staging_path)
+        raise
+    except (ZipScanError, zipfile.BadZipFile) as e:
+        os.remove(staging_path)
+        return None, 'Некорректный ZIP-архив' if isinstance(e, zipfile.BadZipFile) else str(e)
+
+    try:
+        job_id = job_queue.enqueue('ingest_archive', {
+            'archive_path': staging_path,
+            'album_name': album_name,
+            'filename': filename
+        })
+        # Число файлов известно по оглавлению ещё до начала обработки
+        job_queue.update_progress(job_id, 0, len(scan.images))
+        return job_id, None
+    except Exception as e:
+        logger.error(f"Ошибка постановки архива в очередь: {e}")
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        return None, f'Ошибка при сохранении архива: {str(e)}'
+
+
+def ingest_staged_archive(staging_path, album_name, filename, admitted=False):
+    """
+    Обработка архива, уже лежащего в staging (например, собранного из частей):
+    файл передаётся дальше по пути, без копирования. Возвращает (job_id, result_id, error);
+    AdmissionError - архив отклонён по ресурсам.
+    """
+    if Config.BACKGROUND_INGEST:
+        # Принятая задача, если очередь успела заполниться, ждёт в ней места (wait_for_queue)
+        job_id, error = enqueue_archive_ingest(staging_path, album_name, filename, admitted)
+        return job_id, None, error
+    try:
+        result_id, error = run_archive_ingest(staging_path, album_name)
+    finally:
+        os.remove(staging_path)
+    return None, result_id, error
+
+
+@job_handler('ingest_archive')
+def ingest_archive_job(job, progress):
+    """Фоновая обработка архива, сохранённого enqueue_archive_upload"""
+    payload = job['payload']
+    try:
+        result_id, error = run_archive_ingest(payload['archive_path'], payload['album_name'], progress,
+                                              admission_key=job['id'])
+    finally:
+        try:
+            os.remove(payload['archive_path'])
+        except OSError as e:
+            logger.warning(f"Не удалось удалить временный архив {payload['archive_path']}: {e}")
+
+    if error:
+        raise Exception(error)
+    return {'result_id': result_id}
+
+
+@job_handler('export_albums')
+def export_albums_job(job, progress):
+    """Фоновая выгрузка нескольких альбомов (одна книга или ZIP), поставленная /admin/export-albums"""
+    payload = job['payload']
+    cleanup_exports()
+    ensure_media_index()
+    totals = {}
+    for row in media_index.summary():
+        totals[row['album']] = totals.get(row['album'], 0) + row['count']
+
+    export = AlbumExport(
+        payload['albums'], payload['template_name'], payload['separator'], payload['format'], payload['bundle'],
+        load_items=lambda album: [index_row_to_item(row) for row in media_index.list_images(album)],
+        executor=cpu_executor
+    )
+    path = export_path(job['id'], export.file_format, export.bundle)
+    tmp_path = f"{path}.tmp"
+    try:
+        images, empty = export.run(tmp_path, totals, progress)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    logger.info(f"Выгрузка {job['id']}: альбомов {len(payload['albums']) - len(empty)}, изображений {images}")
+    return {'export_id': job['id'], 'images': images, 'empty_albums': empty,
+            'filename': os.path.basename(path)}
+
+
 # --- Маршруты Flask ---
+@app.before_request
+def start_metrics():
+    # Процесс воркера gunicorn появляется после fork: запускаем запись его метрик (RSS) сразу
+    metrics.start()
+
+
 @app.route('/admin', methods=['GET'])
 def index():
     return render_template('index.html',
                            product_name='',
                            image_urls=[],
+                           job_id=request.args.get('job', ''),
                            error='')
 
 
 @app.route('/admin', methods=['POST'])
 def handle_upload():
+    wants_json = request.accept_mimetypes.best == 'application/json'
     try:
         if 'archive' in request.files and request.files['archive'].filename != '':
+            if Config.BACKGROUND_INGEST:
+                job_id, error = enqueue_archive_upload(request)
+                if wants_json:
+                    if error:
+                        return jsonify({'error': error}), 400
+                    return jsonify({'job_id': job_id,
+                                    'status_url': url_for('job_status_view', job_id=job_id)}), 202
+                if error:
+                    session['error'] = error
+                    return redirect(url_for('index'))
+                return redirect(url_for('index', job=job_id))
             result_id, error = handle_archive_upload_logic(request)
         else:
             result_id, error = handle_single_upload_logic(request)
 
+        if wants_json:
+            if error:
+                return jsonify({'error': error}), 400
+            return jsonify({'result_id': result_id,
+                            'result_url': url_for('view_results', result_id=result_id)})
+
         if error:
             session['error'] = error
             return redirect(url_for('index'))
@@ -418,13 +653,143 @@ def handle_upload():
         if result_id:
             return redirect(url_for('view_results', result_id=result_id))
 
+        return redirect(url_for('index'))
+    except AdmissionError as e:
+        logger.warning(f"Архив отклонён: {e}")
+        if wants_json:
+            return jsonify({'error': str(e)}), e.status
+        session['error'] = str(e)
         return redirect(url_for('index'))
     except Exception as e:
         logger.error(f"Ошибка в handle_upload: {e}")
+        if wants_json:
+            return jsonify({'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
         session['error'] = f'Внутренняя ошибка сервера: {str(e)}'
         return redirect(url_for('index'))
 
 
+@app.route('/admin/jobs/<job_id>', methods=['GET'])
+def job_status_view(job_id):
+    """Статус фоновой задачи: файлы обработано/всего, скорость и ошибки"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    status = job_status(job)
+    if status['result'] and status['result'].get('result_id'):
+        status['result_url'] = url_for('view_results', result_id=status['result']['result_id'])
+    if status['result'] and status['result'].get('export_id'):
+        status['download_url'] = url_for('download_export', export_id=status['result']['export_id'])
+    if job['status'] == 'running' and job['kind'] == 'ingest_archive':
+        # Место в очереди допуска по ресурсам; None - архив уже обрабатывается
+        status['admission_position'] = admission.position(job['id'])
+    return jsonify(status)
+
+
+# --- Докачиваемая загрузка архивов частями ---
+def upload_session_view(upload):
+    return {
+        'upload_id': upload['id'],
+        'filename': upload['filename'],
+        'size': upload['size'],
+        'received': upload['received'],
+        'chunk_size': Config.UPLOAD_CHUNK_SIZE,
+        'upload_url': url_for('upload_status', upload_id=upload['id'])
+    }
+
+
+def upload_error_response(error):
+    body = {'error': str(error)}
+    if error.received is not None:
+        body['received'] = error.received
+    return jsonify(body), error.status
+
+
+@app.route('/admin/uploads', methods=['POST'])
+def create_upload():
+    """Начинает загрузку архива частями: {filename, size, album_name}"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+
+    try:
+        # При заполненной очереди архив отклоняется до передачи частей
+        check_ingest_queue()
+        upload = chunked_uploads.create(filename, size, resolve_album_name(data.get('album_name'), filename))
+    except AdmissionError as e:
+        return jsonify({'error': str(e)}), e.status
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(upload_session_view(upload)), 201
+
+
+@app.route('/admin/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Сколько байт уже принято: загрузку продолжают с этого смещения"""
+    try:
+        return jsonify(upload_session_view(chunked_uploads.get(upload_id)))
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+@app.route('/admin/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Часть файла: ?offset=N, тело - байты части, X-Chunk-Sha256 - контрольная сумма"""
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset'}), 400
+    if request.content_length is None:
+        return jsonify({'error': 'Content-Length is required'}), 411
+
+    try:
+        upload = chunked_uploads.write_chunk(upload_id, offset, request.stream, request.content_length,
+                                             request.headers.get('X-Chunk-Sha256'))
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(upload_session_view(upload))
+
+
+@app.route('/admin/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    try:
+        chunked_uploads.abort(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'success': True})
+
+
+@app.route('/admin/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Завершает загрузку и передаёт собранный архив на обработку"""
+    try:
+        # Допуск проверяется до завершения: при отказе части остаются, /complete можно повторить
+        archive_path, upload = chunked_uploads.complete(upload_id, check=check_upload_admission)
+    except AdmissionError as e:
+        logger.warning(f"Загрузка {upload_id} не завершена: {e}")
+        return jsonify({'error': f'{e} (загруженный архив сохранён: при повторной загрузке '
+                                 f'того же файла он не передаётся заново)'}), e.status
+    except UploadError as e:
+        return upload_error_response(e)
+
+    try:
+        job_id, result_id, error = ingest_staged_archive(archive_path, upload['album_name'], upload['filename'],
+                                                         admitted=True)
+    except AdmissionError as e:
+        logger.warning(f"Архив загрузки {upload_id} отклонён: {e}")
+        return jsonify({'error': str(e)}), e.status
+    if error:
+        return jsonify({'error': error}), 400
+    if job_id:
+        return jsonify({'job_id': job_id,
+                        'status_url': url_for('job_status_view', job_id=job_id)}), 202
+    return jsonify({'result_id': result_id,
+                    'result_url': url_for('view_results', result_id=result_id)})
+
+
 @app.route('/admin/results/<result_id>', methods=['GET'])
 def view_results(result_id):
     try:
@@ -435,6 +800,7 @@ def view_results(result_id):
             return render_template('index.html',
                                    image_urls=image_urls,
                                    product_name=product_name,
+                                   result_id=result_id,
                                    error='')
         else:
             error = 'Результаты не найдены или срок их действия истек.'
@@ -450,24 +816,101 @@ def view_results(result_id):
                                error='Ошибка загрузки результатов')
 
 
+@app.route('/admin/metrics', methods=['GET'])
+def metrics_view():
+    """Метрики всех процессов приложения в текстовом формате Prometheus"""
+    resources = check_system_resources()
+    admission_state = admission.state()
+    text = metrics.render({
+        'system_memory_percent': ('Занято памяти системы, %', resources['memory_percent']),
+        'disk_free_bytes': ('Свободно на диске, байт', int(resources['disk_free_gb'] * 1024 ** 3)),
+        'load_average': ('Средняя загрузка за 1 минуту', resources['load_avg']),
+        'ingests_active': ('Обработок архивов, допущенных по ресурсам', len(admission_state['active'])),
+        'ingests_waiting': ('Обработок архивов, ожидающих ресурсов', len(admission_state['waiting'])),
+        'ingest_reserved_disk_bytes': ('Место на диске, зарезервированное обработками, байт',
+                                       admission_state['reserved_disk_bytes']),
+        'ingest_reserved_memory_bytes': ('Память, зарезервированная обработками, байт',
+                                         admission_state['reserved_memory_bytes'])
+    })
+    return app.response_class(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admin/api/admission', methods=['GET'])
+def admission_view():
+    """Очередь допуска обработок архивов: активные, ожидающие, резервы и лимиты"""
+    state = admission.state()
+    # Принятые архивы, которые ещё не забрал воркер, тоже занимают места в очереди
+    state['queued_jobs'] = job_queue.count_queued('ingest_archive')
+    state['system'] = check_system_resources()
+    return jsonify(state)
+
+
+@app.route('/internal/images/<path:image_path>', methods=['GET', 'HEAD'])
+def resolve_image(image_path):
+    """
+    Путь к изображению в раскладке с шардами для nginx: файл, не найденный по плоскому
+    пути /images/<альбом>/<артикул>/<файл>, отдаётся через X-Accel-Redirect
+    """
+    parts = image_path.split('/')
+    path = upload_path(*parts) if len(parts) == 3 else None
+    if path is None or not os.path.isfile(path):
+        return '', 404
+    relative = os.path.relpath(path, Config.UPLOAD_FOLDER).replace(os.sep, '/')
+    return '', 200, {'X-Accel-Redirect': f"/uploads/{quote(relative)}"}
+
+
 @app.route('/')
 def hello():
     return render_template('hello.html')
 
 
+def sort_export_items(image_data):
+    """Сортировка элементов по артикулу и порядковому номеру (сохранённому при загрузке)"""
+    image_data.sort(key=item_sort_key)
+    return image_data
+
+
+def collect_export_items(data):
+    """
+    Строки для XLSX по ссылке на сохранённые данные, без передачи списка с клиента:
+    result_id - результаты загрузки (удалённые с тех пор файлы пропускаются),
+    selector {album, article} - выборка из индекса ({} - весь архив).
+    Для совместимости принимается и готовый список image_data.
+    Возвращает (image_data, error).
+    """
+    if data.get('result_id'):
+        result_id = str(data['result_id'])
+        results_data = load_results_from_file(result_id) if re.fullmatch(r'[a-f0-9]+', result_id) else None
+        if not results_data:
+            return None, 'Результаты не найдены или срок их действия истек.'
+        image_data = []
+        for item in results_data.get('image_data', []):
+            parsed = parse_image_url(item['url'])
+            if parsed and os.path.exists(storage_layout.file_path(Config.UPLOAD_FOLDER, *parsed)):
+                image_data.append(item)
+        return sort_export_items(image_data), None
+
+    selector = data.get('selector')
+    if isinstance(selector, dict):
+        ensure_media_index()
+        rows = media_index.list_images(selector.get('album') or None, selector.get('article') or None)
+        # Индекс уже упорядочен по альбому, артикулу и порядковому номеру
+        return [index_row_to_item(row) for row in rows], None
+
+    return sort_export_items(data.get('image_data', [])), None
+
+
 @app.route('/admin/download-xlsx', methods=['POST'])
 def download_xlsx():
+    """Документ со ссылками: format - xlsx (по умолчанию), csv или tsv"""
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        image_data = data.get('image_data', [])
         template_name = data.get('template_name', '')
         separator = data.get('separator', 'comma')
-
-        if not image_data:
-            return jsonify({'error': 'No image data provided'}), 400
+        file_format = data.get('format', 'xlsx')
 
         if not template_name:
             return jsonify({'error': 'Template name is required for XLSX generation'}), 400
@@ -475,119 +918,475 @@ def download_xlsx():
         if template_name not in Config.TEMPLATES:
             return jsonify({'error': f'Invalid template: {template_name}'}), 400
 
-        logger.info(f"Генерация XLSX для шаблона: {template_name}, файлов: {len(image_data)}")
-
-        # Сортировка данных
-        def sort_key(item):
-            filename_from_url = item['url'].split('/')[-1]
-            match = re.search(r'_(\d+)_[a-f0-9]+\.\w+$', filename_from_url)
-            if match:
-                try:
-                    order_num = int(match.group(1))
-                except ValueError:
-                    order_num = 0
-            else:
-                order_num = 0
-            return (item['article'], order_num)
-
-        image_data.sort(key=sort_key)
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Invalid format: {file_format}'}), 400
 
-        # Генерация XLSX
-        generator = GeneratorFactory.create_generator(template_name, separator)
-        xlsx_buffer = generator.generate(image_data, template_name)
+        image_data, error = collect_export_items(data)
+        if error:
+            return jsonify({'error': error}), 404
 
-        separator_suffix = "_перенос" if separator == 'newline' else "_запятые"
-        filename = f"{safe_folder_name(template_name)}{separator_suffix}_images.xlsx"
+        if not image_data:
+            return jsonify({'error': 'No image data provided'}), 400
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', mode='w+b') as temp_file:
-            temp_file.write(xlsx_buffer.getvalue())
-            temp_file_path = temp_file.name
+        logger.info(f"Генерация {file_format.upper()} для шаблона: {template_name}, файлов: {len(image_data)}")
 
-        try:
-            response = send_file(
-                temp_file_path,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            return response
-        finally:
+        separator_suffix = "_перенос" if separator == 'newline' else "_запятые"
+        filename = f"{safe_folder_name(template_name)}{separator_suffix}_images.{file_format}"
+
+        if file_format != 'xlsx':
+            # CSV/TSV формируется быстро и отдаётся по мере записи строк, без временного файла
+            generator = GeneratorFactory.create_generator(template_name, separator, file_format)
+            return Response(generator.iter_chunks(image_data, template_name), mimetype=generator.mimetype,
+                            headers={'Content-Disposition': content_disposition(filename)})
+
+        with metrics.timer('xlsx_generate'):
+            # Документ создаётся в пуле процессов во временный файл, который отдаётся клиенту потоком
+            # (поток запроса не держит GIL, пока openpyxl формирует строки)
+            xlsx_file = tempfile.NamedTemporaryFile(suffix='.xlsx')
             try:
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-            except Exception as e:
-                logger.error(f"Ошибка при удалении временного файла: {e}")
+                cpu_executor.run(write_xlsx, xlsx_file.name, image_data, template_name, separator,
+                                 Config.XLSX_STREAMING)
+                xlsx_file.seek(0)
+            except Exception:
+                xlsx_file.close()
+                raise
+
+        return send_file(
+            xlsx_file,
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
 
     except Exception as e:
         logger.error(f"Error generating XLSX: {str(e)}")
         return jsonify({'error': f'Ошибка при генерации XLSX-файла: {str(e)}'}), 500
 
 
+def index_row_to_item(row):
+    """Запись индекса в формате элемента архива для шаблонов и API"""
+    image_url = build_image_url(row['album'], row['article'], row['filename'])
+    created = [name for name, flag in (('thumb', row['has_thumb']), ('preview', row['has_preview'])) if flag]
+    thumbnail_url, preview_url = derivative_urls(row['album'], row['article'],
+                                                 derivative_filenames(os.path.splitext(row['filename'])[0]),
+                                                 created, image_url)
+
+    return {
+        'url': image_url,
+        'article': row['article'],
+        'order': row['order_num'],
+        'filename': row['filename'],
+        'template': row['album'],
+        'thumbnail_url': thumbnail_url,
+        'preview_url': preview_url
+    }
+
+
+def encode_archive_cursor(row):
+    """Курсор следующей страницы - ключ сортировки последней записи"""
+    key = [row['album'], row['article'], row['order_num'], row['filename']]
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_archive_cursor(cursor):
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    if not isinstance(key, list) or len(key) != 4:
+        raise ValueError('Invalid cursor')
+    return key
+
+
+def ensure_media_index():
+    """Первый запуск - строим индекс по текущему содержимому uploads"""
+    if not media_index.is_built():
+        media_index.rebuild(Config.UPLOAD_FOLDER)
+
+
 @app.route('/admin/archive')
 def archive():
     """
-    Отображает архив всех загруженных изображений из папки uploads.
+    Страница архива. Изображения подгружаются постранично через /admin/api/archive.
     """
     try:
-        image_data = []
-        uploads_path = Config.UPLOAD_FOLDER
-        if not os.path.exists(uploads_path):
-            logger.warning(f"Папка uploads не найдена: {uploads_path}")
-            return render_template('archive.html', image_data=image_data,
-                                   error="Папка uploads пуста или не существует.")
-
-        # Проходим по структуре папок
-        for template_folder in os.listdir(uploads_path):
-            template_path = os.path.join(uploads_path, template_folder)
-            if os.path.isdir(template_path):
-                for article_folder in os.listdir(template_path):
-                    article_path = os.path.join(template_path, article_folder)
-                    if os.path.isdir(article_path):
-                        for filename in os.listdir(article_path):
-                            file_path = os.path.join(article_path, filename)
-                            if (os.path.isfile(file_path) and
-                                    allowed_file(filename) and
-                                    '_thumb' not in filename):
-
-                                image_url = f"{Config.BASE_URL}/images/{quote(template_folder, safe='')}/{quote(article_folder, safe='')}/{quote(filename, safe='')}"
-                                file_name_base = os.path.splitext(filename)[0]
-                                thumb_filename = f"{file_name_base}_thumb.jpg"
-                                thumb_path = os.path.join(article_path, thumb_filename)
-                                thumbnail_url = image_url
-
-                                if os.path.exists(thumb_path):
-                                    thumbnail_url = f"{Config.BASE_URL}/images/{quote(template_folder, safe='')}/{quote(article_folder, safe='')}/{quote(thumb_filename, safe='')}"
-
-                                image_data.append({
-                                    'url': image_url,
-                                    'article': article_folder,
-                                    'filename': filename,
-                                    'template': template_folder,
-                                    'thumbnail_url': thumbnail_url
-                                })
-
-        # Сортировка данных
-        def sort_key(item):
-            template_order = item['template']
-            article_order = item['article']
-            match = re.search(r'_(\d+)_[a-f0-9]+\.\w+$', item['filename'])
-            if match:
-                try:
-                    order_num = int(match.group(1))
-                except ValueError:
-                    order_num = 0
+        if not os.path.exists(Config.UPLOAD_FOLDER):
+            logger.warning(f"Папка uploads не найдена: {Config.UPLOAD_FOLDER}")
+            return render_template('archive.html', error="Папка uploads пуста или не существует.")
+
+        ensure_media_index()
+        return render_template('archive.html', error='')
+
+    except Exception as e:
+        logger.error(f"Ошибка в archive: {e}")
+        return render_template('archive.html', error='Ошибка загрузки архива')
+
+
+@app.route('/admin/api/archive', methods=['GET'])
+def archive_api():
+    """
+    Страница изображений архива.
+    Параметры: album, article - фильтры; limit - размер страницы; cursor - из next_cursor предыдущего ответа.
+    """
+    try:
+        album = request.args.get('album') or None
+        article = request.args.get('article') or None
+        limit = request.args.get('limit', Config.ARCHIVE_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, Config.ARCHIVE_MAX_PAGE_SIZE))
+
+        cursor = request.args.get('cursor')
+        try:
+            after = decode_archive_cursor(cursor) if cursor else None
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        ensure_media_index()
+        # Запрашиваем на одну запись больше, чтобы понять, есть ли следующая страница
+        rows = media_index.page_images(album, article, after, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return jsonify({
+            'items': [index_row_to_item(row) for row in rows],
+            'next_cursor': encode_archive_cursor(rows[-1]) if has_more else None
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка в archive_api: {e}")
+        return jsonify({'error': f'Ошибка загрузки архива: {str(e)}'}), 500
+
+
+@app.route('/admin/api/archive/summary', methods=['GET'])
+def archive_summary_api():
+    """Список альбомов и артикулов с количеством изображений (без самих изображений)"""
+    try:
+        ensure_media_index()
+        albums = {}
+        for row in media_index.summary(request.args.get('album') or None):
+            album = albums.setdefault(row['album'], {'name': row['album'], 'count': 0, 'articles': []})
+            album['articles'].append({'name': row['article'], 'count': row['count']})
+            album['count'] += row['count']
+
+        return jsonify({'albums': list(albums.values())})
+
+    except Exception as e:
+        logger.error(f"Ошибка в archive_summary_api: {e}")
+        return jsonify({'error': f'Ошибка загрузки архива: {str(e)}'}), 500
+
+
+# --- Удаление ---
+def upload_path(*parts):
+    """
+    Путь внутри uploads по именам из запроса (альбом[, артикул[, файл]]) с учётом раскладки;
+    None для недопустимых имён (.., /, служебные папки)
+    """
+    for part in parts:
+        if not part or part.startswith('.') or '/' in part or '\\' in part:
+            return None
+    if len(parts) == 3:
+        return storage_layout.file_path(Config.UPLOAD_FOLDER, *parts)
+    if len(parts) == 2:
+        return storage_layout.find_article_dir(Config.UPLOAD_FOLDER, *parts)
+    return os.path.join(Config.UPLOAD_FOLDER, *parts)
+
+
+def remove_empty_folders(album_folder, article_folder=None):
+    """Удаляет опустевшие папки артикула, его шарда и альбома (rmdir не удаляет непустую папку)"""
+    if article_folder:
+        storage_layout.remove_empty_article_dirs(Config.UPLOAD_FOLDER, album_folder, article_folder)
+    try:
+        os.rmdir(os.path.join(Config.UPLOAD_FOLDER, album_folder))
+        logger.info(f"Удалена пустая папка: {album_folder}")
+    except OSError:
+        pass
+
+
+def delete_image_files(album_folder, article_folder, filenames):
+    """
+    Удаляет изображения одного артикула вместе с миниатюрами и превью.
+    Возвращает список имён, которых не было на диске.
+    """
+    deleted, missing = [], []
+    for filename in filenames:
+        # Пока раскладка переводится, файлы одного артикула могут лежать в двух папках
+        path = storage_layout.file_path(Config.UPLOAD_FOLDER, album_folder, article_folder, filename)
+        folder = os.path.dirname(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            missing.append(filename)
+            continue
+        deleted.append(filename)
+
+        # Удаляем производные файлы без предварительной проверки существования
+        for derivative_name in derived_filenames([filename]):
+            try:
+                os.remove(os.path.join(folder, derivative_name))
+            except FileNotFoundError:
+                pass
+
+    if deleted:
+        media_index.remove_images(album_folder, article_folder, deleted)
+        remove_empty_folders(album_folder, article_folder)
+        logger.info(f"Удалено изображений из {album_folder}/{article_folder}: {len(deleted)}")
+    return missing
+
+
+def trash_folder(album_folder, article_folder=None):
+    """
+    Переносит папку альбома или артикула в корзину и убирает её из индекса.
+    Сама папка удаляется в фоне. False, если папки нет.
+    """
+    parts = (album_folder, article_folder) if article_folder else (album_folder,)
+    path = upload_path(*parts)
+    if path is None:
+        return False
+    # Артикул может лежать в обеих раскладках, пока она переводится
+    paths = storage_layout.article_dirs(Config.UPLOAD_FOLDER, *parts) if article_folder else [path]
+    moved = False
+    for path in paths:
+        try:
+            trash.move(path)
+            moved = True
+        except FileNotFoundError:
+            pass
+    if not moved:
+        return False
+
+    if article_folder:
+        media_index.remove_article(album_folder, article_folder)
+        remove_empty_folders(album_folder)
+    else:
+        media_index.remove_album(album_folder)
+    return True
+
+
+@app.route('/admin/delete-batch', methods=['POST'])
+def delete_batch():
+    """
+    Удаляет несколько целей за один запрос:
+    {"targets": [{"image_url": ...}, {"album_name": ..., "article_name": ...}, {"album_name": ...}]}.
+    Альбомы и артикулы переносятся в корзину и удаляются в фоне.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        targets = data.get('targets')
+        if not isinstance(targets, list) or not targets:
+            return jsonify({'error': 'No targets provided'}), 400
+        if len(targets) > Config.DELETE_BATCH_MAX:
+            return jsonify({'error': f'Too many targets (max {Config.DELETE_BATCH_MAX})'}), 400
+
+        errors = []
+        folders = []
+        images = {}
+        for target in targets:
+            if not isinstance(target, dict):
+                errors.append({'target': target, 'error': 'Invalid target'})
+            elif target.get('image_url'):
+                parsed = parse_image_url(target['image_url'])
+                if parsed is None or upload_path(*parsed) is None:
+                    errors.append({'target': target, 'error': 'Invalid image URL'})
+                    continue
+                album_folder, article_folder, filename = parsed
+                images.setdefault((album_folder, article_folder), []).append((filename, target))
+            elif target.get('album_name'):
+                folders.append(target)
+            else:
+                errors.append({'target': target, 'error': 'Invalid target'})
+
+        deleted = 0
+        # Изображения группируются по артикулу: одна транзакция индекса и одна проверка папки
+        for (album_folder, article_folder), entries in images.items():
+            missing = set(delete_image_files(album_folder, article_folder, [name for name, _ in entries]))
+            for filename, target in entries:
+                if filename in missing:
+                    errors.append({'target': target, 'error': 'File not found'})
+                else:
+                    deleted += 1
+
+        moved = 0
+        for target in folders:
+            album_folder = unquote(target['album_name'])
+            article_folder = unquote(target['article_name']) if target.get('article_name') else None
+            if trash_folder(album_folder, article_folder):
+                moved += 1
             else:
-                order_num = 0
-            return (template_order, article_order, order_num)
+                errors.append({'target': target, 'error': 'Not found'})
 
-        image_data.sort(key=sort_key)
+        if moved:
+            trash.sweep_async()
 
-        logger.info(f"Собрано {len(image_data)} элементов для архива")
-        return render_template('archive.html', image_data=image_data, error='')
+        return jsonify({'success': not errors, 'deleted': deleted + moved, 'errors': errors})
 
     except Exception as e:
-        logger.error(f"Ошибка в archive: {e}")
-        return render_template('archive.html', image_data=[], error='Ошибка загрузки архива')
+        logger.error(f"Error in batch delete: {str(e)}")
+        return jsonify({'error': f'Ошибка при удалении: {str(e)}'}), 500
+
+
+@app.route('/admin/export-albums', methods=['POST'])
+def export_albums():
+    """
+    Ставит в очередь выгрузку ссылок нескольких альбомов:
+    {"albums": [...], "template_name": ..., "separator": ..., "format": "xlsx|csv|tsv", "bundle": "workbook|zip"}.
+    workbook - одна книга XLSX с листом на альбом, zip - файл на альбом.
+    Прогресс - /admin/jobs/<job_id>, готовый файл - download_url в статусе задачи.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        albums = data.get('albums')
+        template_name = data.get('template_name', '')
+        separator = data.get('separator', 'comma')
+        file_format = data.get('format', 'xlsx')
+        bundle = data.get('bundle', 'workbook')
+
+        if not isinstance(albums, list) or not albums or not all(isinstance(album, str) for album in albums):
+            return jsonify({'error': 'No albums provided'}), 400
+        if len(albums) > Config.EXPORT_MAX_ALBUMS:
+            return jsonify({'error': f'Too many albums (max {Config.EXPORT_MAX_ALBUMS})'}), 400
+        if template_name not in Config.TEMPLATES:
+            return jsonify({'error': f'Invalid template: {template_name}'}), 400
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Invalid format: {file_format}'}), 400
+        if bundle not in BUNDLES:
+            return jsonify({'error': f'Invalid bundle: {bundle}'}), 400
+
+        # Порядок листов - порядок в запросе, повторы убираются
+        albums = list(dict.fromkeys(albums))
+        job_id = job_queue.enqueue('export_albums', {
+            'albums': albums,
+            'template_name': template_name,
+            'separator': separator,
+            'format': file_format,
+            'bundle': bundle
+        })
+        return jsonify({'job_id': job_id, 'status_url': url_for('job_status_view', job_id=job_id)}), 202
+
+    except Exception as e:
+        logger.error(f"Ошибка постановки выгрузки альбомов: {e}")
+        return jsonify({'error': f'Ошибка при создании выгрузки: {str(e)}'}), 500
+
+
+@app.route('/admin/exports/<export_id>', methods=['GET'])
+def download_export(export_id):
+    """Готовая выгрузка нескольких альбомов"""
+    path = find_export(export_id) if re.fullmatch(r'[a-f0-9]+', export_id) else None
+    if path is None:
+        return jsonify({'error': 'Выгрузка не найдена или срок её хранения истек.'}), 404
+    extension = os.path.splitext(path)[1]
+    mimetype = 'application/zip' if extension == '.zip' else \
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return send_file(path, as_attachment=True, mimetype=mimetype,
+                     download_name=f"albums_{datetime.now().strftime('%Y%m%d')}{extension}")
+
+
+# --- Выгрузка оригиналов ZIP-архивом ---
+def album_zip_files(album_folder, article_folder=None):
+    """Оригиналы альбома или артикула из индекса: [(имя в архиве, путь)]"""
+    files = []
+    for row in media_index.list_images(album_folder, article_folder):
+        path = upload_path(row['album'], row['article'], row['filename'])
+        if path is not None:
+            files.append((f"{row['album']}/{row['article']}/{row['filename']}", path))
+    return files
+
+
+def selection_zip_files(targets):
+    """Файлы для целей в формате /admin/delete-batch; (файлы, ошибка)"""
+    files = []
+    for target in targets:
+        if not isinstance(target, dict):
+            return None, 'Invalid target'
+        if target.get('image_url'):
+            parsed = parse_image_url(target['image_url'])
+            path = upload_path(*parsed) if parsed else None
+            if path is None:
+                return None, 'Invalid image URL'
+            files.append(('/'.join(parsed), path))
+        elif target.get('album_name'):
+            article_folder = unquote(target['article_name']) if target.get('article_name') else None
+            files += album_zip_files(unquote(target['album_name']), article_folder)
+        else:
+            return None, 'Invalid target'
+
+    # Один файл может попасть в выборку и сам по себе, и в составе артикула
+    seen = set()
+    return [(name, path) for name, path in files if not (path in seen or seen.add(path))], None
+
+
+def content_disposition(filename):
+    """Content-Disposition с именем файла в UTF-8 (альбомы называются по-русски)"""
+    # Старые клиенты без filename* получают латинское имя
+    fallback = filename if filename.isascii() else 'download' + os.path.splitext(filename)[1]
+    fallback = fallback.replace('"', '').replace('\\', '')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+@app.route('/admin/download-album', methods=['GET', 'POST'])
+def download_album():
+    """
+    ZIP-архив оригиналов без сжатия, выдаваемый потоком прямо из uploads.
+
+    GET ?album=...[&article=...] - альбом или артикул; POST с полем targets
+    (JSON, формат /admin/delete-batch; форма или тело JSON) - выбранные изображения.
+    Поддерживает Range и If-Range: прерванную загрузку можно докачать.
+    """
+    try:
+        ensure_media_index()
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            targets = data.get('targets')
+            if targets is None and request.form.get('targets'):
+                targets = json.loads(request.form['targets'])
+            if not isinstance(targets, list) or not targets:
+                return jsonify({'error': 'No targets provided'}), 400
+            files, error = selection_zip_files(targets)
+            if error:
+                return jsonify({'error': error}), 400
+            download_name = 'selected_images.zip'
+        else:
+            album_folder = request.args.get('album')
+            article_folder = request.args.get('article') or None
+            folders = [album_folder] + ([article_folder] if article_folder else [])
+            if not album_folder or upload_path(*folders) is None:
+                return jsonify({'error': 'Album name is required'}), 400
+            files = album_zip_files(album_folder, article_folder)
+            download_name = f"{album_folder}_{article_folder}.zip" if article_folder else f"{album_folder}.zip"
+
+        if not files:
+            return jsonify({'error': 'No images found'}), 404
+
+        archive = ZipStream(files, Config.DOWNLOAD_CHUNK_SIZE)
+        etag = archive.etag
+        headers = {
+            'Content-Disposition': content_disposition(download_name),
+            'Accept-Ranges': 'bytes',
+            'ETag': f'"{etag}"',
+            # nginx не буферизует ответ во временный файл, а сразу передаёт клиенту
+            'X-Accel-Buffering': 'no'
+        }
+
+        # Один диапазон байт учитывается, только если архив не изменился с прошлой загрузки (If-Range);
+        # несколько диапазонов не поддерживаются - отдаётся весь архив
+        status, start, end = 200, 0, archive.size
+        if_range = request.headers.get('If-Range')
+        byte_range = request.range
+        if (byte_range and byte_range.units == 'bytes' and len(byte_range.ranges) == 1
+                and (not if_range or if_range.strip() == f'"{etag}"')):
+            bounds = byte_range.range_for_length(archive.size)
+            if bounds is None:
+                headers['Content-Range'] = f"bytes */{archive.size}"
+                return Response(status=416, headers=headers)
+            status, (start, end) = 206, bounds
+            headers['Content-Range'] = f"bytes {start}-{end - 1}/{archive.size}"
+        headers['Content-Length'] = str(end - start)
+
+        logger.info(f"Выдача ZIP {download_name}: файлов {len(archive.entries)}, "
+                    f"байт {end - start} из {archive.size}")
+        return Response(archive.iter_bytes(start, end), status=status, headers=headers,
+                        mimetype='application/zip', direct_passthrough=True)
+
+    except json.JSONDecodeError:
+        return jsonify({'error': 'Invalid targets'}), 400
+    except Exception as e:
+        logger.error(f"Ошибка выдачи ZIP: {e}")
+        return jsonify({'error': f'Ошибка при создании архива: {str(e)}'}), 500
 
 
 @app.route('/admin/delete-image', methods=['POST'])
@@ -603,55 +1402,17 @@ def delete_image():
             return jsonify({'error': 'No image URL provided'}), 400
 
         # Извлекаем путь из URL
-        base_path = f"{Config.BASE_URL}/images/"
-        if not image_url.startswith(base_path):
+        if not image_url.startswith(f"{Config.BASE_URL}/images/"):
             return jsonify({'error': 'Invalid image URL'}), 400
 
-        relative_path = image_url[len(base_path):]
-        decoded_path = unquote(relative_path)
-        path_parts = decoded_path.split('/')
-
-        if len(path_parts) < 3:
+        parsed = parse_image_url(image_url)
+        if parsed is None or upload_path(*parsed) is None:
             return jsonify({'error': 'Invalid image path'}), 400
 
-        template_folder = path_parts[0]
-        article_folder = path_parts[1]
-        filename = '/'.join(path_parts[2:])
-
-        # Полный путь к файлу
-        file_path = os.path.join(Config.UPLOAD_FOLDER, template_folder, article_folder, filename)
-
-        if not os.path.exists(file_path):
+        template_folder, article_folder, filename = parsed
+        if delete_image_files(template_folder, article_folder, [filename]):
             return jsonify({'error': 'File not found'}), 404
 
-        # Удаляем основной файл
-        os.remove(file_path)
-
-        # Пытаемся найти и удалить миниатюру
-        file_name_base = os.path.splitext(filename)[0]
-        thumb_variants = [
-            f"{file_name_base}_thumb.jpg",
-            f"{file_name_base}_thumb.jpeg",
-            f"{file_name_base}_thumb.png"
-        ]
-
-        for thumb_name in thumb_variants:
-            thumb_path = os.path.join(Config.UPLOAD_FOLDER, template_folder, article_folder, thumb_name)
-            if os.path.exists(thumb_path):
-                os.remove(thumb_path)
-                logger.info(f"Удалена миниатюра: {thumb_path}")
-
-        # Очистка пустых папок
-        article_folder_path = os.path.join(Config.UPLOAD_FOLDER, template_folder, article_folder)
-        if os.path.exists(article_folder_path) and not os.listdir(article_folder_path):
-            os.rmdir(article_folder_path)
-            logger.info(f"Удалена пустая папка артикула: {article_folder_path}")
-
-            template_folder_path = os.path.join(Config.UPLOAD_FOLDER, template_folder)
-            if os.path.exists(template_folder_path) and not os.listdir(template_folder_path):
-                os.rmdir(template_folder_path)
-                logger.info(f"Удалена пустая папка шаблона: {template_folder_path}")
-
         return jsonify({'success': True, 'message': 'Изображение и миниатюра удалены'})
 
     except Exception as e:
@@ -661,7 +1422,7 @@ def delete_image():
 
 @app.route('/admin/delete-album', methods=['POST'])
 def delete_album():
-    """Удаляет весь альбом со всеми артикулами и изображениями"""
+    """Удаляет весь альбом со всеми артикулами и изображениями (папка удаляется в фоне)"""
     try:
         data = request.get_json()
         if not data:
@@ -671,18 +1432,9 @@ def delete_album():
         if not album_name:
             return jsonify({'error': 'No album name provided'}), 400
 
-        # Безопасно декодируем имя альбома
-        album_folder = unquote(album_name)
-
-        # Полный путь к папке альбома
-        album_path = os.path.join(Config.UPLOAD_FOLDER, album_folder)
-
-        if not os.path.exists(album_path):
+        if not trash_folder(unquote(album_name)):
             return jsonify({'error': 'Album not found'}), 404
-
-        # Рекурсивно удаляем всю папку альбома
-        shutil.rmtree(album_path)
-        logger.info(f"Альбом удален: {album_path}")
+        trash.sweep_async()
 
         return jsonify({'success': True, 'message': f'Альбом "{album_name}" успешно удален'})
 
@@ -693,7 +1445,7 @@ def delete_album():
 
 @app.route('/admin/delete-article', methods=['POST'])
 def delete_article():
-    """Удаляет артикул со всеми изображениями из альбома"""
+    """Удаляет артикул со всеми изображениями из альбома (папка удаляется в фоне)"""
     try:
         data = request.get_json()
         if not data:
@@ -705,25 +1457,9 @@ def delete_article():
         if not album_name or not article_name:
             return jsonify({'error': 'Album name and article name are required'}), 400
 
-        # Безопасно декодируем имена
-        album_folder = unquote(album_name)
-        article_folder = unquote(article_name)
-
-        # Полный путь к папке артикула
-        article_path = os.path.join(Config.UPLOAD_FOLDER, album_folder, article_folder)
-
-        if not os.path.exists(article_path):
+        if not trash_folder(unquote(album_name), unquote(article_name)):
             return jsonify({'error': 'Article not found'}), 404
-
-        # Рекурсивно удаляем папку артикула
-        shutil.rmtree(article_path)
-        logger.info(f"Артикул удален: {article_path}")
-
-        # Проверяем, не пуста ли теперь папка альбома
-        album_path = os.path.join(Config.UPLOAD_FOLDER, album_folder)
-        if os.path.exists(album_path) and not os.listdir(album_path):
-            os.rmdir(album_path)
-            logger.info(f"Пустая папка альбома удалена: {album_path}")
+        trash.sweep_async()
 
         return jsonify(
             {'success': True, 'message': f'Артикул "{article_name}" успешно удален из альбома "{album_name}"'})
@@ -733,5 +1469,76 @@ def delete_article():
         return jsonify({'error': f'Ошибка при удалении артикула: {str(e)}'}), 500
 
 
+@app.cli.command('sweep-trash')
+def sweep_trash_command():
+    """Удаляет содержимое корзины uploads/.trash (если фоновая очистка не успела)"""
+    print(f"Удалено элементов: {trash.sweep()}")
+
+
+@app.cli.command('gc-blobs')
+def gc_blobs_command():
+    """Удаляет из хранилища дедупликации содержимое, на которое не осталось ссылок"""
+    if not blob_store:
+        print("Дедупликация отключена (DEDUP_ENABLED=0)")
+        return
+    print(f"Удалено блобов: {blob_store.gc()}")
+
+
+@app.cli.command('cleanup-results')
+def cleanup_results_command():
+    """Удаляет результаты загрузок старше RESULTS_TTL_DAYS и сверх RESULTS_MAX_MB, а также старые выгрузки"""
+    print(f"Удалено результатов: {results_store.cleanup()}")
+    print(f"Удалено выгрузок: {cleanup_exports()}")
+
+
+@app.cli.command('rebuild-index')
+def rebuild_index_command():
+    """Пересоздаёт индекс изображений по содержимому папки uploads"""
+    count = media_index.rebuild(Config.UPLOAD_FOLDER)
+    print(f"Индекс пересоздан, файлов: {count}")
+
+
+@app.cli.command('migrate-layout')
+@click.option('--flat', is_flag=True, help='Вернуть плоскую раскладку uploads/<альбом>/<артикул>/')
+@click.option('--dry-run', is_flag=True, help='Только посчитать артикулы, которые нужно перенести')
+def migrate_layout_command(flat, dry_run):
+    """
+    Переводит uploads в раскладку с шардами uploads/<альбом>/_<шард>/<артикул>/ на месте.
+    Публичные URL не меняются; после перевода включите STORAGE_SHARDED=1
+    """
+    moved = storage_layout.migrate(Config.UPLOAD_FOLDER, sharded=not flat, dry_run=dry_run)
+    print(f"{'Нужно перенести' if dry_run else 'Перенесено'} артикулов: {moved}")
+
+
+@app.cli.command('thumbnail-timing')
+@click.argument('paths', nargs=-1, required=True)
+def thumbnail_timing_command(paths):
+    """
+    Замер создания миниатюр по каждому файлу: с уменьшенным декодированием JPEG
+    и с полным декодированием (как раньше) для сравнения
+    """
+    totals = {'draft': 0.0, 'full': 0.0}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in paths:
+            targets = {name: os.path.join(tmp_dir, filename)
+                       for name, filename in derivative_filenames('sample').items()}
+            try:
+                _, fast = render_derivatives(path, targets)
+                _, full = render_derivatives(path, targets, use_draft=False)
+            except Exception as e:
+                print(f"{path}: ошибка {e}")
+                continue
+            totals['draft'] += fast['total_ms']
+            totals['full'] += full['total_ms']
+            print(f"{path}\n  draft: {format_timings(fast)}\n  полное: {format_timings(full)}")
+    if totals['draft']:
+        print(f"Итого: draft {totals['draft']:.1f} мс, полное декодирование {totals['full']:.1f} мс "
+              f"(x{totals['full'] / totals['draft']:.1f})")
+
+
 if __name__ == '__main__':
+    # В режиме разработки фоновые задачи обрабатываются в этом же процессе
+    # (в дочернем процессе перезагрузчика Werkzeug, чтобы не запускать воркеры дважды)
+    if Config.BACKGROUND_INGEST and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_workers()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+"""Воспроизводимые замеры производительности (python -m benchmarks.run --help)"""
@@ -0,0 +1,204 @@
+# benchmarks/concurrency.py
+"""
+Проверка отзывчивости сервера под долгими запросами.
+
+Запускает gunicorn с gunicorn_config.py (во временной рабочей папке) в каждом
+из режимов --modes и, пока «медленные клиенты» по байту передают тела запросов,
+а несколько запросов генерируют большие XLSX, замеряет задержку лёгкой страницы.
+В режиме sync медленные клиенты занимают все воркеры и лёгкие запросы ждут;
+в режиме gthread они должны обслуживаться без заметной задержки.
+
+    python -m benchmarks.concurrency
+    python -m benchmarks.concurrency --modes gthread --max-p95 0.5   # код выхода 1, если p95 выше
+
+Результаты - JSON (--output), как у benchmarks.run.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import synthetic  # noqa: E402
+
+PROBE_PATH = '/'
+HEAVY_PATH = '/admin/download-xlsx'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, threads, port, workdir):
+    """gunicorn с конфигурацией проекта; uploads, data и results - во временной папке"""
+    # Пути к XLSX шаблонам в Config относительные
+    templates_link = os.path.join(workdir, 'templates')
+    if not os.path.exists(templates_link):
+        os.symlink(os.path.join(ROOT, 'templates'), templates_link)
+    env = dict(os.environ,
+               GUNICORN_WORKER_CLASS=mode,
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               PYTHONPATH=ROOT)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', os.path.join(ROOT, 'gunicorn_config.py'),
+         '--bind', f"127.0.0.1:{port}", '--log-level', 'warning', 'app:app'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn завершился с кодом {process.returncode}")
+        try:
+            request('GET', port, PROBE_PATH, timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn не запустился за 60 секунд')
+
+
+def request(method, port, path, body=None, timeout=120):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def slow_client(port, body, seconds):
+    """Передаёт тело запроса по байту в течение seconds секунд (медленная загрузка)"""
+    interval = seconds / len(body)
+    with socket.create_connection(('127.0.0.1', port), timeout=seconds + 120) as sock:
+        sock.sendall((f"POST {HEAVY_PATH} HTTP/1.1\r\nHost: localhost\r\n"
+                      f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                      f"Connection: close\r\n\r\n").encode('ascii'))
+        for i in range(len(body)):
+            sock.sendall(body[i:i + 1])
+            time.sleep(interval)
+        while sock.recv(65536):
+            pass
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_mode(mode, args, workdir):
+    port = free_port()
+    server = start_server(mode, args.workers, args.threads, port, workdir)
+    try:
+        small_body = json.dumps({'template_name': 'В ячейку', 'image_data': synthetic.image_data(5, args.seed)},
+                                ensure_ascii=False).encode('utf-8')
+        heavy_body = json.dumps({'template_name': 'В строку',
+                                 'image_data': synthetic.image_data(args.xlsx_items, args.seed)},
+                                ensure_ascii=False).encode('utf-8')
+
+        heavy_times, heavy_failures = [], []
+
+        def heavy():
+            started = time.perf_counter()
+            if request('POST', port, HEAVY_PATH, heavy_body) != 200:
+                heavy_failures.append(1)
+            heavy_times.append(time.perf_counter() - started)
+
+        load = [threading.Thread(target=slow_client, args=(port, small_body, args.seconds), daemon=True)
+                for _ in range(args.slow_clients)]
+        load += [threading.Thread(target=heavy, daemon=True) for _ in range(args.xlsx_requests)]
+        for thread in load:
+            thread.start()
+        # Нагрузка успевает занять воркеры
+        time.sleep(0.5)
+
+        latencies, failures = [], 0
+        while any(thread.is_alive() for thread in load):
+            started = time.perf_counter()
+            try:
+                if request('GET', port, PROBE_PATH, timeout=args.seconds * 3) != 200:
+                    failures += 1
+            except OSError:
+                failures += 1
+            latencies.append(time.perf_counter() - started)
+            time.sleep(args.probe_interval)
+        for thread in load:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    result = {
+        'mode': mode,
+        'probes': len(latencies),
+        'probe_failures': failures,
+        'probe_p50': round(percentile(latencies, 0.5) or 0, 4),
+        'probe_p95': round(percentile(latencies, 0.95) or 0, 4),
+        'probe_max': round(max(latencies, default=0), 4),
+        'xlsx_seconds': [round(value, 3) for value in heavy_times],
+        'xlsx_failures': len(heavy_failures),
+        'xlsx_mean': round(statistics.mean(heavy_times), 3) if heavy_times else None
+    }
+    print(f"{mode:<8} запросов {result['probes']:>4}, ошибок {failures}, задержка p50 {result['probe_p50']:.3f} с, "
+          f"p95 {result['probe_p95']:.3f} с, макс {result['probe_max']:.3f} с; "
+          f"XLSX {result['xlsx_seconds']}, ошибок {result['xlsx_failures']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отзывчивость сервера под долгими запросами')
+    parser.add_argument('--modes', default='sync,gthread', help='Классы воркеров gunicorn через запятую')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='Потоков на воркер в режиме gthread')
+    parser.add_argument('--slow-clients', type=int, default=4, help='Медленных клиентов (по умолчанию 2 на воркер)')
+    parser.add_argument('--seconds', type=float, default=10, help='Сколько длится каждая медленная передача')
+    parser.add_argument('--xlsx-requests', type=int, default=2)
+    parser.add_argument('--xlsx-items', type=int, default=20000, help='Изображений в каждом XLSX')
+    parser.add_argument('--probe-interval', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-p95', type=float, help='Допустимая p95 задержка для последнего режима, секунды')
+    parser.add_argument('--output', help='Файл результатов (по умолчанию benchmarks/results/concurrency-<дата>.json)')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"concurrency-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    workdir = tempfile.mkdtemp(prefix='stashlinks-concurrency-')
+    try:
+        results = [run_mode(mode.strip(), args, workdir) for mode in args.modes.split(',') if mode.strip()]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+            'results': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты записаны в {output}")
+
+    if args.max_p95 is not None and results and results[-1]['probe_p95'] > args.max_p95:
+        print(f"p95 {results[-1]['probe_p95']:.3f} с больше допустимых {args.max_p95} с")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+# benchmarks/run.py
+"""
+Замеры производительности StashLinks на синтетических данных.
+
+Запуск из корня проекта:
+    python -m benchmarks.run                                  # все замеры на 1k/10k/100k изображений
+    python -m benchmarks.run --cases ingest,thumbnails --counts 1000
+    python -m benchmarks.run --baseline benchmarks/results/<прошлый запуск>.json
+
+Замеры:
+    ingest      - process_zip_archive_unlimited (процессов пула: INGEST_PROCESSES)
+    thumbnails  - создание миниатюр и превью (thumbnails.create_derivatives)
+    xlsx        - MegamarketGenerator и YandexmarketGenerator (оба разделителя), generate и generate_to;
+                  для сравнения те же строки в CSV и TSV (CsvGenerator)
+    listing     - страница архива, сводка и постраничный обход /admin/api/archive
+
+Для каждого замера записываются время, изображений в секунду и пиковая память
+(RSS процесса вместе с процессами пула). Все файлы создаются во временной папке;
+результаты - JSON в benchmarks/results/, его можно сравнить с прошлым запуском (--baseline).
+Прогон ingest и thumbnails на 100k изображений занимает десятки минут.
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import synthetic  # noqa: E402
+
+CASES = ('ingest', 'thumbnails', 'xlsx', 'listing')
+XLSX_VARIANTS = (('В строку', 'comma'), ('В ячейку', 'comma'), ('В ячейку', 'newline'))
+
+
+class PeakMemory:
+    """Пиковый RSS процесса и его дочерних процессов (пул миниатюр) за время замера"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rss(self):
+        total = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def measure(case, variant, count, function):
+    """Выполняет function() и возвращает строку результата"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with PeakMemory() as memory:
+            started = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - started
+    result = {
+        'case': case,
+        'variant': variant,
+        'count': count,
+        'seconds': round(seconds, 4),
+        'items_per_sec': round(count / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(memory.peak / 1024 ** 2, 1),
+        'rss_delta_mb': round((memory.peak - memory.baseline) / 1024 ** 2, 1)
+    }
+    print(f"{case:<11} {variant:<42} {count:>7}  {result['seconds']:>9.3f} с  "
+          f"{result['items_per_sec'] or 0:>10.1f} изобр./с  пик {result['peak_rss_mb']:>7.1f} МБ")
+    return result
+
+
+def prepare_workspace(workdir):
+    """
+    Переключает приложение на пустую временную папку (uploads, data, results)
+    до импорта app: его глобальные объекты создаются при импорте.
+    """
+    os.chdir(workdir)
+    from config import Config
+    Config.TEMPLATE_PATHS = {name: os.path.join(ROOT, path) for name, path in Config.TEMPLATE_PATHS.items()}
+    for folder in (Config.UPLOAD_FOLDER, Config.RESULTS_FOLDER, Config.STAGING_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+
+    import app
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+
+def run_ingest(app, count, seed, pool, workdir):
+    archive_path = os.path.join(workdir, f"bench_{count}.zip")
+    synthetic.build_archive(archive_path, count, seed, pool)
+    album = f"ingest_{count}"
+    try:
+        return [measure('ingest', f"processes={app.Config.INGEST_PROCESSES}", count,
+                        lambda: app.process_zip_archive_unlimited(archive_path, album))]
+    finally:
+        os.remove(archive_path)
+        shutil.rmtree(os.path.join(app.Config.UPLOAD_FOLDER, album), ignore_errors=True)
+
+
+def run_thumbnails(app, count, seed, pool, workdir):
+    from thumbnails import create_derivatives, derivative_filenames
+
+    sources_dir = os.path.join(workdir, 'thumb_sources')
+    targets_dir = os.path.join(workdir, 'thumb_targets')
+    os.makedirs(sources_dir, exist_ok=True)
+    os.makedirs(targets_dir, exist_ok=True)
+    sources = []
+    for i, (extension, data) in enumerate(pool):
+        path = os.path.join(sources_dir, f"source_{i}.{extension}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        sources.append(path)
+
+    def render_all():
+        for i in range(count):
+            names = derivative_filenames(f"image_{i}")
+            create_derivatives(sources[i % len(sources)],
+                               {name: os.path.join(targets_dir, filename) for name, filename in names.items()})
+
+    try:
+        return [measure('thumbnails', ','.join(app.Config.THUMBNAIL_SIZES), count, render_all)]
+    finally:
+        shutil.rmtree(sources_dir, ignore_errors=True)
+        shutil.rmtree(targets_dir, ignore_errors=True)
+
+
+def run_xlsx(app, count, seed, pool, workdir):
+    from generators import GeneratorFactory
+
+    items = synthetic.image_data(count, seed, app.Config.BASE_URL)
+    results = []
+    for template_name, separator in XLSX_VARIANTS:
+        generator = GeneratorFactory.create_generator(template_name, separator)
+        name = type(generator).__name__
+        results.append(measure('xlsx', f"{name}/{separator}/generate", count,
+                               lambda: generator.generate(items, template_name)))
+        with tempfile.TemporaryFile(dir=workdir) as output:
+            results.append(measure('xlsx', f"{name}/{separator}/generate_to", count,
+                                   lambda: generator.generate_to(output, items, template_name)))
+        for file_format in ('csv', 'tsv'):
+            text_generator = GeneratorFactory.create_generator(template_name, separator, file_format)
+            with tempfile.TemporaryFile(dir=workdir) as output:
+                results.append(measure('xlsx', f"{name}/{separator}/{file_format}", count,
+                                       lambda: text_generator.generate_to(output, items, template_name)))
+    return results
+
+
+def run_listing(app, count, seed, pool, workdir):
+    album = f"listing_{count}"
+    app.media_index.rebuild(app.Config.UPLOAD_FOLDER)
+    app.media_index.add_images(synthetic.index_rows(count, seed, album))
+    client = app.app.test_client()
+
+    def get(url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status_code}")
+        return response
+
+    def walk_pages():
+        cursor = ''
+        while True:
+            data = get(f"/admin/api/archive?album={album}&limit={app.Config.ARCHIVE_MAX_PAGE_SIZE}"
+                       f"&cursor={cursor}").get_json()
+            if not data['next_cursor']:
+                break
+            cursor = data['next_cursor']
+
+    try:
+        return [
+            measure('listing', 'archive_page', count, lambda: get('/admin/archive')),
+            measure('listing', 'summary', count, lambda: get('/admin/api/archive/summary')),
+            measure('listing', 'api_pages', count, walk_pages)
+        ]
+    finally:
+        app.media_index.remove_album(album)
+
+
+RUNNERS = {
+    'ingest': run_ingest,
+    'thumbnails': run_thumbnails,
+    'xlsx': run_xlsx,
+    'listing': run_listing
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Печатает отношение скорости к прошлому запуску"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['case'], r['variant'], r['count']): r for r in json.load(f)['results']}
+    print(f"\nСравнение с {baseline_path}:")
+    for result in results:
+        previous = baseline.get((result['case'], result['variant'], result['count']))
+        if not previous or not previous['seconds']:
+            continue
+        ratio = previous['seconds'] / result['seconds'] if result['seconds'] else 0
+        print(f"{result['case']:<11} {result['variant']:<42} {result['count']:>7}  "
+              f"x{ratio:.2f} скорость, память {previous['peak_rss_mb']} -> {result['peak_rss_mb']} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности StashLinks')
+    parser.add_argument('--cases', default=','.join(CASES), help=f"Через запятую из: {', '.join(CASES)}")
+    parser.add_argument('--counts', default='1000,10000,100000', help='Количество изображений через запятую')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Файл результатов (по умолчанию benchmarks/results/<дата>.json)')
+    parser.add_argument('--baseline', help='Результаты прошлого запуска для сравнения')
+    parser.add_argument('--workdir', help='Рабочая папка (по умолчанию временная, удаляется после запуска)')
+    args = parser.parse_args()
+
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"Неизвестные замеры: {', '.join(sorted(unknown))}")
+    counts = [int(count) for count in args.counts.split(',')]
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    output = os.path.abspath(output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='stashlinks-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    if not args.workdir:
+        # Удаляется при выходе, после последней записи метрик процесса (atexit выполняет в обратном порядке)
+        atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    try:
+        app = prepare_workspace(workdir)
+        pool = synthetic.image_pool(args.seed)
+        results = []
+        for count in counts:
+            for case in cases:
+                results.extend(RUNNERS[case](app, count, args.seed, pool, workdir))
+    finally:
+        os.chdir(ROOT)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'config': {
+            'INGEST_PROCESSES': app.Config.INGEST_PROCESSES,
+            'THUMBNAIL_SIZES': app.Config.THUMBNAIL_SIZES,
+            'DEDUP_ENABLED': app.Config.DEDUP_ENABLED,
+            'XLSX_STREAMING': app.Config.XLSX_STREAMING
+        },
+        'results': results
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты записаны в {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
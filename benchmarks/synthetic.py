@@ -0,0 +1,116 @@
+# benchmarks/synthetic.py
+"""
+Синтетические данные для замеров: ZIP-архивы в раскладке «папка на артикул»,
+изображения JPEG/PNG/WebP разных разрешений, строки для XLSX и индекса.
+Всё определяется seed, поэтому повторный запуск даёт те же данные.
+"""
+import io
+import random
+import time
+import zipfile
+
+from PIL import Image, ImageDraw
+
+# Разрешения и форматы примерно как у фотографий товаров
+RESOLUTIONS = ((800, 600), (1200, 1200), (1600, 1200), (1200, 1600), (3000, 2000))
+FORMATS = ('JPEG', 'JPEG', 'JPEG', 'PNG', 'WEBP')
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+IMAGES_PER_ARTICLE = (1, 8)
+
+
+def render_image(rng, size, image_format):
+    """Закодированное изображение с шумом и фигурами (чтобы сжатие было похоже на настоящее)"""
+    width, height = size
+    mode = 'RGBA' if image_format == 'PNG' else 'RGB'
+    img = Image.effect_noise((width // 4, height // 4), rng.randint(20, 80)).resize(size).convert(mode)
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = tuple(rng.randrange(256) for _ in range(len(mode)))
+        draw.rectangle((x, y, x + rng.randint(50, width // 2), y + rng.randint(50, height // 2)), fill=color)
+
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        img.save(buffer, 'JPEG', quality=88)
+    else:
+        img.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def image_pool(seed, variants=24):
+    """
+    Набор готовых закодированных изображений [(расширение, байты)].
+    Архивы собираются из него: кодирование тысяч уникальных картинок заняло бы больше времени, чем сам замер.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for i in range(variants):
+        image_format = FORMATS[i % len(FORMATS)]
+        size = RESOLUTIONS[rng.randrange(len(RESOLUTIONS))]
+        pool.append((EXTENSIONS[image_format], render_image(rng, size, image_format)))
+    return pool
+
+
+def articles_layout(count, seed):
+    """[(артикул, номер изображения)] на count изображений, 1-8 изображений на артикул"""
+    rng = random.Random(seed)
+    layout = []
+    article_num = 0
+    while len(layout) < count:
+        article = f"{4296000000 + article_num}"
+        article_num += 1
+        for position in range(1, rng.randint(*IMAGES_PER_ARTICLE) + 1):
+            layout.append((article, position))
+            if len(layout) == count:
+                break
+    return layout
+
+
+def build_archive(path, count, seed, pool=None):
+    """
+    Архив из count изображений: <артикул>/<артикул>_<номер>.<расширение>.
+    Изображения сохраняются без сжатия (ZIP_STORED), как обычно упаковывают уже сжатые фото.
+    """
+    pool = pool or image_pool(seed)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    total_bytes = 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zip_ref:
+        for article, position in articles_layout(count, seed):
+            extension, data = pool[rng.randrange(len(pool))]
+            zip_ref.writestr(f"{article}/{article}_{position}.{extension}", data)
+            total_bytes += len(data)
+    return {'files': count, 'bytes': total_bytes, 'build_seconds': time.perf_counter() - started}
+
+
+def image_data(count, seed, base_url='http://tecnobook'):
+    """Элементы результатов загрузки (как у /admin/download-xlsx) на count изображений"""
+    rng = random.Random(seed)
+    items = []
+    for article, position in articles_layout(count, seed):
+        filename = f"{article}_{position}_{rng.getrandbits(24):06x}.jpg"
+        url = f"{base_url}/images/bench/{article}/{filename}"
+        items.append({
+            'url': url,
+            'article': article,
+            'filename': filename,
+            'thumbnail_url': url.replace('.jpg', '_thumb.jpg'),
+            'preview_url': url.replace('.jpg', '_preview.jpg')
+        })
+    return items
+
+
+def index_rows(count, seed, album='bench'):
+    """Строки индекса изображений (MediaIndex.add_images) на count изображений"""
+    now = time.time()
+    return [{
+        'album': album,
+        'article': item['article'],
+        'filename': item['filename'],
+        'order_num': int(item['filename'].split('_')[1]),
+        'has_thumb': 1,
+        'has_preview': 1,
+        'size': 250000,
+        'mtime': now
+    } for item in image_data(count, seed)]
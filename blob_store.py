@@ -0,0 +1,121 @@
+# blob_store.py
+"""
+Хранилище оригиналов и миниатюр по хешу содержимого (дедупликация).
+
+Каждое уникальное содержимое хранится один раз в uploads/.blobs/<ab>/<cd>/<sha256>,
+а файлы в uploads/<альбом>/<артикул>/ - жёсткие ссылки на него. Миниатюры и превью
+хранятся рядом как <sha256>_<размер>.jpg. Публичные
+URL /images/... не меняются, nginx отдаёт файлы как обычно.
+Блоб без внешних ссылок (st_nlink == 1) удаляется командой
+flask --app app gc-blobs.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    def __init__(self, root, copy_buffer=1024 * 1024):
+        self.root = root
+        self.copy_buffer = copy_buffer
+        self.tmp_folder = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_folder, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def derivative_path(self, digest, name):
+        # WebP/AVIF версии ('thumb.webp', 'original.avif') - со своим расширением
+        if '.' in name:
+            return f"{self.blob_path(digest)}_{name}"
+        return f"{self.blob_path(digest)}_{name}.jpg"
+
+    @staticmethod
+    def link_or_copy(source, target):
+        """Жёсткая ссылка; если файловая система не позволяет - обычная копия"""
+        try:
+            os.link(source, target)
+        except OSError as e:
+            logger.debug(f"Жёсткая ссылка {source} -> {target} невозможна ({e}), копируем")
+            shutil.copyfile(source, target)
+
+    def store(self, source, target_path):
+        """
+        Сохраняет содержимое source (путь или файловый объект) и создаёт target_path.
+        Возвращает (sha256, существовал_ли_блоб).
+        """
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.tmp_folder, uuid.uuid4().hex)
+        try:
+            if isinstance(source, str):
+                source_file = open(source, 'rb')
+            else:
+                source_file = source
+            try:
+                with open(tmp_path, 'wb') as tmp_file:
+                    while True:
+                        chunk = source_file.read(self.copy_buffer)
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        tmp_file.write(chunk)
+            finally:
+                if source_file is not source:
+                    source_file.close()
+
+            hex_digest = digest.hexdigest()
+            blob = self.blob_path(hex_digest)
+            existed = os.path.exists(blob)
+            if existed:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(tmp_path, blob)
+
+            self.link_or_copy(blob, target_path)
+            return hex_digest, existed
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def reuse_derivative(self, digest, name, target):
+        """Ставит ссылку на уже созданную миниатюру (превью) этого содержимого; False, если её нет"""
+        derivative = self.derivative_path(digest, name)
+        if not os.path.exists(derivative):
+            return False
+        try:
+            self.link_or_copy(derivative, target)
+            return True
+        except OSError as e:
+            logger.warning(f"Не удалось использовать готовую миниатюру {derivative}: {e}")
+            return False
+
+    def remember_derivative(self, digest, name, source):
+        """Сохраняет созданную миниатюру (превью) в хранилище для повторного использования"""
+        derivative = self.derivative_path(digest, name)
+        try:
+            os.link(source, derivative)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            logger.debug(f"Миниатюра {source} не добавлена в хранилище: {e}")
+
+    def gc(self):
+        """Удаляет блобы и миниатюры, на которые больше не ссылается ни один файл в uploads"""
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if os.path.abspath(dirpath) == os.path.abspath(self.tmp_folder):
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.stat(path).st_nlink <= 1:
+                        os.remove(path)
+                        removed += 1
+                except OSError as e:
+                    logger.warning(f"Ошибка очистки блоба {path}: {e}")
+        logger.info(f"Удалено неиспользуемых блобов: {removed}")
+        return removed
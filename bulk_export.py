@@ -0,0 +1,224 @@
+# bulk_export.py
+"""
+Выгрузка ссылок нескольких альбомов одной задачей (фоновая очередь, jobs.py).
+
+bundle='workbook' - одна книга XLSX, по листу на альбом. Данные альбомов
+(выборка из индекса, группировка и сортировка по артикулам) готовятся
+параллельно в пуле из EXPORT_WORKERS потоков, а листы записываются в
+write-only книгу по порядку, по мере готовности: запись листа совмещена
+с подготовкой следующих. Оформление шаблона разбирается один раз.
+
+bundle='zip' - ZIP с отдельным файлом (XLSX, CSV или TSV) на альбом; файлы
+создаются параллельно в пуле процессов cpu_executor.
+
+Готовые файлы лежат в EXPORTS_FOLDER и удаляются через RESULTS_TTL.
+"""
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl import Workbook
+
+from config import Config
+from generators import GeneratorFactory, write_export
+
+logger = logging.getLogger(__name__)
+
+BUNDLES = ('workbook', 'zip')
+# Символы, недопустимые в названии листа Excel; длина названия - не больше 31 символа
+SHEET_TITLE_FORBIDDEN = re.compile(r'[\[\]:*?/\\]')
+SHEET_TITLE_MAX = 31
+# Символы, недопустимые в именах файлов внутри ZIP (Windows)
+FILENAME_FORBIDDEN = re.compile(r'[\\/:*?"<>|]')
+
+
+def sheet_title(name, used):
+    """Название листа для альбома: допустимое в Excel и уникальное (без учёта регистра)"""
+    base = SHEET_TITLE_FORBIDDEN.sub('_', name).strip("'") or 'Альбом'
+    title = base[:SHEET_TITLE_MAX]
+    number = 2
+    while title.lower() in used:
+        suffix = f" ({number})"
+        title = base[:SHEET_TITLE_MAX - len(suffix)] + suffix
+        number += 1
+    used.add(title.lower())
+    return title
+
+
+def export_path(export_id, file_format, bundle):
+    """
+    Абсолютный путь готовой выгрузки: send_file считает относительные пути от папки
+    приложения, а EXPORTS_FOLDER задан относительно рабочей папки
+    """
+    extension = 'zip' if bundle == 'zip' else file_format
+    return os.path.abspath(os.path.join(Config.EXPORTS_FOLDER, f"{export_id}.{extension}"))
+
+
+def find_export(export_id):
+    """Абсолютный путь к готовой выгрузке по id; None, если её нет"""
+    for extension in ('xlsx', 'zip'):
+        path = export_path(export_id, extension, extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def cleanup_exports(ttl=None):
+    """Удаляет выгрузки старше ttl секунд (0 - хранить бессрочно). Возвращает число удалённых"""
+    ttl = Config.RESULTS_TTL if ttl is None else ttl
+    if not ttl or not os.path.isdir(Config.EXPORTS_FOLDER):
+        return 0
+    removed = 0
+    now = time.time()
+    with os.scandir(Config.EXPORTS_FOLDER) as entries:
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime <= ttl:
+                    continue
+                # Временные папки прерванных выгрузок удаляются вместе с готовыми файлами
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    if removed:
+        logger.info(f"Удалено устаревших выгрузок: {removed}")
+    return removed
+
+
+def map_window(pool, fn, items, window):
+    """
+    Как pool.map, но в работе не больше window элементов: следующий отправляется
+    в пул, когда забирают результат предыдущего. Результаты - по порядку items.
+    """
+    items = iter(items)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(fn, *item))
+            if len(pending) >= window:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for item in items:
+                pending.append(pool.submit(fn, *item))
+                break
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class AlbumExport:
+    """
+    Выгрузка альбомов albums. load_items(album) возвращает изображения альбома
+    в формате элементов результатов ({'url', 'article', 'order', ...}).
+    progress(images_done, images_total, error=None) - как у обработчиков задач.
+    """
+
+    def __init__(self, albums, template_name, separator='comma', file_format='xlsx', bundle='workbook',
+                 load_items=None, executor=None, workers=None):
+        self.albums = albums
+        self.template_name = template_name
+        self.separator = separator
+        self.file_format = file_format
+        # CSV/TSV не умеют несколько листов - каждый альбом отдельным файлом
+        self.bundle = bundle if file_format == 'xlsx' else 'zip'
+        self.load_items = load_items
+        # Пул процессов для файлов альбомов (CpuExecutor); без него - в потоках пула
+        self.executor = executor
+        self.workers = workers or Config.EXPORT_WORKERS
+
+    def run(self, output, totals, progress):
+        """
+        Записывает выгрузку в output. totals - {альбом: изображений} для общего прогресса.
+        Возвращает (изображений, альбомов без изображений).
+        """
+        self.images_total = sum(totals.get(album, 0) for album in self.albums)
+        self.images_done = 0
+        self.progress = progress
+        progress(0, self.images_total)
+        if self.bundle == 'zip':
+            return self._write_zip(output)
+        return self._write_workbook(output)
+
+    def _album_done(self, album, count, error=None):
+        self.images_done += count
+        self.progress(self.images_done, max(self.images_total, self.images_done),
+                      {'album': album, 'error': error} if error else None)
+
+    def _grouped(self, album):
+        """Изображения альбома, сгруппированные по артикулам (выполняется в пуле потоков)"""
+        generator = GeneratorFactory.create_generator(self.template_name, self.separator)
+        items = self.load_items(album)
+        return generator, generator.process_image_data(items), len(items)
+
+    def _write_workbook(self, output):
+        wb = Workbook(write_only=True)
+        used_titles = set()
+        images, empty = 0, []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export') as pool:
+            # Альбомы по порядку; пока пишется текущий лист, готовятся не больше workers следующих,
+            # поэтому в памяти данные лишь нескольких альбомов
+            grouped = map_window(pool, self._grouped, ((album,) for album in self.albums), self.workers)
+            for album, (generator, articles, count) in zip(self.albums, grouped):
+                if not articles:
+                    empty.append(album)
+                    self._album_done(album, 0, 'Нет изображений')
+                    continue
+                generator.prepare(articles)
+                generator.write_sheet(wb, generator.load_template_layout(), articles, self.template_name,
+                                      sheet_title(album, used_titles))
+                images += count
+                self._album_done(album, count)
+
+        if not used_titles:
+            raise ValueError('В выбранных альбомах нет изображений')
+        wb.save(output)
+        return images, empty
+
+    def _album_file(self, folder, number, album):
+        """Файл одного альбома во временной папке; генерация - в пуле процессов"""
+        items = self.load_items(album)
+        if not items:
+            return None, 0
+        path = os.path.join(folder, f"{number}.{self.file_format}")
+        args = (path, items, self.template_name, self.separator, self.file_format)
+        if self.executor is not None:
+            self.executor.run(write_export, *args)
+        else:
+            write_export(*args)
+        return path, len(items)
+
+    def _write_zip(self, output):
+        # XLSX уже сжат; CSV/TSV сжимаются хорошо
+        compression = zipfile.ZIP_STORED if self.file_format == 'xlsx' else zipfile.ZIP_DEFLATED
+        images, empty = 0, []
+        folder = tempfile.mkdtemp(prefix='export-', dir=Config.EXPORTS_FOLDER)
+        try:
+            with zipfile.ZipFile(output, 'w', compression) as archive, \
+                    ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export') as pool:
+                files = map_window(pool, self._album_file,
+                                   ((folder, number, album) for number, album in enumerate(self.albums)), self.workers)
+                for album, (path, count) in zip(self.albums, files):
+                    if path is None:
+                        empty.append(album)
+                        self._album_done(album, 0, 'Нет изображений')
+                        continue
+                    archive.write(path, f"{FILENAME_FORBIDDEN.sub('_', album)}.{self.file_format}")
+                    os.remove(path)
+                    images += count
+                    self._album_done(album, count)
+            if not images:
+                raise ValueError('В выбранных альбомах нет изображений')
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        return images, empty
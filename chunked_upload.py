@@ -0,0 +1,202 @@
+# chunked_upload.py
+"""
+Докачиваемая загрузка больших архивов частями.
+
+Клиент создаёт сессию, затем отправляет части (PUT с offset и контрольной
+суммой SHA-256) в файл data/staging/<id>.part. Принятыми считаются только
+проверенные части, идущие подряд от начала файла, поэтому после обрыва
+соединения загрузка продолжается с последнего подтверждённого смещения.
+Готовый файл переименовывается в <id>.zip и передаётся обработке архивов
+без повторного копирования.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_PATTERN = re.compile(r'^[a-f0-9]{32}$')
+CHECKSUM_PATTERN = re.compile(r'^[a-fA-F0-9]{64}$')
+
+
+class UploadError(Exception):
+    """Ошибка сессии загрузки; status - HTTP-код ответа, received - подтверждённое смещение"""
+
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+class ChunkedUploads:
+    """Сессии докачиваемой загрузки в папке staging (общей для всех процессов)"""
+
+    def __init__(self, folder=None):
+        self.folder = folder or Config.STAGING_FOLDER
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError('Загрузка не найдена', 404)
+        base = os.path.join(self.folder, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    @staticmethod
+    def _save_meta(meta_path, session):
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    @staticmethod
+    def _load_meta(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Загрузка не найдена или срок её действия истёк', 404)
+
+    def create(self, filename, size, album_name=''):
+        """Создаёт сессию загрузки файла заданного размера"""
+        if not filename or not filename.lower().endswith('.zip'):
+            raise UploadError('Файл должен быть ZIP архивом')
+        if size <= 0:
+            raise UploadError('Пустой файл')
+        if size > Config.MAX_CONTENT_LENGTH:
+            raise UploadError('Файл превышает допустимый размер', 413)
+
+        self.cleanup_stale()
+
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        session = {
+            'id': upload_id,
+            'filename': filename,
+            'album_name': album_name,
+            'size': size,
+            'received': 0,
+            'created_at': time.time(),
+            'updated_at': time.time()
+        }
+        open(part_path, 'wb').close()
+        self._save_meta(meta_path, session)
+        logger.info(f"Создана загрузка {upload_id}: {filename}, {size} байт")
+        return session
+
+    def get(self, upload_id):
+        meta_path, _ = self._paths(upload_id)
+        return self._load_meta(meta_path)
+
+    def write_chunk(self, upload_id, offset, stream, length, checksum):
+        """
+        Записывает часть длиной length со смещения offset; checksum - SHA-256 части (обязательна).
+        Часть сначала читается во временный буфер и проверяется (длина, SHA-256);
+        в файл загрузки попадают только проверенные байты после уже подтверждённого
+        смещения, поэтому повтор принятой части не меняет принятые данные. Смещение
+        не может быть больше подтверждённого (без дыр). Возвращает сессию.
+        """
+        meta_path, part_path = self._paths(upload_id)
+        if length <= 0 or length > Config.UPLOAD_MAX_CHUNK_SIZE:
+            raise UploadError(f'Размер части должен быть от 1 до {Config.UPLOAD_MAX_CHUNK_SIZE} байт')
+        if not checksum or not CHECKSUM_PATTERN.match(checksum):
+            raise UploadError('Нужна контрольная сумма части: SHA-256 в заголовке X-Chunk-Sha256')
+        # Сессия должна существовать до чтения тела запроса
+        self._load_meta(meta_path)
+
+        # Части до UPLOAD_CHUNK_SIZE остаются в памяти, большие - во временном файле staging
+        with tempfile.SpooledTemporaryFile(max_size=Config.UPLOAD_CHUNK_SIZE, dir=self.folder) as buffer:
+            digest = hashlib.sha256()
+            received = 0
+            while received < length:
+                chunk = stream.read(min(Config.INGEST_COPY_BUFFER, length - received))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                buffer.write(chunk)
+                received += len(chunk)
+
+            with open(part_path, 'r+b') as part_file:
+                # Части одной загрузки из разных воркеров записываются по очереди
+                fcntl.flock(part_file, fcntl.LOCK_EX)
+                session = self._load_meta(meta_path)
+                if received != length:
+                    raise UploadError('Часть получена не полностью', 400, session['received'])
+                if digest.hexdigest() != checksum.lower():
+                    raise UploadError('Контрольная сумма части не совпадает', 422, session['received'])
+                if offset < 0 or offset > session['received']:
+                    raise UploadError('Неверное смещение части', 409, session['received'])
+                if offset + length > session['size']:
+                    raise UploadError('Часть выходит за пределы файла', 409, session['received'])
+
+                # Уже подтверждённые байты не перезаписываются: из повтора берётся только новый хвост
+                accepted = max(session['received'] - offset, 0)
+                buffer.seek(accepted)
+                part_file.seek(offset + accepted)
+                shutil.copyfileobj(buffer, part_file, Config.INGEST_COPY_BUFFER)
+                part_file.flush()
+
+                # Данные на диске до того, как смещение будет подтверждено клиенту
+                os.fsync(part_file.fileno())
+                session['received'] = max(session['received'], offset + length)
+                session['updated_at'] = time.time()
+                self._save_meta(meta_path, session)
+                return session
+
+    def complete(self, upload_id, check=None):
+        """
+        Завершает загрузку: возвращает (путь к готовому архиву, сессия).
+        check(путь к собранному файлу) вызывается до завершения: если он бросает исключение,
+        загрузка остаётся как есть и её можно завершить повторно.
+        """
+        meta_path, part_path = self._paths(upload_id)
+        with open(part_path, 'r+b') as part_file:
+            fcntl.flock(part_file, fcntl.LOCK_EX)
+            session = self._load_meta(meta_path)
+            if session['received'] != session['size']:
+                raise UploadError('Файл загружен не полностью', 409, session['received'])
+            # Последняя неудачная попытка могла записать лишние байты за концом файла
+            part_file.truncate(session['size'])
+            if check:
+                part_file.flush()
+                check(part_path)
+            archive_path = os.path.join(self.folder, f"{upload_id}.zip")
+            os.replace(part_path, archive_path)
+            os.remove(meta_path)
+        logger.info(f"Загрузка {upload_id} завершена: {session['filename']}")
+        return archive_path, session
+
+    def abort(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        self._load_meta(meta_path)
+        for path in (meta_path, part_path):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"Загрузка {upload_id} отменена")
+
+    def cleanup_stale(self, max_age=None):
+        """Удаляет незавершённые загрузки, которые давно не обновлялись"""
+        max_age = max_age or Config.UPLOAD_SESSION_TTL
+        now = time.time()
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                if now - entry.stat().st_mtime < max_age:
+                    continue
+                upload_id = entry.name[:-len('.json')]
+                meta_path, part_path = self._paths(upload_id)
+                for path in (meta_path, part_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                logger.info(f"Удалена незавершённая загрузка {upload_id}")
+            except (OSError, UploadError) as e:
+                logger.warning(f"Ошибка очистки загрузки {entry.name}: {e}")
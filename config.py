@@ -6,8 +6,91 @@ class Config:
     SECRET_KEY = 'your-secret-key-here'
     UPLOAD_FOLDER = 'uploads'
     RESULTS_FOLDER = 'results'  # <-- Добавляем папку для результатов
+    # Результаты загрузок (gzip): срок хранения, предельный размер папки, кэш в памяти процесса
+    RESULTS_TTL = int(os.getenv('RESULTS_TTL_DAYS', '30')) * 24 * 3600  # 0 - хранить бессрочно
+    RESULTS_MAX_BYTES = int(os.getenv('RESULTS_MAX_MB', '1024')) * 1024 * 1024  # 0 - без ограничения
+    RESULTS_CACHE_SIZE = 8  # Недавно открытых результатов в памяти
+    RESULTS_COMPRESSLEVEL = 6
+    RESULTS_CLEANUP_INTERVAL = 3600  # Секунд между очистками при сохранении
+    DATA_FOLDER = 'data'  # Служебные данные: очередь задач, временные архивы
+    STAGING_FOLDER = os.path.join(DATA_FOLDER, 'staging')
+    JOBS_DB = os.path.join(DATA_FOLDER, 'jobs.db')
+    INDEX_DB = os.path.join(DATA_FOLDER, 'index.db')  # Индекс загруженных изображений
+    # Метрики (/admin/metrics): файлы процессов, период их записи и срок, после которого
+    # файл завершённого процесса переносится в общий итог
+    METRICS_FOLDER = os.path.join(DATA_FOLDER, 'metrics')
+    METRICS_FLUSH_INTERVAL = 5
+    METRICS_RETIRE_AFTER = 300
+    ARCHIVE_PAGE_SIZE = 200  # Изображений на страницу в /admin/api/archive
+    ARCHIVE_MAX_PAGE_SIZE = 1000
     MAX_CONTENT_LENGTH = 15 * 1024 * 1024 * 1024  # 15G max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    # Параллельная обработка архивов: 0 - последовательно, N - пул из N процессов
+    INGEST_PROCESSES = int(os.getenv('INGEST_PROCESSES', '0'))
+    # Сколько файлов на один процесс может ожидать обработки (ограничивает место во временной папке)
+    INGEST_QUEUE_PER_PROCESS = 4
+    # Файлы архива до этого размера читаются в память один раз (оригинал + миниатюра)
+    INGEST_MEMORY_BUFFER = 64 * 1024 * 1024
+    INGEST_COPY_BUFFER = 1024 * 1024
+    # Проверка оглавления архива до распаковки (zip_scan.py); 0 - без ограничения
+    ZIP_MAX_FILES = int(os.getenv('ZIP_MAX_FILES', '200000'))
+    ZIP_MAX_UNCOMPRESSED = int(os.getenv('ZIP_MAX_UNCOMPRESSED_GB', '100')) * 1024 ** 3  # Изображений после распаковки
+    ZIP_MAX_RATIO = int(os.getenv('ZIP_MAX_RATIO', '100'))  # Во сколько раз может быть сжат один файл
+    ZIP_RATIO_MIN_SIZE = 1024 * 1024  # Степень сжатия файлов меньше этого не проверяется
+    ZIP_MIN_IMAGE_SHARE = float(os.getenv('ZIP_MIN_IMAGE_SHARE', '0'))  # Доля изображений среди файлов архива
+
+    # Миниатюры создаются за одно декодирование оригинала: имя размера -> (ширина, высота),
+    # файл <оригинал>_<имя>.jpg. thumb - список ссылок, preview - просмотр в модальном окне.
+    # Формат переменной окружения: "thumb:90,preview:1024"
+    THUMBNAIL_SIZES = {
+        name.strip(): (int(px), int(px))
+        for name, px in (item.split(':') for item in os.getenv('THUMBNAIL_SIZES', 'thumb:90,preview:1024').split(','))
+    }
+    THUMBNAIL_SIZES.setdefault('thumb', (90, 90))
+    THUMBNAIL_QUALITY = 70
+    # WebP/AVIF версии оригинала и миниатюр (<файл>.webp, <файл>.avif) для отдачи через nginx
+    # по заголовку Accept. Формат переменной окружения: "webp,avif"; пусто - не создаются
+    MODERN_FORMATS = [fmt.strip().lower() for fmt in os.getenv('MODERN_FORMATS', '').split(',') if fmt.strip()]
+
+    # Дедупликация: одинаковое содержимое хранится один раз в uploads/.blobs,
+    # файлы альбомов - жёсткие ссылки на него, миниатюры создаются один раз
+    DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', '0') == '1'
+    BLOBS_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+    # Раскладка uploads/<альбом>/_<шард>/<артикул>/ для альбомов с тысячами артикулов (storage_layout.py);
+    # шард - первые STORAGE_SHARD_CHARS знаков md5 имени артикула. Существующие папки переводит
+    # flask --app app migrate-layout
+    STORAGE_SHARDED = os.getenv('STORAGE_SHARDED', '0') == '1'
+    STORAGE_SHARD_CHARS = int(os.getenv('STORAGE_SHARD_CHARS', '2'))
+    # Удалённые альбомы и артикулы переносятся сюда и удаляются в фоне
+    TRASH_FOLDER = os.path.join(UPLOAD_FOLDER, '.trash')
+    DELETE_BATCH_MAX = 10000  # Целей в одном запросе /admin/delete-batch
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Буфер чтения файлов при выдаче ZIP /admin/download-album
+
+    # Фоновая обработка архивов: POST /admin сразу возвращает id задачи,
+    # архив обрабатывает отдельный воркер (python worker.py)
+    BACKGROUND_INGEST = os.getenv('BACKGROUND_INGEST', '1') == '1'
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))  # Потоков в одном процессе воркера
+    JOB_POLL_INTERVAL = 1.0  # Секунд между проверками пустой очереди
+    JOB_PROGRESS_INTERVAL = 1.0  # Как часто записывать прогресс задачи
+    JOB_STALE_SECONDS = 600  # Задача без обновлений дольше этого считается прерванной
+
+    # Допуск обработки архивов по ресурсам (admission.py): архив резервирует место и память
+    # по оглавлению и ждёт в очереди, пока резерв не поместится в лимиты
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+    ADMISSION_DB = os.path.join(DATA_FOLDER, 'admission.db')
+    ADMISSION_MAX_ACTIVE = int(os.getenv('ADMISSION_MAX_ACTIVE', '2'))  # Обработок одновременно
+    ADMISSION_QUEUE_MAX = int(os.getenv('ADMISSION_QUEUE_MAX', '10'))  # Ожидающих; следующие загрузки получают 503
+    ADMISSION_MEMORY = int(os.getenv('ADMISSION_MEMORY_MB', '0')) * 1024 * 1024  # 0 - 75% памяти системы
+    ADMISSION_DISK_RESERVE = int(os.getenv('ADMISSION_DISK_RESERVE_MB', '1024')) * 1024 * 1024  # Не занимать
+    ADMISSION_DISK_FACTOR = 1.3  # Запас к размеру оригиналов на миниатюры и WebP/AVIF версии
+    ADMISSION_DECODE_FACTOR = 10  # Во сколько раз декодированное изображение больше файла
+    ADMISSION_POLL_INTERVAL = 2.0  # Секунд между проверками в очереди и обновлениями резерва
+    ADMISSION_STALE_SECONDS = 60  # Резерв без обновлений дольше этого считается брошенным
+
+    # Докачиваемая загрузка архивов частями (/admin/uploads): части пишутся в STAGING_FOLDER
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Размер части, который предлагается клиенту
+    UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+    UPLOAD_SESSION_TTL = 24 * 3600  # Незавершённая загрузка удаляется через сутки без обновлений
     BASE_URL = os.getenv('BASE_URL', 'http://tecnobook')
 
     # Список шаблонов (вместо клиентов)
@@ -33,9 +116,25 @@ class Config:
     # Разделитель по умолчанию
     DEFAULT_SEPARATOR = 'comma'
 
+    # Потоковая генерация XLSX (write-only книга, постоянный расход памяти)
+    XLSX_STREAMING = os.getenv('XLSX_STREAMING', '1') == '1'
+
+    # Пул для генерации XLSX и миниатюр из обработчиков запросов (на каждый воркер gunicorn):
+    # process - отдельные процессы, inline - в потоке запроса
+    CPU_EXECUTOR = os.getenv('CPU_EXECUTOR', 'process')
+    CPU_WORKERS = int(os.getenv('CPU_WORKERS', '2'))
+
+    # Выгрузка нескольких альбомов (/admin/export-albums): готовые файлы (удаляются через RESULTS_TTL),
+    # потоков подготовки альбомов в задаче, альбомов в одном запросе
+    EXPORTS_FOLDER = os.path.join(RESULTS_FOLDER, 'exports')
+    EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '4'))
+    EXPORT_MAX_ALBUMS = 500
+
     # Убедимся, что папки существуют
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(RESULTS_FOLDER, exist_ok=True)  # <-- Добавляем создание папки результатов
+    os.makedirs(STAGING_FOLDER, exist_ok=True)
+    os.makedirs(EXPORTS_FOLDER, exist_ok=True)
 
 
 def allowed_file(filename):
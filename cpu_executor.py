@@ -0,0 +1,73 @@
+# cpu_executor.py
+"""
+Ограниченный пул для тяжёлой вычислительной работы из обработчиков запросов.
+
+В режиме gthread все запросы воркера gunicorn делят один GIL: генерация XLSX
+(openpyxl - чистый Python) в одном потоке замедляет остальные, даже лёгкие
+страницы. Такая работа выполняется в пуле из CPU_WORKERS процессов на воркер
+gunicorn; поток запроса только ждёт результат. Пул создаётся при первом
+обращении в каждом процессе (после fork воркера), процессы запускаются через
+forkserver - fork многопоточного процесса небезопасен.
+
+CPU_EXECUTOR=inline выполняет работу прямо в потоке запроса (как раньше).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Модули, которые сервер forkserver импортирует один раз: процессы пулов получают их готовыми.
+# Приложение (app) сюда не входит - процессы пулов не создают Flask и не открывают базы
+FORKSERVER_PRELOAD = ['ingest_files', 'generators']
+
+
+def forkserver_context():
+    """Контекст multiprocessing для пулов процессов (CpuExecutor, обработка архивов)"""
+    context = multiprocessing.get_context('forkserver')
+    # Действует до запуска сервера forkserver, повторный вызов безопасен
+    context.set_forkserver_preload(FORKSERVER_PRELOAD)
+    return context
+
+
+class CpuExecutor:
+    def __init__(self, workers=None, mode=None):
+        self.workers = workers or Config.CPU_WORKERS
+        self.mode = mode or Config.CPU_EXECUTOR
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def _get_pool(self):
+        pid = os.getpid()
+        if self._pool_pid != pid:
+            with self._lock:
+                if self._pool_pid != pid:
+                    # Пул родительского процесса после fork недоступен - создаём свой
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=forkserver_context()
+                    )
+                    self._pool_pid = pid
+                    logger.info(f"Пул вычислений: {self.workers} процессов (pid {pid})")
+        return self._pool
+
+    def run(self, function, *args, **kwargs):
+        """
+        Выполняет function(*args, **kwargs) в пуле и возвращает результат.
+        function и аргументы передаются в другой процесс, поэтому должны сериализоваться
+        (функции уровня модуля, пути к файлам вместо открытых файлов).
+        """
+        if self.mode == 'inline':
+            return function(*args, **kwargs)
+        return self._get_pool().submit(function, *args, **kwargs).result()
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=True)
+        self._pool = None
+        self._pool_pid = None
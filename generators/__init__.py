@@ -1,13 +1,47 @@
 # generators/__init__.py
 from .megamarket_generator import MegamarketGenerator
 from .yandexmarket_generator import YandexmarketGenerator
+from .csv_generator import CsvGenerator
+from .template_cache import template_cache
+
+# Форматы выгрузки: XLSX по шаблону или текстовые таблицы с теми же строками
+EXPORT_FORMATS = ('xlsx', 'csv', 'tsv')
+
 
 class GeneratorFactory:
     @staticmethod
-    def create_generator(template_name, separator='comma'):
+    def create_generator(template_name, separator='comma', file_format='xlsx'):
         if template_name == 'В строку':
-            return MegamarketGenerator()
+            generator = MegamarketGenerator()
         elif template_name == 'В ячейку':
-            return YandexmarketGenerator(separator)
+            generator = YandexmarketGenerator(separator)
         else:
             raise ValueError(f"Unknown template: {template_name}")
+
+        if file_format in CsvGenerator.DELIMITERS:
+            return CsvGenerator(generator, file_format)
+        if file_format != 'xlsx':
+            raise ValueError(f"Unknown format: {file_format}")
+        return generator
+
+
+def write_xlsx(path, image_data, template_name, separator='comma', streaming=True):
+    """
+    Генерирует XLSX в файл path. Функция уровня модуля, чтобы её можно было
+    выполнить в пуле процессов (cpu_executor): передаются только данные и путь.
+    """
+    generator = GeneratorFactory.create_generator(template_name, separator)
+    if streaming:
+        generator.generate_to(path, image_data, template_name)
+    else:
+        buffer = generator.generate(image_data, template_name)
+        with open(path, 'wb') as f:
+            f.write(buffer.getbuffer())
+    return path
+
+
+def write_export(path, image_data, template_name, separator='comma', file_format='xlsx'):
+    """Документ в формате file_format (xlsx, csv, tsv) в файл path; для пула процессов, как write_xlsx"""
+    generator = GeneratorFactory.create_generator(template_name, separator, file_format)
+    generator.generate_to(path, image_data, template_name)
+    return path
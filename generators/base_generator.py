@@ -1,11 +1,18 @@
 # generators/base_generator.py
 import io
 import os
-import re
-from openpyxl import Workbook, load_workbook
+from copy import copy
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
 
+from image_order import item_sort_key
+from .template_cache import template_cache
+
+# Атрибуты оформления ячеек шапки, переносимые из шаблона в потоковый документ
+HEADER_STYLE_ATTRS = ('font', 'fill', 'border', 'alignment', 'number_format', 'protection')
+
 
 class BaseGenerator:
     """Базовый класс для генерации XLSX документов"""
@@ -24,7 +31,7 @@ class BaseGenerator:
         """Загружает шаблон или создает новый документ"""
         if self.template_path and os.path.exists(self.template_path):
             print(f"Загружаем шаблон: {self.template_path}")
-            wb = load_workbook(self.template_path)
+            wb = template_cache.workbook(self.template_path)
             ws = wb.active
             start_row = self.get_start_row()
             return wb, ws, start_row
@@ -32,6 +39,64 @@ class BaseGenerator:
             print("Создаем новый документ (шаблон не найден)")
             return self.create_new_workbook()
 
+    def load_template_layout(self):
+        """
+        Оформление документа для потоковой генерации: название листа, строки шапки
+        (значения и стили), ширина столбцов и высота строк шапки.
+        """
+        if self.template_path and os.path.exists(self.template_path):
+            print(f"Загружаем оформление шаблона: {self.template_path}")
+            start_row = self.get_start_row()
+            return template_cache.derived(
+                self.template_path, ('layout', start_row),
+                lambda wb: self._layout_from_worksheet(wb.active, start_row)
+            )
+
+        headers = self.get_headers()
+        header_rows = []
+        if headers:
+            header_rows.append([
+                {'value': header,
+                 'font': Font(bold=True),
+                 'alignment': Alignment(horizontal='center', vertical='center')}
+                for header in headers
+            ])
+        return {
+            'title': self.get_worksheet_title(),
+            'header_rows': header_rows,
+            'column_widths': {},
+            'row_heights': {}
+        }
+
+    @staticmethod
+    def _layout_from_worksheet(ws, start_row):
+        """Оформление из листа шаблона: строки до start_row, ширина столбцов, высота строк"""
+        header_rows = []
+        row_heights = {}
+        for row in ws.iter_rows(min_row=1, max_row=start_row - 1):
+            header_row = []
+            for cell in row:
+                spec = {'value': cell.value}
+                if cell.has_style:
+                    for attr in HEADER_STYLE_ATTRS:
+                        spec[attr] = copy(getattr(cell, attr))
+                header_row.append(spec)
+            header_rows.append(header_row)
+            height = ws.row_dimensions[row[0].row].height if row else None
+            if height:
+                row_heights[row[0].row] = height
+        column_widths = {
+            letter: dimension.width
+            for letter, dimension in ws.column_dimensions.items()
+            if dimension.width
+        }
+        return {
+            'title': ws.title,
+            'header_rows': header_rows,
+            'column_widths': column_widths,
+            'row_heights': row_heights
+        }
+
     def create_new_workbook(self):
         """Создает новый документ с заголовками"""
         wb = Workbook()
@@ -67,39 +132,131 @@ class BaseGenerator:
     def process_image_data(self, image_data):
         """Группирует изображения по артикулам и сортирует по порядковому номеру"""
         articles = {}
-        for item in image_data:
+        # Порядковый номер сохранён при загрузке; для старых результатов берётся из имени файла
+        for item in sorted(image_data, key=item_sort_key):
             article = item['article']
             if article not in articles:
                 articles[article] = []
             articles[article].append(item['url'])
 
-        # Сортировка URL внутри каждого артикула по порядковому номеру
-        for article, urls in articles.items():
-            urls.sort(key=lambda url: self._extract_order_number(url))
-
         return articles
 
-    def _extract_order_number(self, url):
-        """Извлекает порядковый номер из URL как число"""
-        filename = url.split('/')[-1]
-        # Ищем паттерн: артикул_номер_хеш.расширение
-        # Пример: 4296278785_2_ffe8e5.jpg -> извлекаем '2'
-        match = re.search(r'_(\d+)_[a-f0-9]+\.\w+$', filename)
-        if match:
-            try:
-                return int(match.group(1))  # Возвращаем как число
-            except ValueError:
-                return 0
-        return 0
-
-    # generators/base_generator.py (обновите метод generate)
+    def prepare(self, articles):
+        """
+        Настройка по сгруппированным артикулам перед записью строк (например,
+        количество столбцов). Вызывается один раз после process_image_data.
+        """
+
+    def _missing_headers(self, header_values):
+        """Заголовки get_headers, для которых в шапке шаблона нет столбцов"""
+        width = max((col for col, value in enumerate(header_values, 1) if value is not None), default=0)
+        return width, self.get_headers()[width:]
+
+    def extend_header_rows(self, header_rows):
+        """
+        Шапка шаблона для потоковой генерации, дополненная заголовками столбцов,
+        которых в шаблоне нет (оформление - как у последнего заголовка шаблона).
+        """
+        if not header_rows:
+            return header_rows
+        last_row = header_rows[-1]
+        width, missing = self._missing_headers([spec['value'] for spec in last_row])
+        if not missing:
+            return header_rows
+        style = {attr: value for attr, value in last_row[width - 1].items() if attr != 'value'} if width else {}
+        extended = last_row[:width] + [dict(style, value=header) for header in missing]
+        return header_rows[:-1] + [extended]
+
+    def extend_template_header(self, ws, start_row):
+        """То же для книги шаблона: недостающие заголовки в строке над данными"""
+        header_row = start_row - 1
+        if header_row < 1:
+            return
+        values = [cell.value for cell in ws[header_row]]
+        width, missing = self._missing_headers(values)
+        for col, header in enumerate(missing, width + 1):
+            cell = ws.cell(row=header_row, column=col, value=header)
+            if width:
+                cell._style = copy(ws.cell(row=header_row, column=width)._style)
+
+    def generate_to(self, output, image_data, template_name):
+        """
+        Потоковая генерация: строки пишутся в write-only книгу по одной и сразу
+        сбрасываются на диск, поэтому память не растёт с количеством артикулов.
+        Шапка и ширина столбцов берутся из шаблона. output - путь или файловый объект.
+        """
+        try:
+            print(f"Потоковая генерация XLSX для {len(image_data)} изображений, шаблон: {template_name}")
+
+            articles = self.process_image_data(image_data)
+            self.prepare(articles)
+            layout = self.load_template_layout()
+
+            wb = Workbook(write_only=True)
+            self.write_sheet(wb, layout, articles, template_name)
+
+            wb.save(output)
+            print(f"XLSX успешно сгенерирован, артикулов: {len(articles)}")
+            return output
+
+        except Exception as e:
+            print(f"Ошибка при генерации XLSX: {str(e)}")
+            raise Exception(f"Error generating XLSX: {str(e)}")
+
+    def write_sheet(self, wb, layout, articles, template_name, title=None):
+        """
+        Добавляет в write-only книгу wb лист с оформлением layout и строками
+        сгруппированных артикулов (после prepare). Один генератор может записать
+        несколько листов - оформление шаблона разбирается один раз.
+        """
+        ws = wb.create_sheet(title or layout['title'])
+
+        # Ширина столбцов: из шаблона, затем настройки генератора (как в adjust_column_widths)
+        column_widths = dict(layout['column_widths'])
+        column_widths.update(self.get_column_widths())
+        for col, width in column_widths.items():
+            ws.column_dimensions[col].width = width
+        for row_num, height in layout['row_heights'].items():
+            ws.row_dimensions[row_num].height = height
+
+        for header_row in self.extend_header_rows(layout['header_rows']):
+            ws.append([self._header_cell(ws, spec) for spec in header_row])
+
+        # Сортируем артикулы по алфавиту
+        for article, urls in sorted(articles.items(), key=lambda x: x[0]):
+            row_data = self.generate_row_data(article, urls, template_name)
+            ws.append(self._row_cells(ws, row_data))
+        return ws
+
+    @staticmethod
+    def _header_cell(ws, spec):
+        cell = WriteOnlyCell(ws, value=spec['value'])
+        for attr in HEADER_STYLE_ATTRS:
+            if attr in spec:
+                setattr(cell, attr, spec[attr])
+        return cell
+
+    def _row_cells(self, ws, row_data):
+        cells = []
+        for col, value in enumerate(row_data, 1):
+            alignment = self.get_cell_alignment(col)
+            if alignment is None:
+                cells.append(value)
+            else:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.alignment = alignment
+                cells.append(cell)
+        return cells
+
     def generate(self, image_data, template_name):
         """Основной метод генерации документа"""
         try:
             print(f"Генерация XLSX для {len(image_data)} изображений, шаблон: {template_name}")
 
-            wb, ws, start_row = self.load_template()
             articles = self.process_image_data(image_data)
+            self.prepare(articles)
+            wb, ws, start_row = self.load_template()
+            self.extend_template_header(ws, start_row)
             current_row = start_row
 
             print(f"Начинаем запись с строки {current_row}, артикулов: {len(articles)}")
@@ -132,28 +289,20 @@ class BaseGenerator:
     def write_row_data(self, ws, row_num, row_data):
         """Записывает данные в строку"""
         for col, value in enumerate(row_data, 1):
-            ws.cell(row=row_num, column=col, value=value)
+            cell = ws.cell(row=row_num, column=col, value=value)
+            alignment = self.get_cell_alignment(col)
+            if alignment is not None:
+                cell.alignment = alignment
 
-    # generators/yandexmarket_generator.py (альтернативная версия adjust_column_widths)
-    def adjust_column_widths(self, ws):
-        # Настраиваем ширину в зависимости от разделителя
-        if self.separator == 'newline':
-            # Для переносов строк делаем колонку уже, но выше
-            column_widths = {
-                'A': 20,  # Артикул
-                'B': 60,  # Ссылки (уже, так как вертикально)
-            }
-
-            # Устанавливаем перенос текста для ВСЕЙ колонки B
-            for row in range(1, ws.max_row + 1):
-                cell = ws.cell(row=row, column=2)
-                cell.alignment = Alignment(wrap_text=True, vertical='top')
-        else:
-            # Для запятых - широкая колонка
-            column_widths = {
-                'A': 20,  # Артикул
-                'B': 100,  # Ссылки (широкая колонка для текста с запятыми)
-            }
+    def get_cell_alignment(self, col):
+        """Выравнивание ячеек данных в столбце col (None - по умолчанию)"""
+        return None
 
-        for col, width in column_widths.items():
+    def get_column_widths(self):
+        """Ширина столбцов документа: {'A': 20, ...}"""
+        return {}
+
+    def adjust_column_widths(self, ws):
+        """Настраивает ширину столбцов"""
+        for col, width in self.get_column_widths().items():
             ws.column_dimensions[col].width = width
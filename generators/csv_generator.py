@@ -0,0 +1,60 @@
+# generators/csv_generator.py
+import csv
+import io
+
+
+class CsvGenerator:
+    """
+    Выгрузка ссылок в CSV/TSV с теми же строками, что и XLSX генератор layout
+    ("В строку" или "В ячейку" с его разделителем ссылок). Документ формируется
+    частями по мере отправки: память не растёт с количеством артикулов.
+    """
+
+    DELIMITERS = {'csv': ',', 'tsv': '\t'}
+    MIMETYPES = {'csv': 'text/csv', 'tsv': 'text/tab-separated-values'}
+
+    def __init__(self, layout, file_format='csv', rows_per_chunk=500):
+        self.layout = layout
+        self.file_format = file_format
+        self.delimiter = self.DELIMITERS[file_format]
+        self.rows_per_chunk = rows_per_chunk
+
+    @property
+    def extension(self):
+        return self.file_format
+
+    @property
+    def mimetype(self):
+        # charset=utf-8 к text/* добавляет Werkzeug
+        return self.MIMETYPES[self.file_format]
+
+    def iter_chunks(self, image_data, template_name):
+        """
+        Документ частями в UTF-8. Первая часть начинается с BOM: без него Excel
+        открывает кириллицу в CSV в неверной кодировке.
+        """
+        buffer = io.StringIO()
+        buffer.write('\ufeff')
+        writer = csv.writer(buffer, delimiter=self.delimiter, lineterminator='\r\n')
+        articles = self.layout.process_image_data(image_data)
+        self.layout.prepare(articles)
+        writer.writerow(self.layout.get_headers())
+
+        # Сортируем артикулы по алфавиту (как в XLSX)
+        for count, (article, urls) in enumerate(sorted(articles.items(), key=lambda x: x[0]), 1):
+            writer.writerow(self.layout.generate_row_data(article, urls, template_name))
+            if count % self.rows_per_chunk == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def generate_to(self, output, image_data, template_name):
+        """Записывает документ в output (путь или файловый объект)"""
+        if isinstance(output, str):
+            with open(output, 'wb') as f:
+                self.generate_to(f, image_data, template_name)
+            return output
+        for chunk in self.iter_chunks(image_data, template_name):
+            output.write(chunk)
+        return output
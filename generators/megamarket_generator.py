@@ -4,38 +4,37 @@ from openpyxl.utils import get_column_letter
 
 
 class MegamarketGenerator(BaseGenerator):
+    # Столбцов ссылок, пока данные не известны (prepare не вызывался)
+    DEFAULT_LINK_COLUMNS = 10
+
     def __init__(self):
         super().__init__('В строку')
+        self.link_columns = self.DEFAULT_LINK_COLUMNS
+        self._headers = None
 
     def get_worksheet_title(self):
         return "Images"
 
+    def prepare(self, articles):
+        # Столбцов ссылок столько, сколько фотографий у самого большого артикула
+        self.link_columns = max((len(urls) for urls in articles.values()), default=0)
+        self._headers = None
+
     def get_headers(self):
-        # Создаем заголовки: Артикул + Ссылка 1, Ссылка 2, и т.д.
-        headers = ["Артикул"]
-        # Определяем максимальное количество ссылок для заголовков
-        max_links = 10  # Можно увеличить при необходимости
-        for i in range(1, max_links + 1):
-            headers.append(f"Ссылка {i}")
-        return headers
+        # Заголовки: Артикул + Ссылка 1, Ссылка 2, и т.д.; строятся один раз на документ
+        if self._headers is None:
+            self._headers = ["Артикул"] + [f"Ссылка {i}" for i in range(1, self.link_columns + 1)]
+        return self._headers
 
     def generate_row_data(self, article, urls, template_name):
-        # Первая ячейка - артикул
+        # Первая ячейка - артикул, остальные - ссылки (каждая в отдельной ячейке);
+        # оставшиеся ячейки заполняются пустыми значениями, чтобы выровнять количество столбцов
         row_data = [article]
-
-        # Остальные ячейки - ссылки (каждая в отдельной ячейке)
-        for url in urls:
-            row_data.append(url)
-
-        # Заполняем оставшиеся ячейки пустыми значениями
-        # чтобы выровнять количество столбцов
-        remaining_cells = len(self.get_headers()) - len(row_data)
-        for i in range(remaining_cells):
-            row_data.append("")
-
+        row_data.extend(urls)
+        row_data.extend([""] * (self.link_columns - len(urls)))
         return row_data
 
-    def adjust_column_widths(self, ws):
+    def get_column_widths(self):
         # Настраиваем ширину столбцов для лучшего отображения
         column_widths = {
             'A': 20,  # Артикул
@@ -46,5 +45,4 @@ class MegamarketGenerator(BaseGenerator):
             column_letter = get_column_letter(i)
             column_widths[column_letter] = 40
 
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
+        return column_widths
@@ -0,0 +1,96 @@
+# generators/template_cache.py
+"""
+Кэш разобранных XLSX шаблонов.
+
+Шаблон читается с диска один раз (при preload_app - ещё до форка воркеров),
+каждый запрос получает собственную копию книги. Запись кэша сбрасывается,
+когда у файла шаблона меняется время изменения или размер, поэтому
+правка шаблонов не требует перезапуска.
+"""
+import copy
+import os
+import threading
+
+from openpyxl import load_workbook
+from openpyxl.utils.indexed_list import IndexedList
+
+
+def clone_workbook(wb):
+    """
+    Глубокая копия книги openpyxl.
+    IndexedList (таблицы стилей, общие строки) при обычном deepcopy теряет
+    элементы, поэтому такие списки копируются заранее и подставляются через memo.
+    Размеры строк и столбцов (DimensionHolder) теряют фабрику новых элементов -
+    она привязывается к листу копии заново, иначе обращение к столбцу за пределами
+    шаблона (ws.column_dimensions['L']) падает с KeyError.
+    """
+    memo = {}
+    for value in vars(wb).values():
+        if isinstance(value, IndexedList):
+            memo[id(value)] = IndexedList(copy.deepcopy(list(value), memo))
+    clone = copy.deepcopy(wb, memo)
+    for ws in clone.worksheets:
+        if hasattr(ws, '_add_column'):
+            ws.column_dimensions.default_factory = ws._add_column
+            ws.row_dimensions.default_factory = ws._add_row
+    return clone
+
+
+class TemplateCache:
+    """Разобранные шаблоны по пути файла: книга и производные от неё данные (оформление)"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _entry(self, path):
+        key = self._file_key(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry['key'] != key:
+                print(f"Загружаем шаблон в кэш: {path}")
+                entry = {'key': key, 'workbook': load_workbook(path), 'derived': {}}
+                self._entries[path] = entry
+            return entry
+
+    def workbook(self, path):
+        """Копия книги шаблона, которую можно свободно изменять"""
+        entry = self._entry(path)
+        try:
+            with self._lock:
+                return clone_workbook(entry['workbook'])
+        except Exception as e:
+            print(f"Не удалось скопировать шаблон из кэша ({e}), загружаем с диска")
+            return load_workbook(path)
+
+    def derived(self, path, name, build):
+        """
+        Значение, вычисленное из книги шаблона функцией build(wb) и закэшированное
+        до изменения файла. build вызывается под блокировкой и не должен менять книгу.
+        """
+        entry = self._entry(path)
+        with self._lock:
+            if name not in entry['derived']:
+                entry['derived'][name] = build(entry['workbook'])
+            return entry['derived'][name]
+
+    def warm(self, paths):
+        """Заранее разбирает шаблоны (вызывается при импорте приложения, до форка)"""
+        for path in paths:
+            if path and os.path.exists(path):
+                try:
+                    self._entry(path)
+                except Exception as e:
+                    print(f"Ошибка загрузки шаблона {path} в кэш: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+template_cache = TemplateCache()
@@ -1,7 +1,6 @@
 # generators/yandexmarket_generator.py
 from .base_generator import BaseGenerator
 from openpyxl.styles import Alignment
-import io
 
 class YandexmarketGenerator(BaseGenerator):
     def __init__(self, separator='comma'):
@@ -20,58 +19,22 @@ class YandexmarketGenerator(BaseGenerator):
         links_text = separator.join(urls) if urls else ""
         return [article, links_text]
 
-    def adjust_column_widths(self, ws):
+    def get_column_widths(self):
         # Настраиваем ширину в зависимости от разделителя
         if self.separator == 'newline':
             # Для переносов строк делаем колонку уже, но выше
-            column_widths = {
+            return {
                 'A': 20,  # Артикул
                 'B': 60,  # Ссылки (уже, так как вертикально)
             }
-        else:
-            # Для запятых - широкая колонка
-            column_widths = {
-                'A': 20,  # Артикул
-                'B': 100,  # Ссылки (широкая колонка для текста с запятыми)
-            }
-
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
-
-    def generate(self, image_data, template_name):
-        """Переопределяем метод generate для установки форматирования ВСЕХ строк"""
-        try:
-            print(f"Генерация XLSX для {len(image_data)} изображений, шаблон: {template_name}")
-
-            wb, ws, start_row = self.load_template()
-            articles = self.process_image_data(image_data)
-            current_row = start_row
-
-            print(f"Начинаем запись с строки {current_row}, артикулов: {len(articles)}")
-
-            # Сортируем артикулы по алфавиту
-            sorted_articles = sorted(articles.items(), key=lambda x: x[0])
-
-            for article, urls in sorted_articles:
-                row_data = self.generate_row_data(article, urls, template_name)
-                self.write_row_data(ws, current_row, row_data)
-
-                # Устанавливаем форматирование для ВСЕХ строк, независимо от количества ссылок
-                if self.separator == 'newline':
-                    cell = ws.cell(row=current_row, column=2)
-                    cell.alignment = Alignment(wrap_text=True, vertical='top')
-
-                current_row += 1
-
-            # Дополнительно вызываем adjust_column_widths для гарантии
-            self.adjust_column_widths(ws)
-
-            buffer = io.BytesIO()
-            wb.save(buffer)
-            buffer.seek(0)
-            print("XLSX успешно сгенерирован")
-            return buffer
-
-        except Exception as e:
-            print(f"Ошибка при генерации XLSX: {str(e)}")
-            raise Exception(f"Error generating XLSX: {str(e)}")
+        # Для запятых - широкая колонка
+        return {
+            'A': 20,  # Артикул
+            'B': 100,  # Ссылки (широкая колонка для текста с запятыми)
+        }
+
+    def get_cell_alignment(self, col):
+        # Для переносов строк включаем перенос текста во ВСЕХ строках столбца ссылок
+        if self.separator == 'newline' and col == 2:
+            return Alignment(wrap_text=True, vertical='top')
+        return None
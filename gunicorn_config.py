@@ -1,9 +1,18 @@
 # gunicorn_config.py
+import os
+
 bind = "0.0.0.0:5000"
-workers = 4  # Или вычислите динамически
-worker_class = "sync"  # sync, gevent, eventlet и др. sync - стандартный
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+# gthread - каждый воркер обслуживает запросы в нескольких потоках: долгие загрузки и выгрузки
+# не блокируют остальные страницы. sync - один запрос на воркер (прежний режим).
+# Тяжёлые вычисления (XLSX, миниатюры) выполняются в пуле процессов cpu_executor.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# При threads > 1 gunicorn сам переключает sync на gthread, поэтому для sync - ровно один поток
+threads = int(os.getenv('GUNICORN_THREADS', '8')) if worker_class == 'gthread' else 1
 worker_connections = 1000 # Для sync worker_class не используется, но полезно для async
 timeout = 600 # Увеличено, если у вас долгие операции
+# При перезапуске по max_requests потоки gthread могут ещё выполнять долгие запросы - даём им завершиться
+graceful_timeout = 120
 keepalive = 2
 max_requests = 100 # Перезапуск воркера после N запросов (помогает с утечками памяти)
 max_requests_jitter = 20 # Добавляет случайности к max_requests
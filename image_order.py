@@ -0,0 +1,41 @@
+# image_order.py
+"""
+Порядковый номер изображения внутри артикула.
+
+Номер берётся из исходного имени файла при загрузке (артикул_номер.jpg -> номер)
+и сохраняется в результатах (поле order) и в индексе (order_num). Для записей,
+сохранённых до появления этого поля, номер восстанавливается из имени файла
+в uploads: сначала отрезается случайный суффикс, добавленный при загрузке
+(_a1b2c3 или -a1b2c3), затем ищется номер в исходной части имени.
+"""
+import os
+import re
+from urllib.parse import unquote
+
+TRAILING_NUMBER = re.compile(r'_(\d+)$')
+UNIQUE_SUFFIX = re.compile(r'[_-][a-f0-9]{6}$')
+
+
+def order_from_name(filename):
+    """Номер из исходного имени файла: 4296278785_2.jpg -> 2; без номера - 0"""
+    match = TRAILING_NUMBER.search(os.path.splitext(os.path.basename(filename))[0])
+    return int(match.group(1)) if match else 0
+
+
+def order_from_stored_name(filename):
+    """Номер из имени файла в uploads или URL (4296278785_2_ffe8e5.jpg -> 2) для старых записей"""
+    stem = os.path.splitext(unquote(filename.rsplit('/', 1)[-1]))[0]
+    return order_from_name(UNIQUE_SUFFIX.sub('', stem))
+
+
+def item_order(item):
+    """Номер элемента результатов: сохранённый при загрузке или восстановленный из имени"""
+    order = item.get('order')
+    if isinstance(order, int):
+        return order
+    return order_from_stored_name(item.get('filename') or item['url'])
+
+
+def item_sort_key(item):
+    """Артикул, номер, имя файла - одинаковый порядок при каждой сортировке"""
+    return item['article'], item_order(item), item.get('filename') or item['url']
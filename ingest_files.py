@@ -0,0 +1,214 @@
+# ingest_files.py
+"""
+Размещение загруженных изображений в uploads: оригинал, миниатюры, индекс, URL.
+
+Функции выполняются и в процессах пула обработки архивов, которые
+импортируют этот модуль, а не app: импорт не создаёт приложение Flask,
+не читает шаблоны XLSX и не открывает базы. Индекс изображений и хранилище
+дедупликации создаются в каждом процессе при первом обращении.
+"""
+import io
+import logging
+import os
+import re
+import shutil
+import unicodedata
+import uuid
+from urllib.parse import quote
+
+import storage_layout
+from blob_store import BlobStore
+from config import Config
+from image_order import order_from_name
+from media_index import MediaIndex
+from metrics import metrics
+from thumbnails import create_derivatives, derivative_filenames, modern_targets
+
+logger = logging.getLogger(__name__)
+
+_media_index = None
+_blob_store = None
+
+
+def get_media_index():
+    """Индекс загруженных изображений этого процесса"""
+    global _media_index
+    if _media_index is None:
+        _media_index = MediaIndex()
+    return _media_index
+
+
+def get_blob_store():
+    """Хранилище по хешу содержимого; None, если дедупликация выключена"""
+    global _blob_store
+    if _blob_store is None and Config.DEDUP_ENABLED:
+        _blob_store = BlobStore(Config.BLOBS_FOLDER, Config.INGEST_COPY_BUFFER)
+    return _blob_store
+
+
+def safe_folder_name(name: str) -> str:
+    """Преобразует строку в безопасное имя папки"""
+    if not name:
+        return "unnamed"
+    name = unicodedata.normalize('NFKD', name)
+    name = re.sub(r'[^\w\s-]', '', name, flags=re.UNICODE)
+    name = re.sub(r'[-\s]+', '-', name, flags=re.UNICODE).strip('-_')
+    return name[:255] if name else "unnamed"
+
+
+def build_image_url(template_folder, article_folder, filename):
+    """Публичный URL файла из папки uploads"""
+    return "{}/images/{}/{}/{}".format(
+        Config.BASE_URL,
+        quote(template_folder, safe=''),
+        quote(article_folder, safe=''),
+        quote(filename, safe='')
+    )
+
+
+def index_uploaded_file(template_folder, article_folder, filename, has_thumb, has_preview=False, order=None):
+    """Добавляет файл в индекс; ошибка индекса не должна прерывать загрузку"""
+    try:
+        file_path = storage_layout.file_path(Config.UPLOAD_FOLDER, template_folder, article_folder, filename)
+        get_media_index().add_image(template_folder, article_folder, filename, bool(has_thumb),
+                                    os.path.getsize(file_path), order_num=order, has_preview=bool(has_preview))
+    except Exception as e:
+        logger.warning(f"Не удалось добавить {filename} в индекс: {e}")
+
+
+# --- Оптимизированная обработка файлов ---
+def write_original(source, target_file):
+    """
+    Записывает оригинал (путь или файловый объект) в target_file.
+    При включённой дедупликации возвращает sha256 содержимого, иначе None.
+    """
+    with metrics.timer('copy'):
+        blob_store = get_blob_store()
+        if blob_store:
+            digest, existed = blob_store.store(source, target_file)
+            if existed:
+                logger.debug(f"Повторная загрузка содержимого {digest}: {target_file}")
+            return digest
+
+        if isinstance(source, str):
+            shutil.copy2(source, target_file)
+        else:
+            with open(target_file, 'wb') as target:
+                shutil.copyfileobj(source, target, Config.INGEST_COPY_BUFFER)
+        return None
+
+
+def create_or_reuse_derivatives(source, targets, digest=None, executor=None):
+    """
+    Создает миниатюру, превью и их WebP/AVIF версии ({имя: путь}); при дедупликации
+    берёт готовые файлы того же содержимого. Возвращает созданные {имя: путь}.
+    executor - CpuExecutor, в пуле которого создаются файлы (source - путь к файлу).
+    """
+    created = {}
+    blob_store = get_blob_store() if digest else None
+    if blob_store:
+        for name, target in targets.items():
+            if blob_store.reuse_derivative(digest, name, target):
+                created[name] = target
+        if created:
+            metrics.inc('derivatives_reused', len(created))
+
+    missing = {name: target for name, target in targets.items() if name not in created}
+    if missing:
+        if executor:
+            rendered = executor.run(create_derivatives, source, missing)
+        else:
+            rendered = create_derivatives(source, missing)
+        if blob_store:
+            for name, path in rendered.items():
+                blob_store.remember_derivative(digest, name, path)
+        created.update(rendered)
+    return created
+
+
+def derivative_urls(template_folder, article_folder, filenames, created, image_url):
+    """URL миниатюры и превью; если файл не создан - URL оригинала"""
+    urls = {name: build_image_url(template_folder, article_folder, filenames[name])
+            for name in created if name in filenames}
+    return urls.get('thumb', image_url), urls.get('preview', image_url)
+
+
+def place_original(source, filename, template_name, article):
+    """
+    Записывает оригинал сразу в итоговую папку артикула (uploads/<альбом>/<артикул>/,
+    при STORAGE_SHARDED - uploads/<альбом>/_<шард>/<артикул>/).
+
+    source - путь к файлу или открытый файловый объект (например, ZipFile.open).
+    Возвращает описание размещённого файла для finish_processed_file.
+    """
+    template_folder = safe_folder_name(template_name)
+    article_folder = safe_folder_name(article)
+    full_path = storage_layout.article_dir(Config.UPLOAD_FOLDER, template_folder, article_folder)
+    os.makedirs(full_path, exist_ok=True)
+
+    # Генерируем уникальные имена один раз
+    file_name_base = os.path.splitext(filename)[0]
+    unique_suffix = uuid.uuid4().hex[:6]
+    file_extension = os.path.splitext(filename)[1]
+
+    unique_filename = f"{file_name_base}_{unique_suffix}{file_extension}"
+    derivative_names = derivative_filenames(f"{file_name_base}_{unique_suffix}")
+    target_file = os.path.join(full_path, unique_filename)
+
+    # Копируем оригинал
+    digest = write_original(source, target_file)
+    derivative_targets = {name: os.path.join(full_path, name_) for name, name_ in derivative_names.items()}
+
+    return {
+        'digest': digest,
+        'template_folder': template_folder,
+        'article_folder': article_folder,
+        'article': article,
+        'order': order_from_name(filename),
+        'filename': unique_filename,
+        'derivative_filenames': derivative_names,
+        'target_file': target_file,
+        'derivative_targets': {**derivative_targets, **modern_targets(target_file, derivative_targets)}
+    }
+
+
+def finish_processed_file(placed, thumb_source=None):
+    """Создает миниатюры и URL для размещённого оригинала (выполняется и в пуле процессов)"""
+    # Создаем миниатюру и превью (по умолчанию - из уже записанного оригинала)
+    created = create_or_reuse_derivatives(thumb_source or placed['target_file'],
+                                          placed['derivative_targets'], placed['digest'])
+
+    index_uploaded_file(placed['template_folder'], placed['article_folder'], placed['filename'],
+                        'thumb' in created, 'preview' in created, placed['order'])
+
+    # Генерируем URLs; без миниатюры используется оригинал
+    with metrics.timer('url_build'):
+        image_url = build_image_url(placed['template_folder'], placed['article_folder'], placed['filename'])
+        thumbnail_url, preview_url = derivative_urls(placed['template_folder'], placed['article_folder'],
+                                                     placed['derivative_filenames'], created, image_url)
+
+    return {
+        'url': image_url,
+        'article': placed['article'],
+        'order': placed['order'],
+        'filename': placed['filename'],
+        'thumbnail_url': thumbnail_url,
+        'preview_url': preview_url
+    }
+
+
+def process_single_file_efficiently(source, filename, template_name, article):
+    """Эффективная обработка одного файла"""
+    try:
+        placed = place_original(source, filename, template_name, article)
+
+        # Буфер в памяти повторно используем для миниатюры, не перечитывая файл с диска
+        thumb_source = None
+        if isinstance(source, io.BytesIO):
+            source.seek(0)
+            thumb_source = source
+        return finish_processed_file(placed, thumb_source)
+
+    except Exception as e:
+        logger.error(f"Ошибка обработки файла {filename}: {e}")
+        return None
@@ -0,0 +1,260 @@
+# jobs.py
+"""
+Локальная очередь фоновых задач на SQLite (без внешнего брокера).
+
+Веб-процессы ставят задачи в очередь, выделенные воркеры (worker.py)
+забирают их по одной и отчитываются о прогрессе.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Обработчики задач по типу: kind -> handler(job, progress) -> dict с результатом
+JOB_HANDLERS = {}
+
+MAX_JOB_ERRORS = 100
+
+
+def job_handler(kind):
+    """Декоратор регистрации обработчика задач заданного типа"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    """Очередь задач в SQLite; безопасна для нескольких процессов и потоков"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.JOBS_DB
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        # Соединение своё для каждого потока и процесса (gunicorn форкает воркеры после preload_app)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                errors TEXT NOT NULL DEFAULT '[]',
+                files_done INTEGER NOT NULL DEFAULT 0,
+                files_total INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL,
+                finished_at REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+
+    def enqueue(self, kind, payload):
+        """Ставит задачу в очередь и сразу возвращает её id"""
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, kind, 'queued', json.dumps(payload, ensure_ascii=False), time.time())
+        )
+        logger.info(f"Задача {job_id} ({kind}) поставлена в очередь")
+        return job_id
+
+    def claim(self):
+        """Атомарно забирает самую старую задачу из очереди"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, updated_at = ? WHERE id = ?",
+                (now, now, row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self._row_to_job(row)
+
+    def update_progress(self, job_id, files_done, files_total):
+        self._connect().execute(
+            'UPDATE jobs SET files_done = ?, files_total = ?, updated_at = ? WHERE id = ?',
+            (files_done, files_total, time.time(), job_id)
+        )
+
+    def set_errors(self, job_id, errors):
+        self._connect().execute(
+            'UPDATE jobs SET errors = ?, updated_at = ? WHERE id = ?',
+            (json.dumps(errors[-MAX_JOB_ERRORS:], ensure_ascii=False), time.time(), job_id)
+        )
+
+    def finish(self, job_id, result):
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', result = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (json.dumps(result, ensure_ascii=False), now, now, job_id)
+        )
+
+    def fail(self, job_id, error):
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (error, now, now, job_id)
+        )
+
+    def fail_stale(self, max_age=None):
+        """
+        Помечает как упавшие задачи, которые давно не обновлялись (воркер умер).
+        Повторно такие задачи не запускаются, чтобы не дублировать уже сохранённые файлы.
+        """
+        max_age = max_age or Config.JOB_STALE_SECONDS
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+            "WHERE status = 'running' AND updated_at < ?",
+            ('Обработка прервана: воркер перестал отвечать', now, now - max_age)
+        )
+        if cursor.rowcount:
+            logger.warning(f"Помечено прерванных задач: {cursor.rowcount}")
+
+    def count_queued(self, kind):
+        """Число задач kind, ещё не забранных воркером"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND kind = ?", (kind,)
+        ).fetchone()[0]
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['errors'] = json.loads(job['errors'])
+        return job
+
+
+def job_status(job):
+    """Представление задачи для API: прогресс, скорость и ошибки"""
+    started_at = job['started_at']
+    end_time = job['finished_at'] or time.time()
+    elapsed = end_time - started_at if started_at else 0
+    throughput = job['files_done'] / elapsed if elapsed > 0 else 0
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'files_done': job['files_done'],
+        'files_total': job['files_total'],
+        'elapsed': round(elapsed, 2),
+        'throughput': round(throughput, 2),
+        'errors': job['errors'],
+        'error': job['error'],
+        'result': job['result']
+    }
+
+
+class JobProgress:
+    """Передаёт прогресс обработчика в очередь, не чаще раза в JOB_PROGRESS_INTERVAL секунд"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.errors = []
+        self.files_done = 0
+        self.files_total = 0
+        self._last_flush = 0
+
+    def __call__(self, files_done, files_total, error=None):
+        self.files_done = files_done
+        self.files_total = files_total
+        if error:
+            self.errors.append(error)
+        if error or time.time() - self._last_flush >= Config.JOB_PROGRESS_INTERVAL:
+            self.flush(with_errors=bool(error))
+
+    def flush(self, with_errors=True):
+        self._last_flush = time.time()
+        self.queue.update_progress(self.job_id, self.files_done, self.files_total)
+        if with_errors and self.errors:
+            self.queue.set_errors(self.job_id, self.errors)
+
+
+def run_job(queue, job):
+    """Выполняет одну задачу зарегистрированным обработчиком"""
+    handler = JOB_HANDLERS.get(job['kind'])
+    if handler is None:
+        queue.fail(job['id'], f"Неизвестный тип задачи: {job['kind']}")
+        return
+
+    progress = JobProgress(queue, job['id'])
+    try:
+        logger.info(f"Задача {job['id']} ({job['kind']}) запущена")
+        result = handler(job, progress)
+        progress.flush()
+        queue.finish(job['id'], result)
+        logger.info(f"Задача {job['id']} завершена")
+    except Exception as e:
+        progress.flush()
+        logger.error(f"Задача {job['id']} завершилась ошибкой: {e}")
+        queue.fail(job['id'], str(e))
+
+
+def worker_loop(queue, stop_event):
+    """Цикл воркера: забирает задачи из очереди, пока не установлен stop_event"""
+    while not stop_event.is_set():
+        try:
+            job = queue.claim()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения очереди задач: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(Config.JOB_POLL_INTERVAL)
+            continue
+        run_job(queue, job)
+
+
+def start_workers(count=None, stop_event=None):
+    """Запускает count потоков-воркеров; возвращает (stop_event, threads)"""
+    count = count or Config.JOB_WORKERS
+    stop_event = stop_event or threading.Event()
+    JobQueue().fail_stale()
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(
+            target=worker_loop, args=(JobQueue(), stop_event),
+            name=f"job-worker-{i}", daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    logger.info(f"Запущено воркеров фоновых задач: {count} (pid {os.getpid()})")
+    return stop_event, threads
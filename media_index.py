@@ -0,0 +1,214 @@
+# media_index.py
+"""
+Индекс загруженных изображений в SQLite.
+
+Заменяет обход uploads/ через os.listdir на каждой загрузке страницы архива:
+загрузка и удаление файлов обновляют индекс, архив читается запросами к нему.
+Индекс можно полностью восстановить с диска: flask --app app rebuild-index
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config, allowed_file
+from image_order import order_from_stored_name
+from storage_layout import iter_articles
+from thumbnails import derivative_filenames, derived_filenames
+
+logger = logging.getLogger(__name__)
+
+
+def scan_uploads(upload_folder):
+    """Обходит uploads/<альбом>/[_<шард>/]<артикул>/ и возвращает записи для индекса"""
+    if not os.path.isdir(upload_folder):
+        return
+    with os.scandir(upload_folder) as albums:
+        for album_entry in albums:
+            # Служебные папки (.blobs и т.п.) не являются альбомами
+            if album_entry.name.startswith('.') or not album_entry.is_dir():
+                continue
+            for article_entry in iter_articles(album_entry.path):
+                with os.scandir(article_entry.path) as files:
+                    entries = {entry.name: entry for entry in files if entry.is_file()}
+                # Миниатюры и версии оригиналов, которые лежат в этой же папке
+                derived = derived_filenames(entries)
+                for filename, entry in entries.items():
+                    if not allowed_file(filename) or filename in derived:
+                        continue
+                    stat = entry.stat()
+                    derivatives = derivative_filenames(os.path.splitext(filename)[0])
+                    yield {
+                        'album': album_entry.name,
+                        'article': article_entry.name,
+                        'filename': filename,
+                        'order_num': order_from_stored_name(filename),
+                        'has_thumb': derivatives['thumb'] in entries,
+                        'has_preview': derivatives.get('preview') in entries,
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime
+                    }
+
+
+class MediaIndex:
+    """Индекс изображений: альбом, артикул, файл, порядковый номер, миниатюра и превью, размер, время"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.INDEX_DB
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        # Соединение своё для каждого потока и процесса (воркеры gunicorn, пул обработки архивов)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                album TEXT NOT NULL,
+                article TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                order_num INTEGER NOT NULL DEFAULT 0,
+                has_thumb INTEGER NOT NULL DEFAULT 0,
+                has_preview INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL DEFAULT 0,
+                mtime REAL NOT NULL,
+                PRIMARY KEY (album, article, filename)
+            )
+        ''')
+        # Индексы, созданные до появления превью
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(images)')}
+        if 'has_preview' not in columns:
+            conn.execute('ALTER TABLE images ADD COLUMN has_preview INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_images_order ON images (album, article, order_num, filename)')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def add_image(self, album, article, filename, has_thumb, size, mtime=None, order_num=None, has_preview=False):
+        self.add_images([{
+            'album': album,
+            'article': article,
+            'filename': filename,
+            'order_num': order_from_stored_name(filename) if order_num is None else order_num,
+            'has_thumb': has_thumb,
+            'has_preview': has_preview,
+            'size': size,
+            'mtime': mtime or time.time()
+        }])
+
+    def add_images(self, rows):
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO images (album, article, filename, order_num, has_thumb, has_preview, size, mtime) '
+                'VALUES (:album, :article, :filename, :order_num, :has_thumb, :has_preview, :size, :mtime)',
+                rows
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def remove_image(self, album, article, filename):
+        self._connect().execute(
+            'DELETE FROM images WHERE album = ? AND article = ? AND filename = ?',
+            (album, article, filename)
+        )
+
+    def remove_images(self, album, article, filenames):
+        """Удаляет из индекса несколько файлов одного артикула одной транзакцией"""
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'DELETE FROM images WHERE album = ? AND article = ? AND filename = ?',
+                [(album, article, filename) for filename in filenames]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def remove_article(self, album, article):
+        self._connect().execute('DELETE FROM images WHERE album = ? AND article = ?', (album, article))
+
+    def remove_album(self, album):
+        self._connect().execute('DELETE FROM images WHERE album = ?', (album,))
+
+    @staticmethod
+    def _filter(album, article, after=None):
+        conditions, params = [], []
+        if album is not None:
+            conditions.append('album = ?')
+            params.append(album)
+        if article is not None:
+            conditions.append('article = ?')
+            params.append(article)
+        if after is not None:
+            conditions.append('(album, article, order_num, filename) > (?, ?, ?, ?)')
+            params.extend(after)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return where, params
+
+    def list_images(self, album=None, article=None):
+        """Изображения в порядке альбом, артикул, порядковый номер"""
+        where, params = self._filter(album, article)
+        query = f'SELECT * FROM images{where} ORDER BY album, article, order_num, filename'
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def page_images(self, album=None, article=None, after=None, limit=200):
+        """
+        Страница изображений с курсорной пагинацией.
+        after - ключ (album, article, order_num, filename) последней записи предыдущей страницы.
+        """
+        where, params = self._filter(album, article, after)
+        query = f'SELECT * FROM images{where} ORDER BY album, article, order_num, filename LIMIT ?'
+        return [dict(row) for row in self._connect().execute(query, params + [limit])]
+
+    def summary(self, album=None):
+        """Количество изображений по альбомам и артикулам"""
+        query = 'SELECT album, article, COUNT(*) AS count FROM images'
+        params = []
+        if album is not None:
+            query += ' WHERE album = ?'
+            params.append(album)
+        query += ' GROUP BY album, article ORDER BY album, article'
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def is_built(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        return row is not None
+
+    def rebuild(self, upload_folder=None):
+        """Полностью пересоздаёт индекс по содержимому папки загрузок"""
+        upload_folder = upload_folder or Config.UPLOAD_FOLDER
+        start_time = time.time()
+        rows = list(scan_uploads(upload_folder))
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM images')
+            conn.executemany(
+                'INSERT INTO images (album, article, filename, order_num, has_thumb, has_preview, size, mtime) '
+                'VALUES (:album, :article, :filename, :order_num, :has_thumb, :has_preview, :size, :mtime)',
+                rows
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (str(time.time()),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        logger.info(f"Индекс пересоздан за {time.time() - start_time:.2f} секунд, файлов: {len(rows)}")
+        return len(rows)
@@ -0,0 +1,256 @@
+# metrics.py
+"""
+Метрики обработки загрузок в текстовом формате Prometheus (/admin/metrics).
+
+Каждый процесс (воркеры gunicorn, worker.py, процессы пула миниатюр) копит
+гистограммы длительности этапов и счётчики в памяти и раз в
+METRICS_FLUSH_INTERVAL секунд записывает их вместе с RSS в свой файл
+data/metrics/proc-<host>-<pid>-<старт>.json. При запросе /admin/metrics файлы
+всех процессов суммируются. Файлы процессов, которые давно не обновлялись
+(процесс завершён), переносятся в retired.json, чтобы счётчики не уменьшались
+после перезапуска воркеров.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import logging
+import multiprocessing.util
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'stashlink'
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Этапы: zip_open - открытие архива и чтение оглавления, extract - чтение файла из архива в память,
+# copy - запись оригинала в uploads (для потоковых файлов архива включает распаковку),
+# thumbnail_* - декодирование, масштабирование и сохранение миниатюр, url_build - построение URL,
+# results_save - сохранение результатов загрузки, xlsx_generate - генерация XLSX
+STAGES = ('zip_open', 'extract', 'copy', 'thumbnail_decode', 'thumbnail_resize', 'thumbnail_encode',
+          'url_build', 'results_save', 'xlsx_generate')
+
+COUNTERS = {
+    'archives_processed': 'Обработано архивов',
+    'files_processed': 'Обработано файлов',
+    'files_failed': 'Файлов с ошибкой обработки',
+    'bytes_processed': 'Байт оригиналов обработано',
+    'derivatives_reused': 'Миниатюр взято из хранилища дедупликации',
+}
+
+RETIRED_FILE = 'retired.json'
+
+
+def _empty_histogram():
+    return {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+
+
+def _merge(target, snapshot):
+    """Прибавляет счётчики и гистограммы snapshot к target"""
+    for name, value in snapshot.get('counters', {}).items():
+        target['counters'][name] = target['counters'].get(name, 0) + value
+    for stage, hist in snapshot.get('histograms', {}).items():
+        if len(hist['buckets']) != len(BUCKETS):
+            # Файл записан с другими границами корзин
+            continue
+        merged = target['histograms'].setdefault(stage, _empty_histogram())
+        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], hist['buckets'])]
+        merged['sum'] += hist['sum']
+        merged['count'] += hist['count']
+
+
+class Metrics:
+    def __init__(self, folder=None):
+        # Абсолютный путь: последняя запись метрик выполняется при выходе, когда рабочая папка могла смениться
+        self.folder = os.path.abspath(folder or Config.METRICS_FOLDER)
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # После fork дочерний процесс начинает с пустых метрик и своим файлом
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._started_pid = None
+        self._path = None
+
+    def start(self):
+        """Запускает фоновую запись метрик текущего процесса (повторный вызов ничего не делает)"""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            os.makedirs(self.folder, exist_ok=True)
+            started = int(psutil.Process(pid).create_time())
+            self._path = os.path.join(self.folder, f"proc-{socket.gethostname()}-{pid}-{started}.json")
+            self._started_pid = pid
+
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+        # atexit не вызывается в процессах multiprocessing, Finalize - вызывается
+        atexit.register(self.flush)
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=0)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._started_pid == pid:
+            time.sleep(Config.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def observe(self, stage, seconds):
+        """Длительность этапа в секундах"""
+        self.start()
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = self._histograms[stage] = _empty_histogram()
+            if index < len(BUCKETS):
+                hist['buckets'][index] += 1
+            hist['sum'] += seconds
+            hist['count'] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name, value=1):
+        self.start()
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """Метрики текущего процесса; корзины гистограмм накопительные (как le в Prometheus)"""
+        with self._lock:
+            histograms = {}
+            for stage, hist in self._histograms.items():
+                cumulative, total = [], 0
+                for count in hist['buckets']:
+                    total += count
+                    cumulative.append(total)
+                histograms[stage] = {'buckets': cumulative, 'sum': hist['sum'], 'count': hist['count']}
+            counters = dict(self._counters)
+        return {
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'updated': time.time(),
+            'rss': psutil.Process().memory_info().rss,
+            'counters': counters,
+            'histograms': histograms
+        }
+
+    def flush(self):
+        """Записывает метрики процесса в его файл"""
+        if self._started_pid != os.getpid():
+            return
+        try:
+            snapshot = self.snapshot()
+            tmp_path = f"{self._path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            logger.warning(f"Не удалось записать метрики: {e}")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def collect(self):
+        """
+        Суммирует метрики всех процессов.
+        Возвращает (итог {'counters', 'histograms'}, [RSS работающих процессов]).
+        """
+        self.flush()
+        os.makedirs(self.folder, exist_ok=True)
+        now = time.time()
+        retired_path = os.path.join(self.folder, RETIRED_FILE)
+
+        with open(os.path.join(self.folder, '.lock'), 'w') as lock_file:
+            # Перенос завершённых процессов выполняет один процесс за раз
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            retired = self._read(retired_path) or {'counters': {}, 'histograms': {}}
+            total = {'counters': {}, 'histograms': {}}
+            _merge(total, retired)
+
+            processes = []
+            retired_changed = False
+            with os.scandir(self.folder) as entries:
+                paths = [entry.path for entry in entries
+                         if entry.name.startswith('proc-') and entry.name.endswith('.json')]
+            for path in paths:
+                snapshot = self._read(path)
+                if snapshot is None:
+                    continue
+                _merge(total, snapshot)
+                age = now - snapshot['updated']
+                if age > Config.METRICS_RETIRE_AFTER:
+                    _merge(retired, snapshot)
+                    retired_changed = True
+                    os.remove(path)
+                elif age <= Config.METRICS_FLUSH_INTERVAL * 3:
+                    processes.append(snapshot)
+
+            if retired_changed:
+                tmp_path = f"{retired_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(retired, f, separators=(',', ':'))
+                os.replace(tmp_path, retired_path)
+
+        return total, processes
+
+    def render(self, gauges=None):
+        """Текст для Prometheus; gauges - дополнительные {имя: (описание, значение)}"""
+        total, processes = self.collect()
+        lines = []
+
+        name = f"{PREFIX}_stage_seconds"
+        lines += [f"# HELP {name} Длительность этапов обработки, секунды",
+                  f"# TYPE {name} histogram"]
+        for stage in sorted(total['histograms']):
+            hist = total['histograms'][stage]
+            for bound, count in zip(BUCKETS, hist['buckets']):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {hist["count"]}')
+
+        for counter, description in COUNTERS.items():
+            name = f"{PREFIX}_{counter}_total"
+            lines += [f"# HELP {name} {description}",
+                      f"# TYPE {name} counter",
+                      f"{name} {total['counters'].get(counter, 0)}"]
+
+        name = f"{PREFIX}_process_rss_bytes"
+        lines += [f"# HELP {name} Резидентная память процесса (воркеры gunicorn, worker.py, пул миниатюр)",
+                  f"# TYPE {name} gauge"]
+        for snapshot in sorted(processes, key=lambda s: (s['host'], s['pid'])):
+            lines.append(f'{name}{{host="{snapshot["host"]}",pid="{snapshot["pid"]}"}} {snapshot["rss"]}')
+
+        for gauge, (description, value) in (gauges or {}).items():
+            name = f"{PREFIX}_{gauge}"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
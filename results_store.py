@@ -0,0 +1,147 @@
+# results_store.py
+"""
+Хранилище результатов загрузок (страница /admin/results/<id>).
+
+Результат записывается компактным JSON, сжатым gzip, в results/results_<id>.json.gz.
+Недавно открытые результаты держатся в памяти процесса (LRU). Старые результаты
+удаляются по сроку хранения и по общему размеру папки. Файлы прежнего формата
+results_<id>.json по-прежнему читаются и очищаются по тем же правилам.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RESULT_SUFFIXES = ('.json.gz', '.json')
+
+
+class ResultsStore:
+    def __init__(self, folder=None, cache_size=None):
+        self.folder = folder or Config.RESULTS_FOLDER
+        self.cache_size = Config.RESULTS_CACHE_SIZE if cache_size is None else cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_cleanup = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, result_id, suffix=RESULT_SUFFIXES[0]):
+        return os.path.join(self.folder, f"results_{result_id}{suffix}")
+
+    def _remember(self, result_id, data):
+        with self._lock:
+            self._cache[result_id] = data
+            self._cache.move_to_end(result_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def save(self, image_data, product_name=None):
+        """Сохраняет результаты и возвращает их id"""
+        result_id = uuid.uuid4().hex
+        results_data = {
+            'image_data': image_data,
+            'product_name': product_name or '',
+            'timestamp': datetime.now().isoformat()
+        }
+        path = self._path(result_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=Config.RESULTS_COMPRESSLEVEL) as f:
+                json.dump(results_data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"Результаты сохранены в {os.path.basename(path)} ({os.path.getsize(path)} байт)")
+
+        self._remember(result_id, results_data)
+        self.maybe_cleanup()
+        return result_id
+
+    def load(self, result_id):
+        """Результаты по id или None (не найдены, истёк срок хранения, файл повреждён)"""
+        with self._lock:
+            data = self._cache.get(result_id)
+            if data is not None:
+                self._cache.move_to_end(result_id)
+        # Файл мог быть удалён очисткой в другом процессе
+        if data is not None and os.path.exists(self._path(result_id)):
+            return data
+
+        for suffix in RESULT_SUFFIXES:
+            path = self._path(result_id, suffix)
+            if not os.path.exists(path):
+                continue
+            try:
+                if suffix == '.json.gz':
+                    with gzip.open(path, 'rt', encoding='utf-8') as f:
+                        data = json.load(f)
+                else:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+            except (OSError, EOFError, json.JSONDecodeError) as e:
+                logger.error(f"Ошибка чтения файла {path}: {e}")
+                return None
+            if 'image_data' not in data:
+                return None
+            # Прежний формат не кэшируем: его наличие не проверяется при чтении из кэша
+            if suffix == '.json.gz':
+                self._remember(result_id, data)
+            return data
+        return None
+
+    def maybe_cleanup(self):
+        """Очистка не чаще раза в RESULTS_CLEANUP_INTERVAL секунд на процесс"""
+        if time.time() - self._last_cleanup < Config.RESULTS_CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = time.time()
+        try:
+            self.cleanup()
+        except Exception as e:
+            logger.warning(f"Ошибка очистки результатов: {e}")
+
+    def cleanup(self, ttl=None, max_bytes=None):
+        """
+        Удаляет результаты старше ttl секунд, затем самые старые, пока общий
+        размер не станет меньше max_bytes (0 - без ограничения). Возвращает число удалённых.
+        """
+        ttl = Config.RESULTS_TTL if ttl is None else ttl
+        max_bytes = Config.RESULTS_MAX_BYTES if max_bytes is None else max_bytes
+        now = time.time()
+
+        files = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('results_') and entry.name.endswith(RESULT_SUFFIXES):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            expired = ttl and now - mtime > ttl
+            if not expired and (not max_bytes or total <= max_bytes):
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except FileNotFoundError:
+                pass
+
+        if removed:
+            logger.info(f"Удалено устаревших результатов: {removed}, осталось {total} байт")
+        return removed
@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const templateSelectForXLSX = document.getElementById('templateSelectForXLSX');
     const separatorSection = document.getElementById('separatorSection');
     const separatorSelect = document.getElementById('separatorSelect');
+    const formatSelect = document.getElementById('formatSelect');
     const templateSelect = document.getElementById('templateSelect');
     const articleSelect = document.getElementById('articleSelect');
     const urlList = document.getElementById('urlList');
@@ -17,6 +18,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const copyAllBtn = document.getElementById('copyAllBtn');
     const copyAllListBtn = document.getElementById('copyAllListBtn');
     const showAllBtn = document.getElementById('showAllBtn');
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
 
     // Новые элементы для удаления альбома и артикула
     const deleteAlbumBtn = document.getElementById('deleteAlbumBtn');
@@ -24,6 +26,28 @@ document.addEventListener('DOMContentLoaded', function() {
     const deleteAlbumSection = document.getElementById('deleteAlbumSection');
     const deleteArticleSection = document.getElementById('deleteArticleSection');
 
+    // Групповое удаление выбранных изображений
+    const selectionActions = document.getElementById('selectionActions');
+    const selectAllCheckbox = document.getElementById('selectAllCheckbox');
+    const deleteSelectedBtn = document.getElementById('deleteSelectedBtn');
+    const downloadSelectedBtn = document.getElementById('downloadSelectedBtn');
+    const downloadZipBtn = document.getElementById('downloadZipBtn');
+    const selectedCount = document.getElementById('selectedCount');
+
+    // Выгрузка нескольких альбомов (фоновая задача)
+    const bulkExportBtn = document.getElementById('bulkExportBtn');
+    const bulkExportModal = document.getElementById('bulkExportModal');
+    const bulkExportAlbums = document.getElementById('bulkExportAlbums');
+    const bulkExportSelectAll = document.getElementById('bulkExportSelectAll');
+    const bulkExportTemplate = document.getElementById('bulkExportTemplate');
+    const bulkExportSeparator = document.getElementById('bulkExportSeparator');
+    const bulkExportFormat = document.getElementById('bulkExportFormat');
+    const bulkExportBundle = document.getElementById('bulkExportBundle');
+    const bulkExportProgress = document.getElementById('bulkExportProgress');
+    const startBulkExportBtn = document.getElementById('startBulkExportBtn');
+    const cancelBulkExportBtn = document.getElementById('cancelBulkExportBtn');
+    let bulkExportPoll = null;
+
     // Элементы модального окна изображений
     const imageModal = document.getElementById('imageModal');
     const imageModalImg = document.getElementById('imageModalImg');
@@ -37,17 +61,24 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentImageIndex = 0;
     let allImages = [];
 
-    // Данные и состояние
-    let articleData = {};
+    // Сводка альбомов: { альбом: { артикул: количество файлов } }
+    let albumSummary = {};
     let currentTemplate = '';
     let currentArticle = '';
 
+    // Постраничная загрузка текущей выборки из /admin/api/archive
+    let currentQuery = null;
+    let nextCursor = null;
+    let pagePromise = null;
+    let currentTotal = 0;
+    let lastRenderedGroup = '';
+
     // Инициализация приложения
     initArchive();
 
     function initArchive() {
         initTheme();
-        processImageData();
+        loadSummary();
         initEventListeners();
     }
 
@@ -74,67 +105,32 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    function processImageData() {
-        if (imageData && Array.isArray(imageData)) {
-            // Сначала сортируем все данные
-            const sortedImageData = [...imageData].sort((a, b) => {
-                // Сортировка по шаблону
-                if (a.template < b.template) return -1;
-                if (a.template > b.template) return 1;
-
-                // Затем по артикулу
-                if (a.article < b.article) return -1;
-                if (a.article > b.article) return 1;
-
-                // Затем по порядковому номеру из имени файла
-                const matchA = a.filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-                const matchB = b.filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-
-                const numA = matchA ? parseInt(matchA[1], 10) : 0;
-                const numB = matchB ? parseInt(matchB[1], 10) : 0;
-
-                return numA - numB;
-            });
-
-            // Теперь группируем отсортированные данные
-            sortedImageData.forEach(item => {
-                const template = item.template;
-                const article = item.article;
-                if (!articleData[template]) {
-                    articleData[template] = {};
-                }
-                if (!articleData[template][article]) {
-                    articleData[template][article] = [];
+    // Загружает только список альбомов и артикулов; изображения подгружаются по выбору
+    function loadSummary() {
+        return fetch('/admin/api/archive/summary')
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    throw new Error(data.error);
                 }
-                articleData[template][article].push({
-                    url: item.url,
-                    filename: item.filename,
-                    thumbnail_url: item.thumbnail_url
-                });
-            });
-
-            // Дополнительная сортировка внутри каждого артикула
-            Object.keys(articleData).forEach(template => {
-                Object.keys(articleData[template]).forEach(article => {
-                    articleData[template][article].sort((a, b) => {
-                        const matchA = a.filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-                        const matchB = b.filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-
-                        const numA = matchA ? parseInt(matchA[1], 10) : 0;
-                        const numB = matchB ? parseInt(matchB[1], 10) : 0;
-
-                        return numA - numB;
+                albumSummary = {};
+                data.albums.forEach(album => {
+                    albumSummary[album.name] = {};
+                    album.articles.forEach(article => {
+                        albumSummary[album.name][article.name] = article.count;
                     });
                 });
+                populateTemplateList();
+            })
+            .catch(error => {
+                console.error('Ошибка загрузки списка альбомов:', error);
+                showNotification('Ошибка загрузки списка альбомов: ' + error.message, 'error');
             });
-
-            populateTemplateList();
-        }
     }
 
     function populateTemplateList() {
         templateSelect.innerHTML = '<option value="">-- Выберите альбом --</option>';
-        Object.keys(articleData).forEach(templateName => {
+        Object.keys(albumSummary).forEach(templateName => {
             const option = document.createElement('option');
             option.value = templateName;
             option.textContent = templateName;
@@ -143,14 +139,14 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function populateArticleList(templateName) {
-        if (!templateName || !articleData[templateName]) {
+        if (!templateName || !albumSummary[templateName]) {
             articleSelect.innerHTML = '<option value="">-- Выберите артикул --</option>';
             articleSelect.disabled = true;
             return;
         }
 
         articleSelect.innerHTML = '<option value="">-- Все артикулы --</option>';
-        Object.keys(articleData[templateName]).forEach(articleName => {
+        Object.keys(albumSummary[templateName]).forEach(articleName => {
             const option = document.createElement('option');
             option.value = articleName;
             option.textContent = articleName;
@@ -159,138 +155,168 @@ document.addEventListener('DOMContentLoaded', function() {
         articleSelect.disabled = false;
     }
 
+    // Количество файлов по сводке (весь архив, альбом или артикул)
+    function countFiles(templateName = '', articleName = '') {
+        let total = 0;
+        Object.entries(albumSummary).forEach(([album, articles]) => {
+            if (templateName && album !== templateName) return;
+            Object.entries(articles).forEach(([article, count]) => {
+                if (articleName && article !== articleName) return;
+                total += count;
+            });
+        });
+        return total;
+    }
+
     // Функция для обновления счетчика файлов
     function updateFileCounter() {
         const fileCounter = document.getElementById('fileCounter');
         const fileCountSpan = document.getElementById('fileCount');
-        const urlItems = document.querySelectorAll('#urlList .url-item');
-
-        const count = urlItems.length;
+        const count = document.querySelectorAll('#urlList .url-item').length;
 
         if (count > 0) {
-            fileCountSpan.textContent = count;
+            // Показываем, сколько файлов уже загружено из общего количества
+            fileCountSpan.textContent = count < currentTotal ? `${count} из ${currentTotal}` : count;
             fileCounter.style.display = 'block';
+        } else {
+            fileCounter.style.display = 'none';
+        }
+    }
 
-            // Добавляем информацию о том, что отображается
-            const archiveTitle = document.getElementById('archiveTitle');
-            let titleText = archiveTitle.textContent;
+    // Начинает показ новой выборки: очищает список и загружает первую страницу
+    function startListing(query, title, total) {
+        currentQuery = query;
+        nextCursor = null;
+        pagePromise = null;
+        currentTotal = total;
+        lastRenderedGroup = '';
 
-            // Убираем старый счётчик из заголовка если есть
-            titleText = titleText.replace(/\(\d+ файлов?\)/, '');
+        archiveTitle.textContent = title;
+        urlList.innerHTML = '';
+        loadMoreBtn.style.display = 'none';
+        bulkActions.style.display = total > 0 ? 'flex' : 'none';
+        selectionActions.style.display = total > 0 ? 'flex' : 'none';
+        updateFileCounter();
+        updateSelection();
 
-            // Добавляем счётчик в заголовка
-            archiveTitle.textContent = `${titleText} (${count} файлов)`;
-        } else {
-            fileCounter.style.display = 'none';
+        return loadNextPage();
+    }
 
-            // Убираем счётчик из заголовка
-            const archiveTitle = document.getElementById('archiveTitle');
-            let titleText = archiveTitle.textContent;
-            titleText = titleText.replace(/\(\d+ файлов?\)/, '');
-            archiveTitle.textContent = titleText;
+    // Загружает следующую страницу текущей выборки; возвращает true при успехе
+    function loadNextPage() {
+        if (!currentQuery) {
+            return Promise.resolve(false);
         }
+        if (pagePromise) {
+            return pagePromise;
+        }
+
+        const query = currentQuery;
+        const params = new URLSearchParams();
+        if (query.album) params.set('album', query.album);
+        if (query.article) params.set('article', query.article);
+        if (nextCursor) params.set('cursor', nextCursor);
+
+        loadMoreBtn.disabled = true;
+        pagePromise = fetch(`/admin/api/archive?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                // Пока ждали ответ, могли выбрать другой альбом
+                if (query !== currentQuery) {
+                    return false;
+                }
+                renderItems(data.items);
+                nextCursor = data.next_cursor;
+                updateSelection();
+                return true;
+            })
+            .catch(error => {
+                console.error('Ошибка загрузки изображений:', error);
+                showNotification('Ошибка загрузки изображений: ' + error.message, 'error');
+                return false;
+            })
+            .finally(() => {
+                if (query !== currentQuery) return;
+                pagePromise = null;
+                loadMoreBtn.disabled = false;
+                loadMoreBtn.style.display = nextCursor ? 'block' : 'none';
+                updateFileCounter();
+            });
+        return pagePromise;
+    }
+
+    // Догружает все оставшиеся страницы (для копирования и генерации документа)
+    function loadAllPages() {
+        if (!nextCursor) {
+            return Promise.resolve();
+        }
+        return loadNextPage().then(loaded => {
+            if (loaded && nextCursor) {
+                return loadAllPages();
+            }
+        });
+    }
+
+    function renderItems(items) {
+        items.forEach(item => {
+            // Заголовок перед первым изображением каждого артикула
+            const group = `${item.template}/${item.article}`;
+            if (group !== lastRenderedGroup && !currentQuery.article) {
+                const articleHeader = document.createElement('div');
+                articleHeader.className = 'article-info';
+                const count = (albumSummary[item.template] || {})[item.article] || 0;
+                articleHeader.textContent = currentQuery.album
+                    ? `Артикул: ${item.article} (${count} файлов)`
+                    : `Шаблон: ${item.template}, Артикул: ${item.article} (${count} файлов)`;
+                urlList.appendChild(articleHeader);
+            }
+            lastRenderedGroup = group;
+            urlList.appendChild(createUrlItem(item, item.article, item.template));
+        });
     }
 
-    // НОВАЯ ФУНКЦИЯ: Отображение всех ссылок выбранного каталога
+    // Отображение всех ссылок выбранного каталога
     function displayTemplateUrls(templateName) {
-        if (!templateName || !articleData[templateName]) {
+        if (!templateName || !albumSummary[templateName]) {
             urlList.innerHTML = '';
             archiveTitle.textContent = 'Каталог не найден';
             bulkActions.style.display = 'none';
             return;
         }
 
-        const urlsByArticle = articleData[templateName];
-
-        // Подсчитываем общее количество файлов
-        let totalFiles = 0;
-        Object.values(urlsByArticle).forEach(items => {
-            totalFiles += items.length;
-        });
-
-        archiveTitle.textContent = `Альбом: ${templateName} (все артикулы, ${totalFiles} файлов)`;
-        urlList.innerHTML = '';
-
-        // Проходим по всем артикулам в каталоге
-        Object.entries(urlsByArticle).forEach(([articleName, items]) => {
-            // Добавляем заголовок артикула
-            const articleHeader = document.createElement('div');
-            articleHeader.className = 'article-info';
-            articleHeader.textContent = `Артикул: ${articleName} (${items.length} файлов)`;
-            urlList.appendChild(articleHeader);
-
-            // Добавляем каждое изображение артикула
-            items.forEach(item => {
-                const urlItem = createUrlItem(item, articleName, templateName);
-                urlList.appendChild(urlItem);
-            });
-        });
-
-        bulkActions.style.display = 'flex';
-        updateFileCounter();
+        const totalFiles = countFiles(templateName);
+        startListing({ album: templateName },
+                     `Альбом: ${templateName} (все артикулы, ${totalFiles} файлов)`, totalFiles);
     }
 
     function displayUrls(templateName, articleName = '') {
-        if (!templateName || !articleData[templateName]) {
+        if (!templateName || !albumSummary[templateName]) {
+            currentQuery = null;
             urlList.innerHTML = '';
             archiveTitle.textContent = 'Каталог не найден';
             bulkActions.style.display = 'none';
+            loadMoreBtn.style.display = 'none';
             updateFileCounter();
             return;
         }
 
-        if (articleName && articleData[templateName][articleName]) {
+        if (articleName && albumSummary[templateName][articleName] !== undefined) {
             // Показать только выбранный артикул
-            const urls = articleData[templateName][articleName];
-            const fileCount = urls.length;
-            archiveTitle.textContent = `Альбом: ${templateName}, Артикул: ${articleName} (${fileCount} файлов)`;
-            urlList.innerHTML = '';
-
-            urls.forEach(item => {
-                const urlItem = createUrlItem(item, articleName, templateName);
-                urlList.appendChild(urlItem);
-            });
+            const fileCount = countFiles(templateName, articleName);
+            startListing({ album: templateName, article: articleName },
+                         `Альбом: ${templateName}, Артикул: ${articleName} (${fileCount} файлов)`, fileCount);
         } else {
             // Показать все артикулы каталога
             displayTemplateUrls(templateName);
         }
-
-        bulkActions.style.display = 'flex';
-        updateFileCounter();
     }
 
     function displayAllUrls() {
-        urlList.innerHTML = '';
-
-        const groupedUrls = {};
-        let totalFiles = 0;
-
-        if (imageData && Array.isArray(imageData)) {
-            imageData.forEach(item => {
-                if (!groupedUrls[item.article]) {
-                    groupedUrls[item.article] = [];
-                }
-                groupedUrls[item.article].push(item);
-                totalFiles++;
-            });
-        }
-
-        archiveTitle.textContent = `Все ссылки (${totalFiles} файлов)`;
-
-        Object.entries(groupedUrls).forEach(([articleName, items]) => {
-            const articleHeader = document.createElement('div');
-            articleHeader.className = 'article-info';
-            articleHeader.textContent = `Шаблон: ${items[0].template}, Артикул: ${articleName} (${items.length} файлов)`;
-            urlList.appendChild(articleHeader);
-
-            items.forEach(item => {
-                const urlItem = createUrlItem(item, articleName, item.template);
-                urlList.appendChild(urlItem);
-            });
-        });
-
-        bulkActions.style.display = 'flex';
-        updateFileCounter();
+        const totalFiles = countFiles();
+        startListing({}, `Все ссылки (${totalFiles} файлов)`, totalFiles);
 
         // Сбросить выбранные значения
         templateSelect.value = '';
@@ -311,6 +337,7 @@ document.addEventListener('DOMContentLoaded', function() {
         urlItem.setAttribute('data-template', templateName);
         urlItem.setAttribute('data-file', 'true');
         urlItem.innerHTML = `
+            <input type="checkbox" class="select-checkbox" data-url="${item.url}" title="Выбрать для удаления">
             <div class="preview-container">
                 <img
                     src="${item.thumbnail_url || item.url}"
@@ -318,6 +345,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     class="image-preview"
                     loading="lazy"
                     data-original-src="${item.url}"
+                    data-preview-src="${item.preview_url || item.url}"
                     data-filename="${item.filename}"
                     onerror="this.onerror=null; this.src='${item.url}';"
                 >
@@ -341,6 +369,14 @@ document.addEventListener('DOMContentLoaded', function() {
         templateSelect.addEventListener('change', handleTemplateChange);
         articleSelect.addEventListener('change', handleArticleChange);
         showAllBtn.addEventListener('click', displayAllUrls);
+        loadMoreBtn.addEventListener('click', loadNextPage);
+
+        // Выбор и групповое удаление изображений
+        urlList.addEventListener('change', handleSelectionChange);
+        selectAllCheckbox.addEventListener('change', handleSelectAll);
+        deleteSelectedBtn.addEventListener('click', handleDeleteSelected);
+        downloadSelectedBtn.addEventListener('click', handleDownloadSelected);
+        if (downloadZipBtn) downloadZipBtn.addEventListener('click', handleDownloadZip);
 
         // Кнопки удаления альбома и артикула
         if (deleteAlbumBtn) {
@@ -350,6 +386,27 @@ document.addEventListener('DOMContentLoaded', function() {
             deleteArticleBtn.addEventListener('click', handleDeleteArticle);
         }
 
+        // Выгрузка нескольких альбомов
+        if (bulkExportBtn) {
+            bulkExportBtn.addEventListener('click', openBulkExportModal);
+            bulkExportSelectAll.addEventListener('change', () => {
+                bulkExportAlbums.querySelectorAll('input').forEach(checkbox => {
+                    checkbox.checked = bulkExportSelectAll.checked;
+                });
+            });
+            bulkExportTemplate.addEventListener('change', () => {
+                bulkExportSeparator.style.display = bulkExportTemplate.value === 'В ячейку' ? 'block' : 'none';
+            });
+            // CSV/TSV не поддерживают несколько листов - только ZIP
+            bulkExportFormat.addEventListener('change', () => {
+                const textFormat = bulkExportFormat.value !== 'xlsx';
+                bulkExportBundle.value = textFormat ? 'zip' : bulkExportBundle.value;
+                bulkExportBundle.disabled = textFormat;
+            });
+            startBulkExportBtn.addEventListener('click', handleBulkExport);
+            cancelBulkExportBtn.addEventListener('click', () => bulkExportModal.style.display = 'none');
+        }
+
         // Модальное окно XLSX
         if (triggerXLSXModalBtn) {
             triggerXLSXModalBtn.addEventListener('click', () => xlsxModal.style.display = 'block');
@@ -439,8 +496,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 showNotification(`Альбом "${albumName}" успешно удален`, 'success');
 
                 // Обновляем интерфейс
-                delete articleData[albumName];
+                delete albumSummary[albumName];
                 populateTemplateList();
+                currentQuery = null;
+                currentTemplate = '';
+                currentArticle = '';
 
                 // Сбрасываем выбор
                 templateSelect.value = '';
@@ -453,6 +513,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 urlList.innerHTML = '';
                 archiveTitle.textContent = 'Выберите каталог';
                 bulkActions.style.display = 'none';
+                loadMoreBtn.style.display = 'none';
                 updateFileCounter();
 
             } else {
@@ -489,9 +550,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 showNotification(`Артикул "${articleName}" успешно удален из альбома "${albumName}"`, 'success');
 
                 // Обновляем данные
-                if (articleData[albumName] && articleData[albumName][articleName]) {
-                    delete articleData[albumName][articleName];
+                if (albumSummary[albumName]) {
+                    delete albumSummary[albumName][articleName];
                 }
+                currentArticle = '';
 
                 // Обновляем список артикулов
                 populateArticleList(albumName);
@@ -536,9 +598,11 @@ document.addEventListener('DOMContentLoaded', function() {
         if (selectedTemplate) {
             displayUrls(selectedTemplate);
         } else {
+            currentQuery = null;
             urlList.innerHTML = '';
             archiveTitle.textContent = 'Выберите каталог';
             bulkActions.style.display = 'none';
+            loadMoreBtn.style.display = 'none';
             articleSelect.disabled = true;
             updateFileCounter();
         }
@@ -572,7 +636,12 @@ document.addEventListener('DOMContentLoaded', function() {
         currentImageIndex = imageIndex;
         const image = allImages[currentImageIndex];
 
-        imageModalImg.src = image.originalSrc;
+        // В окне показываем превью; если его нет или оно не загрузилось - оригинал
+        imageModalImg.onerror = () => {
+            imageModalImg.onerror = null;
+            imageModalImg.src = image.originalSrc;
+        };
+        imageModalImg.src = image.previewSrc || image.originalSrc;
         imageModalFilename.textContent = image.filename;
         imageModalUrl.textContent = image.originalSrc;
 
@@ -631,6 +700,7 @@ document.addEventListener('DOMContentLoaded', function() {
             // Собираем все изображения на странице
             allImages = Array.from(document.querySelectorAll('.image-preview')).map((img, index) => ({
                 originalSrc: img.getAttribute('data-original-src') || img.src,
+                previewSrc: img.getAttribute('data-preview-src'),
                 filename: img.getAttribute('data-filename') || 'Изображение',
                 index: index
             }));
@@ -651,6 +721,7 @@ document.addEventListener('DOMContentLoaded', function() {
         templateSelectForXLSX.value = '';
         separatorSection.style.display = 'none';
         separatorSelect.value = 'comma';
+        formatSelect.value = 'xlsx';
     }
 
     function handleXLSXGeneration() {
@@ -674,14 +745,104 @@ document.addEventListener('DOMContentLoaded', function() {
 
             showNotification(message, 'success');
             closeXLSXModal();
-            downloadXLSXDocument(selectedTemplate, separator);
+            downloadXLSXDocument(selectedTemplate, separator, formatSelect.value);
         } else {
             showNotification('Пожалуйста, выберите шаблон.', 'error');
         }
     }
 
+    function openBulkExportModal() {
+        bulkExportAlbums.innerHTML = '';
+        Object.keys(albumSummary).forEach(albumName => {
+            const label = document.createElement('label');
+            const checkbox = document.createElement('input');
+            checkbox.type = 'checkbox';
+            checkbox.value = albumName;
+            checkbox.checked = albumName === currentTemplate;
+            label.appendChild(checkbox);
+            label.appendChild(document.createTextNode(` ${albumName} (${countFiles(albumName)})`));
+            bulkExportAlbums.appendChild(label);
+        });
+        bulkExportSelectAll.checked = false;
+        if (!bulkExportPoll) {
+            bulkExportProgress.textContent = '';
+        }
+        bulkExportModal.style.display = 'block';
+    }
+
+    function handleBulkExport() {
+        const albums = Array.from(bulkExportAlbums.querySelectorAll('input:checked')).map(checkbox => checkbox.value);
+        if (!albums.length) {
+            showNotification('Выберите хотя бы один альбом', 'error');
+            return;
+        }
+
+        startBulkExportBtn.disabled = true;
+        bulkExportProgress.textContent = '⏳ Выгрузка в очереди...';
+
+        fetch('/admin/export-albums', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                albums: albums,
+                template_name: bulkExportTemplate.value,
+                separator: bulkExportTemplate.value === 'В ячейку' ? bulkExportSeparator.value : 'comma',
+                format: bulkExportFormat.value,
+                bundle: bulkExportBundle.value
+            })
+        })
+        .then(response => response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error || 'Ошибка сервера');
+            }
+            pollBulkExport(data.status_url);
+        }))
+        .catch(error => {
+            startBulkExportBtn.disabled = false;
+            bulkExportProgress.textContent = '';
+            showNotification('Ошибка выгрузки: ' + error.message, 'error');
+        });
+    }
+
+    // Общий прогресс по изображениям всех выбранных альбомов
+    function pollBulkExport(statusUrl) {
+        bulkExportPoll = setInterval(() => {
+            fetch(statusUrl)
+            .then(response => response.json())
+            .then(job => {
+                if (job.error && !job.status) {
+                    throw new Error(job.error);
+                }
+                if (job.status === 'running' && job.files_total > 0) {
+                    bulkExportProgress.textContent = `⏳ Обработано ${job.files_done} из ${job.files_total} изображений`;
+                }
+                if (job.status === 'done') {
+                    stopBulkExportPoll();
+                    const empty = job.result.empty_albums.length;
+                    bulkExportProgress.textContent = `✅ Готово: ${job.result.images} изображений` +
+                        (empty ? `, альбомов без изображений: ${empty}` : '');
+                    window.location.href = job.download_url;
+                } else if (job.status === 'failed') {
+                    throw new Error(job.error || 'Ошибка выгрузки');
+                }
+            })
+            .catch(error => {
+                stopBulkExportPoll();
+                bulkExportProgress.textContent = '';
+                showNotification('Ошибка выгрузки: ' + error.message, 'error');
+            });
+        }, 1000);
+    }
+
+    function stopBulkExportPoll() {
+        clearInterval(bulkExportPoll);
+        bulkExportPoll = null;
+        startBulkExportBtn.disabled = false;
+    }
+
     function handleWindowClick(event) {
         if (event.target === xlsxModal) closeXLSXModal();
+        if (event.target === bulkExportModal) bulkExportModal.style.display = 'none';
         if (event.target === imageModal) closeImageModal();
     }
 
@@ -756,6 +917,14 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function copyAllToClipboard() {
+        loadAllPages().then(copyLoadedUrls);
+    }
+
+    function copyAllListToClipboard() {
+        loadAllPages().then(copyLoadedUrlsList);
+    }
+
+    function copyLoadedUrls() {
         const urlItems = document.querySelectorAll('#urlList .url-text');
         if (!urlItems.length) {
             showNotification('Нет ссылок для копирования', 'error');
@@ -766,7 +935,7 @@ document.addEventListener('DOMContentLoaded', function() {
         copyToClipboard(allUrls);
     }
 
-    function copyAllListToClipboard() {
+    function copyLoadedUrlsList() {
         const urlItems = document.querySelectorAll('#urlList .url-text');
         if (!urlItems.length) {
             showNotification('Нет ссылок для копирования', 'error');
@@ -792,79 +961,28 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    /**
-     * Получает текущие отображаемые данные из DOM
-     */
-    function getCurrentDisplayData() {
-        const currentData = [];
-        const urlItems = document.querySelectorAll('#urlList .url-item');
-
-        urlItems.forEach(urlItem => {
-            const articleElement = urlItem.querySelector('.article-info');
-            const urlElement = urlItem.querySelector('.url-text');
-            const filenameElement = urlItem.querySelector('small');
-
-            if (articleElement && urlElement) {
-                const article = articleElement.textContent.replace('Артикул: ', '').trim();
-                const url = urlElement.getAttribute('data-url');
-                const filename = filenameElement ? filenameElement.textContent : url.split('/').pop();
-
-                currentData.push({
-                    url: url,
-                    article: article,
-                    filename: filename
-                });
-            }
-        });
-
-        return currentData;
-    }
-
-    function downloadXLSXDocument(selectedTemplateName, separator = 'comma') {
-        const currentData = getCurrentDisplayData();
-
-        if (currentData.length === 0) {
+    function downloadXLSXDocument(selectedTemplateName, separator = 'comma', format = 'xlsx') {
+        if (!currentQuery || currentTotal === 0) {
             showNotification('Нет данных для генерации документа', 'error');
             return;
         }
 
-        // Применяем сортировку к текущим данным
-        const sortedData = [...currentData].sort((a, b) => {
-            // Сортировка по артикулу
-            if (a.article < b.article) return -1;
-            if (a.article > b.article) return 1;
-
-            // Если артикулы равны, сортировка по числовому порядковому номеру из имени файла
-            const matchA = a.filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-            const matchB = b.filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-
-            const numA = matchA ? parseInt(matchA[1], 10) : 0;
-            const numB = matchB ? parseInt(matchB[1], 10) : 0;
-
-            return numA - numB;
-        });
-
-        // Формируем imageDataToSend из отсортированной структуры
-        const imageDataToSend = sortedData.map(item => ({
-            url: item.url,
-            article: item.article,
-            filename: item.filename
-        }));
-
         if (!selectedTemplateName.trim()) {
             showNotification('Имя шаблона пустое. Невозможно выбрать шаблон.', 'error');
             return;
         }
 
-        showNotification('Генерация XLSX документа...', 'success');
+        showNotification(`Генерация ${format.toUpperCase()} документа...`, 'success');
 
         fetch('/admin/download-xlsx', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
+            // Документ строится на сервере по всей выборке из индекса, а не по загруженным страницам
             body: JSON.stringify({
-                image_data: imageDataToSend,
+                selector: currentQuery,
                 template_name: selectedTemplateName,
-                separator: separator
+                separator: separator,
+                format: format
             })
         })
         .then(response => {
@@ -894,14 +1012,14 @@ document.addEventListener('DOMContentLoaded', function() {
 //            filenameParts.push(separator === 'newline' ? 'перенос' : 'запятые');
 
             const timestamp = new Date().toISOString().slice(0, 19).replace(/:/g, '-');
-            const filename = `${filenameParts.join('_')}_${timestamp}.xlsx`;
+            const filename = `${filenameParts.join('_')}_${timestamp}.${format}`;
 
             a.download = filename;
             document.body.appendChild(a);
             a.click();
             window.URL.revokeObjectURL(url);
             document.body.removeChild(a);
-            showNotification('XLSX документ успешно сгенерирован и скачан!', 'success');
+            showNotification(`${format.toUpperCase()} документ успешно сгенерирован и скачан!`, 'success');
         })
         .catch(error => {
             console.error('Ошибка при генерации XLSX:', error);
@@ -923,6 +1041,13 @@ document.addEventListener('DOMContentLoaded', function() {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
+                const templateName = urlItemElement.getAttribute('data-template');
+                const articleName = urlItemElement.getAttribute('data-article');
+                if (albumSummary[templateName] && albumSummary[templateName][articleName]) {
+                    albumSummary[templateName][articleName]--;
+                }
+                currentTotal = Math.max(currentTotal - 1, 0);
+
                 urlItemElement.remove();
                 showNotification('Изображение и файлы успешно удалены', 'success');
 
@@ -944,6 +1069,120 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    function getSelectedItems() {
+        return Array.from(urlList.querySelectorAll('.select-checkbox:checked'))
+            .map(checkbox => checkbox.closest('.url-item'));
+    }
+
+    function updateSelection() {
+        const checkboxes = urlList.querySelectorAll('.select-checkbox');
+        const selected = getSelectedItems().length;
+        selectedCount.textContent = selected;
+        deleteSelectedBtn.disabled = selected === 0;
+        downloadSelectedBtn.disabled = selected === 0;
+        selectAllCheckbox.checked = checkboxes.length > 0 && selected === checkboxes.length;
+    }
+
+    function handleSelectionChange(e) {
+        if (e.target.classList.contains('select-checkbox')) {
+            e.target.closest('.url-item').classList.toggle('selected', e.target.checked);
+            updateSelection();
+        }
+    }
+
+    function handleSelectAll() {
+        urlList.querySelectorAll('.select-checkbox').forEach(checkbox => {
+            checkbox.checked = selectAllCheckbox.checked;
+            checkbox.closest('.url-item').classList.toggle('selected', checkbox.checked);
+        });
+        updateSelection();
+    }
+
+    // Удаление выбранных изображений одним запросом
+    function handleDeleteSelected() {
+        const items = getSelectedItems();
+        if (!items.length) return;
+        if (!confirm(`Удалить выбранные изображения (${items.length})? Это действие нельзя отменить.`)) {
+            return;
+        }
+
+        const originalText = deleteSelectedBtn.innerHTML;
+        deleteSelectedBtn.innerHTML = '⏳ Удаление...';
+        deleteSelectedBtn.disabled = true;
+
+        fetch('/admin/delete-batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                targets: items.map(item => ({ image_url: item.querySelector('.select-checkbox').getAttribute('data-url') }))
+            })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            const failed = new Set(data.errors.map(error => error.target.image_url));
+            items.forEach(item => {
+                if (failed.has(item.querySelector('.select-checkbox').getAttribute('data-url'))) return;
+                const templateName = item.getAttribute('data-template');
+                const articleName = item.getAttribute('data-article');
+                if (albumSummary[templateName] && albumSummary[templateName][articleName]) {
+                    albumSummary[templateName][articleName]--;
+                }
+                currentTotal = Math.max(currentTotal - 1, 0);
+                item.remove();
+            });
+
+            if (failed.size) {
+                showNotification(`Удалено: ${data.deleted}, ошибок: ${failed.size}`, 'error');
+            } else {
+                showNotification(`Удалено изображений: ${data.deleted}`, 'success');
+            }
+            updateFileCounter();
+            if (!document.querySelectorAll('.url-item').length) {
+                setTimeout(() => window.location.reload(), 1000);
+            }
+        })
+        .catch(error => {
+            console.error('Ошибка при удалении изображений:', error);
+            showNotification('Ошибка при удалении: ' + error.message, 'error');
+        })
+        .finally(() => {
+            deleteSelectedBtn.innerHTML = originalText;
+            updateSelection();
+        });
+    }
+
+    // ZIP оригиналов выдаётся потоком; браузер скачивает его сам и может докачать
+    function handleDownloadZip() {
+        if (!currentQuery || !currentQuery.album) {
+            showNotification('Сначала выберите альбом', 'error');
+            return;
+        }
+        window.location.href = '/admin/download-album?' + new URLSearchParams(currentQuery).toString();
+    }
+
+    function handleDownloadSelected() {
+        const items = getSelectedItems();
+        if (!items.length) return;
+
+        // Обычная отправка формы, а не fetch: архив сохраняется браузером без загрузки в память страницы
+        const form = document.createElement('form');
+        form.method = 'POST';
+        form.action = '/admin/download-album';
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = 'targets';
+        input.value = JSON.stringify(
+            items.map(item => ({ image_url: item.querySelector('.select-checkbox').getAttribute('data-url') }))
+        );
+        form.appendChild(input);
+        document.body.appendChild(form);
+        form.submit();
+        form.remove();
+    }
+
     function handleDeleteClick(e) {
         if (e.target.classList.contains('delete-btn')) {
             const imageUrl = e.target.getAttribute('data-url');
@@ -9,9 +9,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const templateSelectForXLSX = document.getElementById('templateSelectForXLSX');
     const separatorSection = document.getElementById('separatorSection');
     const separatorSelect = document.getElementById('separatorSelect');
+    const formatSelect = document.getElementById('formatSelect');
     const copyAllBtn = document.getElementById('copyAllBtn');
     const copyAllListBtn = document.getElementById('copyAllListBtn');
     const archiveInput = document.getElementById('archive');
+    const archiveForm = document.getElementById('archive-form');
 
     // Элементы модального окна изображений
     const imageModal = document.getElementById('imageModal');
@@ -28,6 +30,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Переменные для управления индикатором загрузки
     let loadingCheckInterval;
+    let jobPollInterval;
+
+    // Повторные попытки отправки одной части архива перед тем, как сдаться
+    const MAX_CHUNK_RETRIES = 5;
 
     // Инициализация темы
     initTheme();
@@ -87,6 +93,192 @@ document.addEventListener('DOMContentLoaded', function() {
         if (loadingCheckInterval) {
             clearInterval(loadingCheckInterval);
         }
+        if (jobPollInterval) {
+            clearInterval(jobPollInterval);
+        }
+    }
+
+    function setLoadingText(text) {
+        const loadingText = document.getElementById('loadingText');
+        if (loadingText) {
+            loadingText.textContent = text;
+        }
+    }
+
+    function formatGb(bytes) {
+        return `${(bytes / 1024 ** 3).toFixed(1)} ГБ`;
+    }
+
+    function loadAdmissionStatus() {
+        const admissionStatus = document.getElementById('admissionStatus');
+        fetch('/admin/api/admission')
+        .then(response => response.json())
+        .then(state => {
+            if (!state.enabled) {
+                admissionStatus.textContent = '';
+                return;
+            }
+            const limits = state.limits;
+            const queued = state.waiting.length + (state.queued_jobs || 0);
+            let text = `⚙️ Обработка архивов: ${state.active.length} из ${limits.max_active}, ` +
+                `в очереди ${queued} из ${limits.queue_max}. ` +
+                `Зарезервировано: диск ${formatGb(state.reserved_disk_bytes)}, память ${formatGb(state.reserved_memory_bytes)}; ` +
+                `свободно на диске ${formatGb(limits.disk_available_bytes)}`;
+            if (state.waiting.length) {
+                text += `. Ожидают: ${state.waiting.map(item => item.label).join(', ')}`;
+            }
+            admissionStatus.textContent = text;
+        })
+        .catch(error => console.warn('Не удалось получить состояние очереди обработки:', error));
+    }
+
+    // Отправка архива частями: после обрыва соединения загрузка продолжается
+    // с последней принятой части, в том числе после перезагрузки страницы
+    function handleArchiveSubmit(e) {
+        if (!archiveInput || archiveInput.files.length === 0) {
+            return;
+        }
+        e.preventDefault();
+
+        const albumInput = archiveForm.querySelector('[name="album_name"]');
+
+        showLoadingIndicator();
+        setLoadingText('⏳ Загрузка архива на сервер...');
+
+        uploadArchiveInChunks(archiveInput.files[0], albumInput ? albumInput.value : '')
+        .then(data => {
+            if (data.job_id) {
+                pollJobStatus(data.job_id);
+            } else if (data.result_url) {
+                // Фоновая обработка отключена - архив уже обработан
+                window.location.href = data.result_url;
+            } else {
+                throw new Error(data.error || 'Ошибка при загрузке архива');
+            }
+        })
+        .catch(error => {
+            console.error('Ошибка загрузки архива:', error);
+            hideLoadingIndicator();
+            showNotification(error.message || 'Ошибка при загрузке архива', 'error');
+        });
+    }
+
+    async function uploadArchiveInChunks(file, albumName) {
+        // id незавершённой загрузки этого же файла сохраняется в браузере
+        const storageKey = `archiveUpload:${file.name}:${file.size}:${file.lastModified}`;
+        let upload = await resumeUpload(localStorage.getItem(storageKey), file);
+        if (!upload) {
+            upload = await requestJson('/admin/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: file.name, size: file.size, album_name: albumName })
+            });
+            localStorage.setItem(storageKey, upload.upload_id);
+        }
+
+        let received = upload.received;
+        let failures = 0;
+        while (received < file.size) {
+            const chunk = file.slice(received, Math.min(received + upload.chunk_size, file.size));
+            try {
+                received = (await sendChunk(upload.upload_url, received, chunk)).received;
+                failures = 0;
+                setLoadingText(`⏳ Загрузка архива на сервер: ${Math.floor(received / file.size * 100)}%`);
+            } catch (error) {
+                failures++;
+                if (failures > MAX_CHUNK_RETRIES) {
+                    throw error;
+                }
+                setLoadingText(`⏳ Связь с сервером прервана, повтор через ${failures} с...`);
+                await new Promise(resolve => setTimeout(resolve, failures * 1000));
+                // Часть могла быть принята, даже если ответ не дошёл - сверяемся с сервером
+                received = (await requestJson(upload.upload_url)).received;
+            }
+        }
+
+        setLoadingText('⏳ Архив загружен, передаём на обработку...');
+        const result = await requestJson(`${upload.upload_url}/complete`, { method: 'POST' });
+        localStorage.removeItem(storageKey);
+        return result;
+    }
+
+    async function resumeUpload(uploadId, file) {
+        if (!uploadId) {
+            return null;
+        }
+        try {
+            const upload = await requestJson(`/admin/uploads/${encodeURIComponent(uploadId)}`);
+            return upload.size === file.size ? upload : null;
+        } catch (error) {
+            return null;
+        }
+    }
+
+    async function sendChunk(uploadUrl, offset, chunk) {
+        const data = await chunk.arrayBuffer();
+        const headers = {
+            'Content-Type': 'application/octet-stream',
+            'X-Chunk-Sha256': await chunkChecksum(data)
+        };
+        return requestJson(`${uploadUrl}?offset=${offset}`, { method: 'PUT', headers: headers, body: data });
+    }
+
+    async function chunkChecksum(data) {
+        // crypto.subtle есть только в защищённом контексте (https, localhost), иначе - sha256.js
+        if (window.crypto && window.crypto.subtle) {
+            const digest = await window.crypto.subtle.digest('SHA-256', data);
+            return Array.from(new Uint8Array(digest))
+                .map(byte => byte.toString(16).padStart(2, '0')).join('');
+        }
+        return sha256Hex(data);
+    }
+
+    async function requestJson(url, options = {}) {
+        const response = await fetch(url, options);
+        let data = {};
+        try {
+            data = await response.json();
+        } catch (err) {
+            data = { error: 'Некорректный ответ сервера' };
+        }
+        if (!response.ok) {
+            throw new Error(data.error || 'Ошибка сервера');
+        }
+        return data;
+    }
+
+    // Опрос статуса фоновой обработки архива
+    function pollJobStatus(jobId) {
+        setLoadingText('⏳ Архив в очереди на обработку...');
+
+        jobPollInterval = setInterval(() => {
+            fetch(`/admin/jobs/${encodeURIComponent(jobId)}`)
+            .then(response => response.json())
+            .then(job => {
+                if (job.error && !job.status) {
+                    throw new Error(job.error);
+                }
+                if (job.status === 'running' && job.admission_position) {
+                    setLoadingText(`⏳ Архив ждёт свободных ресурсов: ${job.admission_position}-й в очереди (${job.files_total} файлов)`);
+                } else if (job.status === 'running' && job.files_total > 0) {
+                    setLoadingText(`⏳ Обработано ${job.files_done} из ${job.files_total} файлов (${job.throughput} файлов/с)`);
+                }
+                if (job.status === 'done') {
+                    clearInterval(jobPollInterval);
+                    if (job.errors.length) {
+                        console.warn('Ошибки обработки архива:', job.errors);
+                    }
+                    window.location.href = job.result_url;
+                } else if (job.status === 'failed') {
+                    throw new Error(job.error || 'Ошибка при обработке архива');
+                }
+            })
+            .catch(error => {
+                console.error('Ошибка фоновой обработки:', error);
+                hideLoadingIndicator();
+                showNotification(error.message, 'error');
+            });
+        }, 1000);
     }
 
     function startLoadingCheck() {
@@ -184,8 +376,23 @@ document.addEventListener('DOMContentLoaded', function() {
         // Навигация по клавиатуре
         document.addEventListener('keydown', handleKeyboardNavigation);
 
+        // Архив обрабатывается в фоне - следим за задачей
+        if (archiveForm) {
+            archiveForm.addEventListener('submit', handleArchiveSubmit);
+            if (archiveForm.dataset.jobId) {
+                showLoadingIndicator();
+                pollJobStatus(archiveForm.dataset.jobId);
+            }
+        }
+
+        // Загруженность обработки архивов (очередь допуска по ресурсам)
+        if (document.getElementById('admissionStatus')) {
+            loadAdmissionStatus();
+            setInterval(loadAdmissionStatus, 15000);
+        }
+
         // Обработчики отправки форм
-        const forms = document.querySelectorAll('form');
+        const forms = document.querySelectorAll('form:not(#archive-form)');
         forms.forEach(form => {
             form.addEventListener('submit', function(e) {
                 // Проверяем, есть ли файлы для загрузки
@@ -222,6 +429,7 @@ document.addEventListener('DOMContentLoaded', function() {
         templateSelectForXLSX.value = '';
         separatorSection.style.display = 'none';
         separatorSelect.value = 'comma';
+        formatSelect.value = 'xlsx';
     }
 
     // Обработка генерации XLSX
@@ -235,7 +443,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         if (selectedTemplate) {
             closeXLSXModal();
-            downloadXLSXDocument(selectedTemplate, separator);
+            downloadXLSXDocument(selectedTemplate, separator, formatSelect.value);
         } else {
             showNotification('Пожалуйста, выберите шаблон.', 'error');
         }
@@ -248,7 +456,12 @@ document.addEventListener('DOMContentLoaded', function() {
         currentImageIndex = imageIndex;
         const image = allImages[currentImageIndex];
 
-        imageModalImg.src = image.originalSrc;
+        // В окне показываем превью; если его нет или оно не загрузилось - оригинал
+        imageModalImg.onerror = () => {
+            imageModalImg.onerror = null;
+            imageModalImg.src = image.originalSrc;
+        };
+        imageModalImg.src = image.previewSrc || image.originalSrc;
         imageModalFilename.textContent = image.filename;
         imageModalUrl.textContent = image.originalSrc;
 
@@ -307,6 +520,7 @@ document.addEventListener('DOMContentLoaded', function() {
             // Собираем все изображения на странице
             allImages = Array.from(document.querySelectorAll('.image-preview')).map((img, index) => ({
                 originalSrc: img.getAttribute('data-original-src') || img.src,
+                previewSrc: img.getAttribute('data-preview-src'),
                 filename: img.getAttribute('data-filename') || 'Изображение',
                 index: index
             }));
@@ -434,15 +648,19 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Генерация XLSX документа
-    function downloadXLSXDocument(selectedTemplateName, separator = 'comma') {
-        const urlItems = document.querySelectorAll('.url-item');
-        if (!urlItems.length) {
-            showNotification('Нет ссылок для генерации документа', 'error');
-            return;
+    // Порядковый номер, сохранённый при загрузке; для старых результатов - из имени файла
+    function itemOrder(itemElement) {
+        if (itemElement.dataset.order !== undefined) {
+            return parseInt(itemElement.dataset.order, 10) || 0;
         }
+        const filename = itemElement.querySelector('.url-text').getAttribute('data-url').split('/').pop();
+        const match = filename.match(/_(\d+)_[a-f0-9]+\.\w+$/);
+        return match ? parseInt(match[1], 10) : 0;
+    }
 
-        // Собираем данные и сразу сортируем
+    // Генерация XLSX документа
+    // Данные ссылок со страницы, отсортированные по артикулу и порядковому номеру
+    function collectImageData(urlItems) {
         const imageData = [];
         const urlItemArray = Array.from(urlItems);
 
@@ -455,19 +673,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 return articleA.localeCompare(articleB);
             }
 
-            // Если артикулы одинаковые, сортируем по порядковому номеру из URL
-            const urlA = a.querySelector('.url-text').getAttribute('data-url');
-            const urlB = b.querySelector('.url-text').getAttribute('data-url');
-            const filenameA = urlA.split('/').pop();
-            const filenameB = urlB.split('/').pop();
-
-            const matchA = filenameA.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-            const matchB = filenameB.match(/_(\d+)_[a-f0-9]+\.\w+$/);
-
-            const numA = matchA ? parseInt(matchA[1], 10) : 0;
-            const numB = matchB ? parseInt(matchB[1], 10) : 0;
-
-            return numA - numB;
+            // Если артикулы одинаковые, сортируем по порядковому номеру
+            return itemOrder(a) - itemOrder(b);
         });
 
         // Теперь собираем отсортированные данные
@@ -476,29 +683,54 @@ document.addEventListener('DOMContentLoaded', function() {
             const urlElement = itemElement.querySelector('.url-text');
             if (articleElement && urlElement) {
                 const article = articleElement.textContent.replace('Артикул: ', '').trim();
-                imageData.push({
+                const item = {
                     url: urlElement.getAttribute('data-url'),
                     article: article,
                     filename: urlElement.getAttribute('data-url').split('/').pop()
-                });
+                };
+                if (itemElement.dataset.order !== undefined) {
+                    item.order = itemOrder(itemElement);
+                }
+                imageData.push(item);
             }
         });
 
+        return imageData;
+    }
+
+    function downloadXLSXDocument(selectedTemplateName, separator = 'comma', format = 'xlsx') {
+        const urlItems = document.querySelectorAll('.url-item');
+        if (!urlItems.length) {
+            showNotification('Нет ссылок для генерации документа', 'error');
+            return;
+        }
+
+        const requestData = {
+            template_name: selectedTemplateName,
+            separator: separator,  // Добавляем разделитель
+            format: format
+        };
+
+        // Сохранённые результаты сервер читает сам, список ссылок не передаём
+        const urlList = document.getElementById('urlList');
+        const resultId = urlList ? urlList.getAttribute('data-result-id') : '';
+        if (resultId) {
+            requestData.result_id = resultId;
+        } else {
+            requestData.image_data = collectImageData(urlItems);
+        }
+
         if (!selectedTemplateName.trim()) {
             showNotification('Имя шаблона пустое. Невозможно выбрать шаблон.', 'error');
             return;
         }
 
-        showNotification('Генерация XLSX документа для шаблона: ' + selectedTemplateName, 'success');
+        showNotification(`Генерация ${format.toUpperCase()} документа для шаблона: ${selectedTemplateName}`, 'success');
 
         fetch('/admin/download-xlsx', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                image_data: imageData,
-                template_name: selectedTemplateName,
-                separator: separator  // Добавляем разделитель
-            })
+            body: JSON.stringify(requestData)
         })
         .then(response => {
             if (!response.ok) {
@@ -512,12 +744,12 @@ document.addEventListener('DOMContentLoaded', function() {
             a.style.display = 'none';
             a.href = url;
             const timestamp = new Date().toISOString().slice(0, 19).replace(/:/g, '-');
-            a.download = `${selectedTemplateName}_${separator === 'newline' ? 'перенос' : 'запятые'}_${timestamp}.xlsx`;
+            a.download = `${selectedTemplateName}_${separator === 'newline' ? 'перенос' : 'запятые'}_${timestamp}.${format}`;
             document.body.appendChild(a);
             a.click();
             window.URL.revokeObjectURL(url);
             document.body.removeChild(a);
-            showNotification('XLSX документ успешно сгенерирован и скачан!', 'success');
+            showNotification(`${format.toUpperCase()} документ успешно сгенерирован и скачан!`, 'success');
         })
         .catch(error => {
             console.error('Ошибка при генерации XLSX:', error);
@@ -0,0 +1,71 @@
+// SHA-256 на чистом JavaScript: контрольная сумма частей загрузки, когда crypto.subtle
+// недоступен (страница открыта по http, не с localhost)
+(function(global) {
+    const K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+    ]);
+
+    function compress(state, words, block, offset) {
+        for (let i = 0; i < 16; i++) {
+            words[i] = block.getUint32(offset + i * 4);
+        }
+        for (let i = 16; i < 64; i++) {
+            const w15 = words[i - 15];
+            const w2 = words[i - 2];
+            const s0 = ((w15 >>> 7) | (w15 << 25)) ^ ((w15 >>> 18) | (w15 << 14)) ^ (w15 >>> 3);
+            const s1 = ((w2 >>> 17) | (w2 << 15)) ^ ((w2 >>> 19) | (w2 << 13)) ^ (w2 >>> 10);
+            words[i] = (words[i - 16] + s0 + words[i - 7] + s1) | 0;
+        }
+
+        let a = state[0], b = state[1], c = state[2], d = state[3];
+        let e = state[4], f = state[5], g = state[6], h = state[7];
+        for (let i = 0; i < 64; i++) {
+            const s1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const t1 = (h + s1 + ((e & f) ^ (~e & g)) + K[i] + words[i]) | 0;
+            const s0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const t2 = (s0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+            h = g; g = f; f = e; e = (d + t1) | 0;
+            d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+        state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+    }
+
+    // ArrayBuffer -> шестнадцатеричная строка SHA-256
+    function sha256Hex(buffer) {
+        const state = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        const words = new Uint32Array(64);
+        const length = buffer.byteLength;
+        const fullBlocks = Math.floor(length / 64) * 64;
+
+        const data = new DataView(buffer);
+        for (let offset = 0; offset < fullBlocks; offset += 64) {
+            compress(state, words, data, offset);
+        }
+
+        // Хвост данных, бит 1 и длина в битах (64 бита, старшим байтом вперёд)
+        const tailLength = length - fullBlocks;
+        const tail = new Uint8Array(tailLength < 56 ? 64 : 128);
+        tail.set(new Uint8Array(buffer, fullBlocks, tailLength));
+        tail[tailLength] = 0x80;
+        const tailView = new DataView(tail.buffer);
+        tailView.setUint32(tail.length - 8, Math.floor(length / 0x20000000));
+        tailView.setUint32(tail.length - 4, (length << 3) >>> 0);
+        for (let offset = 0; offset < tail.length; offset += 64) {
+            compress(state, words, tailView, offset);
+        }
+
+        return Array.from(state).map(word => word.toString(16).padStart(8, '0')).join('');
+    }
+
+    global.sha256Hex = sha256Hex;
+})(window);
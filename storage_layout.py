@@ -0,0 +1,150 @@
+# storage_layout.py
+"""
+Размещение папок артикулов в uploads.
+
+Плоская раскладка: uploads/<альбом>/<артикул>/<файл>. В альбоме с тысячами
+артикулов одна папка содержит тысячи подпапок, и обход, удаление и поиск
+файлов (в том числе nginx) на ext4/overlayfs замедляются.
+
+Раскладка с шардами (STORAGE_SHARDED=1): uploads/<альбом>/_<xx>/<артикул>/<файл>,
+где xx - первые STORAGE_SHARD_CHARS шестнадцатеричных знаков md5 имени
+артикула: артикулы распределяются по 256 (4096) папкам. Подчёркивание
+отличает папку шарда от артикула - safe_folder_name не оставляет "_" в начале
+имени. Публичные URL /images/<альбом>/<артикул>/<файл> не меняются: nginx
+сначала ищет файл по плоскому пути, а не найдя - спрашивает путь у приложения
+(X-Accel-Redirect, /internal/images/...).
+
+Пока раскладка переводится (flask --app app migrate-layout), файлы ищутся
+в обеих раскладках, новая загрузка пишется в выбранную.
+"""
+import hashlib
+import logging
+import os
+import re
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX = '_'
+SHARD_NAME = re.compile(r'_[0-9a-f]+')
+
+
+def shard_name(article):
+    """Папка шарда артикула: '_' и начало md5 имени"""
+    digest = hashlib.md5(article.encode('utf-8')).hexdigest()
+    return SHARD_PREFIX + digest[:Config.STORAGE_SHARD_CHARS]
+
+
+def is_shard_name(name):
+    return SHARD_NAME.fullmatch(name) is not None
+
+
+def article_dir(root, album, article, sharded=None):
+    """Папка артикула в заданной раскладке (по умолчанию - в выбранной в Config)"""
+    if Config.STORAGE_SHARDED if sharded is None else sharded:
+        return os.path.join(root, album, shard_name(article), article)
+    return os.path.join(root, album, article)
+
+
+def article_dirs(root, album, article):
+    """Существующие папки артикула: сначала в выбранной раскладке, затем в другой"""
+    dirs = []
+    for sharded in (Config.STORAGE_SHARDED, not Config.STORAGE_SHARDED):
+        path = article_dir(root, album, article, sharded)
+        if os.path.isdir(path):
+            dirs.append(path)
+    return dirs
+
+
+def find_article_dir(root, album, article):
+    """Папка, где лежит артикул; для нового артикула - папка в выбранной раскладке"""
+    dirs = article_dirs(root, album, article)
+    return dirs[0] if dirs else article_dir(root, album, article)
+
+
+def file_path(root, album, article, filename):
+    """Путь к файлу артикула: в выбранной раскладке, иначе в другой, если файл лежит там"""
+    path = os.path.join(article_dir(root, album, article), filename)
+    if os.path.exists(path):
+        return path
+    other = os.path.join(article_dir(root, album, article, not Config.STORAGE_SHARDED), filename)
+    return other if os.path.exists(other) else path
+
+
+def iter_articles(album_path):
+    """Папки артикулов альбома (os.DirEntry) в обеих раскладках"""
+    with os.scandir(album_path) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if not is_shard_name(entry.name):
+                yield entry
+                continue
+            with os.scandir(entry.path) as articles:
+                for article_entry in articles:
+                    if article_entry.is_dir():
+                        yield article_entry
+
+
+def remove_empty_article_dirs(root, album, article):
+    """Удаляет опустевшие папки артикула (в обеих раскладках) и его шарда"""
+    for sharded in (True, False):
+        path = article_dir(root, album, article, sharded)
+        for folder in (path, os.path.dirname(path)) if sharded else (path,):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+
+
+def _merge_dir(source, target):
+    """Переносит файлы source в существующую папку target (артикул есть в обеих раскладках)"""
+    with os.scandir(source) as entries:
+        for entry in entries:
+            destination = os.path.join(target, entry.name)
+            if os.path.exists(destination):
+                logger.warning(f"Файл уже есть в новой раскладке, оставлен на месте: {entry.path}")
+                continue
+            os.rename(entry.path, destination)
+    try:
+        os.rmdir(source)
+    except OSError:
+        pass
+
+
+def migrate(root, sharded=True, dry_run=False):
+    """
+    Переводит uploads в раскладку sharded на месте: папки артикулов переносятся
+    os.rename в пределах одного раздела (ссылки дедупликации и миниатюры не копируются).
+    Повторный запуск продолжает прерванный перевод. Возвращает число перенесённых артикулов.
+    """
+    moved = 0
+    if not os.path.isdir(root):
+        return moved
+    with os.scandir(root) as albums:
+        album_names = [entry.name for entry in albums if entry.is_dir() and not entry.name.startswith('.')]
+
+    for album in sorted(album_names):
+        album_path = os.path.join(root, album)
+        for entry in list(iter_articles(album_path)):
+            target = article_dir(root, album, entry.name, sharded)
+            if os.path.abspath(entry.path) == os.path.abspath(target):
+                continue
+            moved += 1
+            if dry_run:
+                continue
+            if os.path.isdir(target):
+                _merge_dir(entry.path, target)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(entry.path, target)
+            if not sharded:
+                # Опустевшая папка шарда после перевода обратно в плоскую раскладку
+                try:
+                    os.rmdir(os.path.dirname(entry.path))
+                except OSError:
+                    pass
+            if moved % 1000 == 0:
+                logger.info(f"Перенесено артикулов: {moved}")
+    return moved
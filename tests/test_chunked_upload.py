@@ -0,0 +1,84 @@
+# tests/test_chunked_upload.py
+"""Загрузка архива частями: завершение при заполненной очереди обработки"""
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setUpModule():
+    # Папки Config относительные и создаются при импорте: приложение работает во временной папке
+    # (папка не удаляется: метрики процесса записываются в неё при выходе)
+    global previous_cwd, app_module
+    previous_cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='tecnobook-test-'))
+    os.symlink(os.path.join(ROOT, 'templates'), 'templates')
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+
+def tearDownModule():
+    os.chdir(previous_cwd)
+
+
+def make_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_ref:
+        for number in range(3):
+            image = io.BytesIO()
+            Image.new('RGB', (40, 40), 'red').save(image, 'JPEG')
+            zip_ref.writestr(f'ART{number}/{number}.jpg', image.getvalue())
+    return buffer.getvalue()
+
+
+class CompleteWhileQueueFullTest(unittest.TestCase):
+    def setUp(self):
+        self.config = app_module.Config
+        self.queue_max = self.config.ADMISSION_QUEUE_MAX
+        self.background = self.config.BACKGROUND_INGEST
+        self.config.ADMISSION_QUEUE_MAX = 1
+        self.config.BACKGROUND_INGEST = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        self.config.ADMISSION_QUEUE_MAX = self.queue_max
+        self.config.BACKGROUND_INGEST = self.background
+
+    def upload(self, data):
+        response = self.client.post('/admin/uploads', json={'filename': 'a.zip', 'size': len(data)})
+        self.assertEqual(response.status_code, 201)
+        upload = response.get_json()
+        response = self.client.put(f"{upload['upload_url']}?offset=0", data=data,
+                                   headers={'X-Chunk-Sha256': hashlib.sha256(data).hexdigest()})
+        self.assertEqual(response.status_code, 200)
+        return upload
+
+    def test_upload_is_kept_and_can_be_completed_later(self):
+        data = make_archive()
+        upload = self.upload(data)
+        # Очередь заполняется уже после передачи всех частей
+        blocker = app_module.job_queue.enqueue('ingest_archive', {'archive_path': '', 'album_name': '', 'filename': ''})
+
+        response = self.client.post(f"{upload['upload_url']}/complete")
+        self.assertEqual(response.status_code, 503)
+        status = self.client.get(upload['upload_url'])
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.get_json()['received'], len(data))
+
+        app_module.job_queue.fail(blocker, 'test')
+        response = self.client.post(f"{upload['upload_url']}/complete")
+        self.assertEqual(response.status_code, 202)
+        job = app_module.job_queue.get(response.get_json()['job_id'])
+        self.assertTrue(os.path.isfile(job['payload']['archive_path']))
+        self.assertEqual(job['files_total'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
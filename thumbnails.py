@@ -0,0 +1,206 @@
+# thumbnails.py
+"""
+Миниатюры и превью изображений за одно декодирование.
+
+JPEG декодируется сразу в уменьшенном масштабе (Image.draft, 1/2 - 1/8),
+ближайшем к самому большому из нужных размеров; остальные размеры
+получаются каскадом из уже уменьшенного изображения. Файлы сохраняются
+рядом с оригиналом как <имя>_<размер>.jpg (<имя>_thumb.jpg, <имя>_preview.jpg).
+
+Дополнительно (Config.MODERN_FORMATS) оригинал и каждый размер сохраняются в
+WebP/AVIF рядом с исходным файлом: <файл>.webp, <файл>.avif. nginx отдаёт их
+вместо исходного файла, если браузер принимает формат (заголовок Accept).
+Версия, которая получилась не меньше исходного файла, не сохраняется.
+"""
+import logging
+import math
+import os
+import time
+
+from PIL import Image
+
+from config import Config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Параметры сохранения современных форматов (ключ - расширение файла)
+MODERN_SAVE_OPTIONS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', {'quality': 60}),
+}
+# Оригиналы, для которых создаются WebP/AVIF версии
+MODERN_SOURCE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+# Миниатюры, созданные до единого формата <имя>_thumb.jpg
+LEGACY_THUMB_SUFFIXES = ('_thumb.jpeg', '_thumb.png')
+
+
+def derivative_filenames(stem, sizes=None):
+    """Имена файлов производных изображений для оригинала с именем stem (без расширения)"""
+    sizes = sizes or Config.THUMBNAIL_SIZES
+    return {name: f"{stem}_{name}.jpg" for name in sizes}
+
+
+def derived_filenames(filenames, sizes=None):
+    """
+    Имена миниатюр, превью (в том числе прежних форматов) и WebP/AVIF версий, которые
+    создаются для оригиналов filenames. Производный файл определяется по имени, выведенному
+    из оригинала рядом с ним, а не по окончанию: загруженный оригинал ..._preview.jpg
+    остаётся оригиналом.
+    """
+    names = set()
+    for filename in filenames:
+        stem = os.path.splitext(filename)[0]
+        derived = list(derivative_filenames(stem, sizes).values())
+        derived += [stem + suffix for suffix in LEGACY_THUMB_SUFFIXES]
+        names.update(derived)
+        names.update(modern_filenames([filename] + derived))
+    return names
+
+
+def modern_formats():
+    """Форматы из Config.MODERN_FORMATS, которые поддерживает установленный Pillow"""
+    Image.init()
+    return [fmt for fmt in Config.MODERN_FORMATS
+            if fmt in MODERN_SAVE_OPTIONS and MODERN_SAVE_OPTIONS[fmt][0] in Image.SAVE]
+
+
+def modern_targets(original_path, targets, formats=None):
+    """
+    Цели WebP/AVIF для оригинала и производных JPEG: {'original.webp': путь.webp, 'thumb.webp': ...}.
+    Добавляются к targets render_derivatives.
+    """
+    formats = modern_formats() if formats is None else formats
+    sources = list(targets.items())
+    # GIF (анимация) и WebP оригиналы не перекодируются
+    if os.path.splitext(original_path)[1][1:].lower() in MODERN_SOURCE_EXTENSIONS:
+        sources.insert(0, ('original', original_path))
+    return {f"{name}.{fmt}": f"{path}.{fmt}" for name, path in sources for fmt in formats}
+
+
+def modern_filenames(filenames):
+    """Имена WebP/AVIF версий файлов (для удаления вместе с оригиналом; все известные форматы)"""
+    return [f"{filename}.{fmt}" for filename in filenames for fmt in MODERN_SAVE_OPTIONS]
+
+
+def flatten_to_rgb(img):
+    """Приводит изображение к RGB; прозрачность заменяется белым фоном"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def save_modern(img, path, fmt, reference_path):
+    """
+    Сохраняет img в формате fmt; если файл получился не меньше reference_path
+    (исходного JPEG/PNG), удаляет его. True, если версия сохранена.
+    """
+    image_format, options = MODERN_SAVE_OPTIONS[fmt]
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'P', 'PA') else 'RGB')
+    img.save(path, image_format, **options)
+    if os.path.getsize(path) >= os.path.getsize(reference_path):
+        os.remove(path)
+        return False
+    return True
+
+
+def render_derivatives(source, targets, sizes=None, quality=None, use_draft=True):
+    """
+    Создаёт производные изображения за одно декодирование source (путь или файловый объект).
+
+    targets - {имя: путь к файлу}: имя размера (JPEG) или '<размер>.<формат>' для WebP/AVIF,
+    где размер 'original' - оригинал без уменьшения (см. modern_targets).
+    sizes - {имя размера: (ширина, высота)}.
+    Возвращает (созданные файлы {имя: путь}, замеры времени в миллисекундах).
+    """
+    sizes = sizes or Config.THUMBNAIL_SIZES
+    quality = quality or Config.THUMBNAIL_QUALITY
+    timings = {}
+    created = {}
+
+    jpeg_names = [name for name in targets if '.' not in name]
+    modern = {name: name.partition('.') for name in targets if '.' in name}
+    # Размеры, которые нужно получить (JPEG или его WebP/AVIF версию); от большего к меньшему
+    names = sorted(set(jpeg_names) | {size for size, _, _ in modern.values() if size != 'original'},
+                   key=lambda name: sizes[name][0] * sizes[name][1], reverse=True)
+    keep_original = any(size == 'original' for size, _, _ in modern.values())
+
+    start = time.perf_counter()
+    with Image.open(source) as img:
+        timings['original'] = img.size
+
+        # Декодирование JPEG сразу в масштабе не меньше самого большого размера
+        # (с учётом пропорций: draft требует, чтобы обе стороны были не меньше заданных).
+        # Для WebP/AVIF версии оригинала нужен полный размер.
+        if use_draft and not keep_original and names and img.format == 'JPEG':
+            largest = sizes[names[0]]
+            scale = min(largest[0] / img.width, largest[1] / img.height)
+            img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img.load()
+        timings['decoded'] = img.size
+        timings['decode_ms'] = (time.perf_counter() - start) * 1000
+
+        # WebP/AVIF версии оригинала - до масштабирования: thumbnail уменьшает изображение на месте
+        step = time.perf_counter()
+        for name, (size, _, fmt) in modern.items():
+            reference = targets[name][:-len(fmt) - 1]
+            if size == 'original' and os.path.exists(reference) and save_modern(img, targets[name], fmt, reference):
+                created[name] = targets[name]
+        save_ms = (time.perf_counter() - step) * 1000
+
+        step = time.perf_counter()
+        current = flatten_to_rgb(img)
+        resized = {}
+        for name in names:
+            current.thumbnail(sizes[name], Image.Resampling.LANCZOS)
+            resized[name] = current.copy()
+        timings['resize_ms'] = (time.perf_counter() - step) * 1000
+
+    step = time.perf_counter()
+    for name in jpeg_names:
+        resized[name].save(targets[name], "JPEG", quality=quality, optimize=True)
+        created[name] = targets[name]
+    for name, (size, _, fmt) in modern.items():
+        # Версия сравнивается с файлом, рядом с которым лежит (путь без .<формат>)
+        reference = targets[name][:-len(fmt) - 1]
+        if size == 'original' or not os.path.exists(reference):
+            continue
+        if save_modern(resized[size], targets[name], fmt, reference):
+            created[name] = targets[name]
+    timings['save_ms'] = save_ms + (time.perf_counter() - step) * 1000
+    timings['total_ms'] = (time.perf_counter() - start) * 1000
+    return created, timings
+
+
+def format_timings(timings):
+    """Строка с замерами для журнала"""
+    return (f"{timings['original'][0]}x{timings['original'][1]} -> "
+            f"{timings['decoded'][0]}x{timings['decoded'][1]}, "
+            f"декодирование {timings['decode_ms']:.1f} мс, "
+            f"масштабирование {timings['resize_ms']:.1f} мс, "
+            f"сохранение {timings['save_ms']:.1f} мс, "
+            f"всего {timings['total_ms']:.1f} мс")
+
+
+def create_derivatives(source, targets):
+    """
+    Создаёт миниатюры и превью; ошибки не прерывают загрузку.
+    Возвращает {имя размера: путь} (пустой словарь при ошибке).
+    """
+    try:
+        created, timings = render_derivatives(source, targets)
+        metrics.observe('thumbnail_decode', timings['decode_ms'] / 1000)
+        metrics.observe('thumbnail_resize', timings['resize_ms'] / 1000)
+        metrics.observe('thumbnail_encode', timings['save_ms'] / 1000)
+        logger.debug(f"Миниатюры {os.path.basename(targets.get('thumb', ''))}: {format_timings(timings)}")
+        return created
+    except Exception as e:
+        logger.error(f"Ошибка при создании миниатюр {', '.join(targets.values())}: {e}")
+        return {}
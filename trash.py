@@ -0,0 +1,70 @@
+# trash.py
+"""
+Отложенное удаление папок альбомов и артикулов.
+
+Папка атомарно переименовывается в uploads/.trash (та же файловая система),
+поэтому сразу пропадает из архива и из /images/, а медленное рекурсивное
+удаление выполняет фоновый поток. Если процесс завершится раньше, оставшееся
+удалит следующий запуск очистки (при следующем удалении, старте воркера
+или командой flask --app app sweep-trash).
+"""
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Trash:
+    def __init__(self, root=None):
+        self.root = root or Config.TRASH_FOLDER
+        self._sweep_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def move(self, path):
+        """Переносит файл или папку в корзину; возвращает новый путь"""
+        target = os.path.join(self.root, f"{uuid.uuid4().hex}-{os.path.basename(path)}")
+        os.rename(path, target)
+        logger.info(f"Перенесено в корзину: {path}")
+        return target
+
+    @staticmethod
+    def _ignore_missing(function, path, exc_info):
+        # Ту же папку может одновременно очищать другой процесс
+        if not issubclass(exc_info[0], FileNotFoundError):
+            logger.warning(f"Ошибка удаления {path}: {exc_info[1]}")
+
+    def sweep(self):
+        """Удаляет всё содержимое корзины; возвращает количество удалённых элементов"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0
+        try:
+            removed = 0
+            with os.scandir(self.root) as entries:
+                items = list(entries)
+            for entry in items:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, onerror=self._ignore_missing)
+                    else:
+                        os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Ошибка удаления {entry.path}: {e}")
+            if removed:
+                logger.info(f"Корзина очищена, удалено элементов: {removed}")
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+    def sweep_async(self):
+        """Запускает очистку корзины в фоновом потоке, не дожидаясь её окончания"""
+        thread = threading.Thread(target=self.sweep, name='trash-sweeper', daemon=True)
+        thread.start()
+        return thread
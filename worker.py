@@ -0,0 +1,40 @@
+# worker.py
+"""
+Выделенный воркер фоновых задач (обработка архивов).
+
+Запуск: python worker.py
+Количество потоков - Config.JOB_WORKERS (переменная окружения JOB_WORKERS).
+"""
+import logging
+import signal
+
+from jobs import start_workers
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    # Импорт здесь, а не в начале модуля: процессы пулов (forkserver) импортируют
+    # запускаемый скрипт и не должны создавать приложение
+    import app  # регистрирует обработчики задач
+
+    metrics.start()
+    stop_event, threads = start_workers()
+    # Остатки корзины, которые не успели удалить веб-процессы
+    app.trash.sweep_async()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Получен сигнал {signum}, воркер завершает текущие задачи")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# zip_scan.py
+"""
+Предварительная проверка ZIP-архива по центральному каталогу, до распаковки.
+
+Читается только оглавление архива (ZipFile.infolist), данные файлов не
+распаковываются: число файлов, объём после распаковки, степень сжатия,
+повторяющиеся имена и число изображений по артикулам известны за
+миллисекунды. По ним архив сразу отклоняется (zip-бомба, перекрывающиеся
+записи, слишком большой архив, нет изображений) или принимается
+с предупреждениями, а прогресс обработки с самого начала знает точное
+число файлов.
+"""
+import logging
+import os
+import zipfile
+from collections import Counter
+
+from config import Config, allowed_file
+
+logger = logging.getLogger(__name__)
+
+SKIP_NAMES = ('thumbs.db', '.ds_store')
+SUPPORTED_COMPRESSION = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA)
+# Минимальный размер локального заголовка записи (без имени и дополнительных полей)
+LOCAL_HEADER_SIZE = 30
+# Изображений меньше этой доли файлов архива - предупреждение
+WARN_IMAGE_SHARE = 0.5
+MAX_LISTED = 10  # Сколько имён показывать в сообщениях
+
+
+class ZipScanError(Exception):
+    """Архив отклонён по результатам проверки оглавления"""
+
+
+def format_size(size):
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if size < 1024 or unit == 'ГБ':
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def listed(names):
+    names = list(names)
+    more = f" и ещё {len(names) - MAX_LISTED}" if len(names) > MAX_LISTED else ''
+    return ', '.join(names[:MAX_LISTED]) + more
+
+
+class ZipScan:
+    """Сведения об архиве по центральному каталогу"""
+
+    def __init__(self):
+        self.files = 0  # Файлов в архиве (без папок)
+        self.images = []  # ZipInfo изображений, которые будут обработаны, в порядке архива
+        self.skipped = []  # Имена прочих файлов
+        self.unreadable = []  # Изображения, которые нельзя распаковать (шифрование, метод сжатия)
+        self.total_size = 0  # Байт изображений после распаковки
+        self.compressed_size = 0  # Байт изображений в архиве
+        self.max_ratio = 0.0
+        self.max_ratio_name = None
+        self.duplicate_names = []  # Одинаковые пути в оглавлении
+        self.duplicate_files = []  # Одинаковые имена файлов в одном артикуле (в разных папках архива)
+        self.overlapping = []  # Записи, данные которых перекрывают соседние или выходят за архив
+        self.articles = Counter()
+
+    @property
+    def ratio(self):
+        return self.total_size / self.compressed_size if self.compressed_size else 1.0
+
+    @property
+    def image_share(self):
+        return len(self.images) / self.files if self.files else 0.0
+
+    def summary(self):
+        """Краткий отчёт числами (без списков имён)"""
+        return {
+            'files': self.files,
+            'images': len(self.images),
+            'skipped': len(self.skipped),
+            'unreadable': len(self.unreadable),
+            'total_size': self.total_size,
+            'compressed_size': self.compressed_size,
+            'ratio': round(self.ratio, 2),
+            'max_ratio': round(self.max_ratio, 2),
+            'duplicate_names': len(self.duplicate_names),
+            'duplicate_files': len(self.duplicate_files),
+            'articles': len(self.articles),
+            'max_per_article': max(self.articles.values(), default=0)
+        }
+
+
+def scan_archive(zip_ref, article_of):
+    """
+    Разбирает оглавление открытого ZipFile. article_of(имя в архиве) - артикул файла,
+    по нему считаются изображения по артикулам и одинаковые имена внутри артикула.
+    """
+    scan = ZipScan()
+    names = Counter()
+    article_files = Counter()
+    display_names = {}
+    entries = []
+
+    for file_info in zip_ref.infolist():
+        if file_info.is_dir():
+            continue
+        scan.files += 1
+        names[file_info.filename] += 1
+        entries.append(file_info)
+
+        lower_name = file_info.filename.lower()
+        if not allowed_file(file_info.filename) or any(skip in lower_name for skip in SKIP_NAMES):
+            scan.skipped.append(file_info.filename)
+            continue
+        if file_info.flag_bits & 0x1 or file_info.compress_type not in SUPPORTED_COMPRESSION:
+            scan.unreadable.append(file_info.filename)
+            continue
+
+        scan.images.append(file_info)
+        scan.total_size += file_info.file_size
+        scan.compressed_size += file_info.compress_size
+        if file_info.file_size >= Config.ZIP_RATIO_MIN_SIZE:
+            ratio = file_info.file_size / max(file_info.compress_size, 1)
+            if ratio > scan.max_ratio:
+                scan.max_ratio, scan.max_ratio_name = ratio, file_info.filename
+
+        article = article_of(file_info.filename)
+        scan.articles[article] += 1
+        filename = os.path.basename(file_info.filename.replace('\\', '/'))
+        article_files[(article, filename.lower())] += 1
+        display_names.setdefault((article, filename.lower()), f"{article}/{filename}")
+
+    scan.duplicate_names = [name for name, count in names.items() if count > 1]
+    scan.duplicate_files = [display_names[key] for key, count in article_files.items() if count > 1]
+
+    # Данные записей идут друг за другом и заканчиваются до центрального каталога;
+    # перекрытие - признак zip-бомбы из многократно используемых данных
+    end = getattr(zip_ref, 'start_dir', None)
+    entries.sort(key=lambda info: info.header_offset)
+    for current, following in zip(entries, entries[1:] + [None]):
+        limit = following.header_offset if following is not None else end
+        if limit is not None and current.header_offset + LOCAL_HEADER_SIZE + current.compress_size > limit:
+            scan.overlapping.append(current.filename)
+    return scan
+
+
+def check_scan(scan):
+    """
+    Сверяет отчёт с лимитами Config (0 - без ограничения). ZipScanError со всеми
+    причинами отказа; иначе - список предупреждений.
+    """
+    errors = []
+    if scan.overlapping:
+        errors.append(f"Повреждённый архив или zip-бомба: данные записей перекрываются ({listed(scan.overlapping)})")
+    if Config.ZIP_MAX_FILES and scan.files > Config.ZIP_MAX_FILES:
+        errors.append(f"Слишком много файлов в архиве: {scan.files}, допустимо {Config.ZIP_MAX_FILES}")
+    if Config.ZIP_MAX_UNCOMPRESSED and scan.total_size > Config.ZIP_MAX_UNCOMPRESSED:
+        errors.append(f"Слишком большой объём после распаковки: {format_size(scan.total_size)}, "
+                      f"допустимо {format_size(Config.ZIP_MAX_UNCOMPRESSED)}")
+    if Config.ZIP_MAX_RATIO and scan.max_ratio > Config.ZIP_MAX_RATIO:
+        errors.append(f"Подозрение на zip-бомбу: {scan.max_ratio_name} сжат в {scan.max_ratio:.0f} раз, "
+                      f"допустимо {Config.ZIP_MAX_RATIO}")
+    if not scan.images:
+        errors.append('В архиве не найдено подходящих изображений')
+    elif scan.image_share < Config.ZIP_MIN_IMAGE_SHARE:
+        errors.append(f"В архиве в основном не изображения: {len(scan.images)} из {scan.files} файлов")
+    if errors:
+        raise ZipScanError('; '.join(errors))
+
+    warnings = []
+    if scan.image_share < WARN_IMAGE_SHARE:
+        warnings.append(f"Изображений только {len(scan.images)} из {scan.files} файлов, "
+                        f"остальные пропущены ({listed(scan.skipped)})")
+    if scan.unreadable:
+        warnings.append(f"Изображения зашифрованы или сжаты неподдерживаемым методом и будут пропущены: "
+                        f"{listed(scan.unreadable)}")
+    if scan.duplicate_names:
+        warnings.append(f"Повторяющиеся имена в архиве: {listed(scan.duplicate_names)}")
+    if scan.duplicate_files:
+        warnings.append(f"Одинаковые имена файлов в одном артикуле (сохранятся оба): {listed(scan.duplicate_files)}")
+    return warnings
+
+
+def log_scan(scan, warnings=()):
+    top = ', '.join(f"{article}: {count}" for article, count in scan.articles.most_common(3))
+    logger.info(f"Архив: файлов {scan.files}, изображений {len(scan.images)} "
+                f"({format_size(scan.total_size)}, сжатие {scan.ratio:.2f}, макс. {scan.max_ratio:.2f}), "
+                f"артикулов {len(scan.articles)} (больше всего - {top})")
+    for warning in warnings:
+        logger.warning(warning)
@@ -0,0 +1,259 @@
+# zip_stream.py
+"""
+Потоковая выдача ZIP-архива файлов из uploads без временных файлов.
+
+Файлы записываются без сжатия (stored): изображения уже сжаты. CRC-32 каждого
+файла считается при чтении и пишется после его данных (data descriptor),
+поэтому размер архива и положение каждого байта известны заранее по одним
+размерам файлов: у ответа есть Content-Length, а любой диапазон байт (Range,
+докачка) формируется без генерации предыдущих частей. Для файлов и архивов
+больше 4 ГБ и для более чем 65535 файлов используется ZIP64.
+
+В памяти - только описание файлов и буфер чтения, независимо от размера альбома.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# Бит 3 - CRC и размеры в data descriptor после данных, бит 11 - имена в UTF-8
+FLAGS = 0x0808
+# Версия 3.0, Unix: внешние атрибуты - права файла
+VERSION_MADE_BY = (3 << 8) | 30
+FILE_ATTRIBUTES = 0o100644 << 16
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+CENTRAL_HEADER = struct.Struct('<4sHHHHHHLLLHHHHHLL')
+DESCRIPTOR = struct.Struct('<4sLLL')
+DESCRIPTOR64 = struct.Struct('<4sLQQ')
+END_RECORD = struct.Struct('<4sHHHHLLH')
+END_RECORD64 = struct.Struct('<4sQHHLLQQQQ')
+END_LOCATOR64 = struct.Struct('<4sLQL')
+
+
+class ZipStreamError(IOError):
+    """Файл изменился или пропал после того, как архив был описан"""
+
+
+class CrcCache:
+    """CRC-32 уже прочитанных файлов по (путь, размер, mtime): докачка не перечитывает файлы"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+crc_cache = CrcCache()
+
+
+def dos_datetime(timestamp):
+    """Дата и время файла в формате ZIP (MS-DOS); раньше 1980 года ZIP не умеет"""
+    t = time.localtime(max(timestamp, 315532800))
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipEntry:
+    def __init__(self, arcname, path, stat, offset):
+        self.name = arcname.encode('utf-8')
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.time, self.date = dos_datetime(stat.st_mtime)
+        self.offset = offset
+        self.crc = crc_cache.get(self.cache_key)
+        self.zip64 = self.size >= ZIP64_LIMIT
+        # ZIP64 в центральном каталоге нужен и для файлов, начинающихся дальше 4 ГБ
+        self.central_zip64 = self.zip64 or offset >= ZIP64_LIMIT
+        self.version = 45 if self.central_zip64 else 20
+
+    @property
+    def cache_key(self):
+        return self.path, self.size, self.mtime_ns
+
+    def local_header(self):
+        if self.zip64:
+            # Размеры неизвестны до data descriptor; значения в заголовке - нули
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            sizes = ZIP64_LIMIT
+        else:
+            extra = b''
+            sizes = 0
+        return LOCAL_HEADER.pack(b'PK\x03\x04', self.version, FLAGS, 0, self.time, self.date,
+                                 0, sizes, sizes, len(self.name), len(extra)) + self.name + extra
+
+    def local_header_size(self):
+        return LOCAL_HEADER.size + len(self.name) + (20 if self.zip64 else 0)
+
+    def descriptor(self):
+        if self.zip64:
+            return DESCRIPTOR64.pack(b'PK\x07\x08', self.crc, self.size, self.size)
+        return DESCRIPTOR.pack(b'PK\x07\x08', self.crc, self.size, self.size)
+
+    def descriptor_size(self):
+        return DESCRIPTOR64.size if self.zip64 else DESCRIPTOR.size
+
+    def _central_extra(self):
+        fields = []
+        if self.zip64:
+            fields += [self.size, self.size]
+        if self.offset >= ZIP64_LIMIT:
+            fields.append(self.offset)
+        if not fields:
+            return b''
+        return struct.pack(f'<HH{len(fields)}Q', 0x0001, 8 * len(fields), *fields)
+
+    def central_header(self):
+        extra = self._central_extra()
+        size = ZIP64_LIMIT if self.zip64 else self.size
+        offset = min(self.offset, ZIP64_LIMIT)
+        return CENTRAL_HEADER.pack(b'PK\x01\x02', VERSION_MADE_BY, self.version, FLAGS, 0, self.time, self.date,
+                                   self.crc, size, size, len(self.name), len(extra), 0, 0, 0,
+                                   FILE_ATTRIBUTES, offset) + self.name + extra
+
+    def central_header_size(self):
+        return CENTRAL_HEADER.size + len(self.name) + len(self._central_extra())
+
+
+class ZipStream:
+    """
+    ZIP-архив из файлов на диске, выдаваемый частями.
+
+    files - [(имя в архиве, путь к файлу)]; отсутствующие файлы пропускаются.
+    Размеры и даты берутся при создании объекта: если файл изменится до выдачи
+    его данных, выдача прерывается ZipStreamError (клиент получит неполный ответ).
+    """
+
+    def __init__(self, files, chunk_size=1024 * 1024):
+        self.chunk_size = chunk_size
+        self.entries = []
+        # Части архива подряд: (смещение, длина, вид, запись)
+        self.segments = []
+        offset = 0
+        for arcname, path in files:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                logger.warning(f"Файл для ZIP не найден: {path}")
+                continue
+            entry = ZipEntry(arcname, path, stat, offset)
+            self.entries.append(entry)
+            for kind, length in (('local', entry.local_header_size()), ('data', entry.size),
+                                 ('descriptor', entry.descriptor_size())):
+                self.segments.append((offset, length, kind, entry))
+                offset += length
+
+        self.central_offset = offset
+        for entry in self.entries:
+            length = entry.central_header_size()
+            self.segments.append((offset, length, 'central', entry))
+            offset += length
+        self.central_size = offset - self.central_offset
+
+        self.end_zip64 = (len(self.entries) >= ZIP64_COUNT_LIMIT or self.central_offset >= ZIP64_LIMIT
+                          or self.central_size >= ZIP64_LIMIT)
+        end_size = END_RECORD.size + (END_RECORD64.size + END_LOCATOR64.size if self.end_zip64 else 0)
+        self.segments.append((offset, end_size, 'end', None))
+        self.size = offset + end_size
+
+    @property
+    def etag(self):
+        """Меняется вместе с составом, размерами или датами файлов"""
+        manifest = [(entry.name.decode('utf-8'), entry.size, entry.mtime_ns) for entry in self.entries]
+        return hashlib.sha1(json.dumps(manifest).encode('utf-8')).hexdigest()
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self.end_zip64:
+            end64_offset = self.central_offset + self.central_size
+            records += END_RECORD64.pack(b'PK\x06\x06', END_RECORD64.size - 12, VERSION_MADE_BY, 45, 0, 0,
+                                         count, count, self.central_size, self.central_offset)
+            records += END_LOCATOR64.pack(b'PK\x06\x07', 0, end64_offset, 1)
+        records += END_RECORD.pack(b'PK\x05\x06', 0, 0, min(count, ZIP64_COUNT_LIMIT), min(count, ZIP64_COUNT_LIMIT),
+                                   min(self.central_size, ZIP64_LIMIT), min(self.central_offset, ZIP64_LIMIT), 0)
+        return records
+
+    def _ensure_crc(self, entry):
+        """CRC файла, данные которого в этой выдаче не читались целиком (докачка с середины)"""
+        if entry.crc is None:
+            crc = 0
+            for chunk in self._read(entry, 0, entry.size):
+                crc = zlib.crc32(chunk, crc)
+            entry.crc = crc
+            crc_cache.put(entry.cache_key, crc)
+        return entry.crc
+
+    def _read(self, entry, start, end):
+        """Байты файла [start, end) частями по chunk_size"""
+        with open(entry.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size != entry.size:
+                raise ZipStreamError(f"Файл изменился во время выдачи архива: {entry.path}")
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise ZipStreamError(f"Файл изменился во время выдачи архива: {entry.path}")
+                remaining -= len(chunk)
+                yield chunk
+
+    def _segment_bytes(self, kind, entry, start, end):
+        if kind == 'data':
+            if start == 0 and end == entry.size and entry.crc is None:
+                # Данные читаются целиком - CRC считается попутно
+                crc = 0
+                for chunk in self._read(entry, start, end):
+                    crc = zlib.crc32(chunk, crc)
+                    yield chunk
+                entry.crc = crc
+                crc_cache.put(entry.cache_key, crc)
+            else:
+                yield from self._read(entry, start, end)
+            return
+
+        if kind == 'local':
+            data = entry.local_header()
+        elif kind == 'descriptor':
+            self._ensure_crc(entry)
+            data = entry.descriptor()
+        elif kind == 'central':
+            self._ensure_crc(entry)
+            data = entry.central_header()
+        else:
+            data = self._end_records()
+        yield data[start:end]
+
+    def iter_bytes(self, start=0, end=None):
+        """Байты архива [start, end) частями; без аргументов - весь архив"""
+        end = self.size if end is None else min(end, self.size)
+        for offset, length, kind, entry in self.segments:
+            if offset + length <= start or length == 0:
+                continue
+            if offset >= end:
+                break
+            yield from self._segment_bytes(kind, entry, max(start - offset, 0), min(end - offset, length))